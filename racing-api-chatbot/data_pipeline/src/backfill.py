@@ -0,0 +1,170 @@
+import sys
+import json
+import time
+import argparse
+import threading
+from datetime import date, datetime, timedelta
+from typing import List, Set, Tuple
+
+from sqlalchemy import text
+
+from src.db.bulk_writer import BulkWriter, stage_result
+from src.db.database import DatabaseManager
+from src.db.dimension_cache import DimensionCache
+from src.db.models import ApiSyncLog, Result
+from src.db.statistics import refresh_statistics, touched_entities
+from src.utils.api_client import RaceAPIClient, RACING_API_MAX_CONCURRENCY
+
+# api_sync_log endpoint under which finished day shards are recorded
+BACKFILL_ENDPOINT = "backfill_results"
+
+# Results per page requested from the API
+RESULTS_PAGE_SIZE = 50
+
+# Advisory lock serialising the statistics refresh of concurrent shards
+STATISTICS_LOCK_KEY = 727002
+
+def log_message(message: str):
+    """Helper function to log messages with timestamp"""
+    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {message}", flush=True)
+
+def day_shards(start: date, end: date) -> List[date]:
+    """Every day from start to end, inclusive."""
+    return [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+
+class Backfill:
+    """
+    Load historical results for a date range, one day shard at a time.
+
+    Shards are fetched and written concurrently by a pool of workers that
+    share the API client's rate limiter. Each finished shard is recorded in
+    api_sync_log, so an interrupted backfill resumes where it stopped.
+    Statistics for the trainers, jockeys and horses a shard touched are
+    recomputed in the shard's own transaction, so a shard is only recorded
+    as done once its statistics are too.
+    """
+
+    def __init__(self, workers: int = RACING_API_MAX_CONCURRENCY):
+        log_message("Initializing Backfill...")
+        self.api_client = RaceAPIClient(max_concurrency=workers)
+        self.db_manager = DatabaseManager(max_workers=workers)
+        self.dimensions = None
+        self._lock = threading.Lock()
+        self.totals = {"days": 0, "races": 0, "rows": 0}
+        log_message("Backfill initialized successfully")
+
+    def completed_days(self, start: date, end: date) -> Set[date]:
+        """Day shards in the range that an earlier run already stored."""
+        db = self.db_manager.SessionLocal()
+        try:
+            rows = db.query(ApiSyncLog.parameters).filter(
+                ApiSyncLog.endpoint == BACKFILL_ENDPOINT,
+                ApiSyncLog.status == "success"
+            ).all()
+        finally:
+            db.close()
+        days = {date.fromisoformat(json.loads(parameters)["date"]) for (parameters,) in rows if parameters}
+        return {day for day in days if start <= day <= end}
+
+    def _fetch_day(self, day: date) -> list:
+        """All results for one day, following the API's paging."""
+        results = []
+        skip = 0
+        while True:
+            page = self.api_client.get_results_by_date(day.isoformat(), limit=RESULTS_PAGE_SIZE, skip=skip)
+            batch = page.get("results", [])
+            results.extend(batch)
+            skip += len(batch)
+            if not batch or skip >= page.get("total", 0):
+                return results
+
+    def _ingest_day(self, day: date) -> Tuple[int, int]:
+        """Fetch and store one day shard, returning (races, rows written)."""
+        start_time = datetime.utcnow()
+        results = self._fetch_day(day)
+
+        db = self.db_manager.SessionLocal()
+        try:
+            writer = BulkWriter(db, dimensions=self.dimensions)
+            for result_data in results:
+                stage_result(writer, result_data)
+            touched = touched_entities(writer.staged.get(Result, {}).values())
+            counts = writer.flush()
+            # Held until commit: a shard's refresh then sees the results of
+            # every shard that refreshed before it, so concurrent shards
+            # can't each compute a trainer's figures without the other's runs
+            db.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": STATISTICS_LOCK_KEY})
+            refresh_statistics(db, touched)
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+        rows = sum(counts.values())
+        self.db_manager.log_api_sync(
+            BACKFILL_ENDPOINT, {"date": day.isoformat()}, records_processed=len(results), start_time=start_time
+        )
+        with self._lock:
+            self.totals["days"] += 1
+            self.totals["races"] += len(results)
+            self.totals["rows"] += rows
+            log_message(
+                f"{day}: {len(results)} races, {rows} rows "
+                f"(done {self.totals['days']} days, {self.totals['races']} races)"
+            )
+        return len(results), rows
+
+    def run(self, start: date, end: date, resume: bool = True) -> List[date]:
+        """Backfill every day from start to end, inclusive, and return the days that failed."""
+        shards = day_shards(start, end)
+        if resume:
+            done = self.completed_days(start, end)
+            shards = [day for day in shards if day not in done]
+            log_message(f"Skipping {len(done)} day shards stored by an earlier run")
+        log_message(f"Backfilling {len(shards)} day shards from {start} to {end}...")
+        if not shards:
+            return []
+
+        db = self.db_manager.SessionLocal()
+        try:
+            self.dimensions = DimensionCache.load(db)
+        finally:
+            db.close()
+
+        began = time.monotonic()
+        outcomes = self.api_client.map_concurrent(self._ingest_day, shards)
+        elapsed = max(time.monotonic() - began, 1e-6)
+
+        failed = [day for day, outcome in zip(shards, outcomes) if isinstance(outcome, Exception)]
+        for day, outcome in zip(shards, outcomes):
+            if isinstance(outcome, Exception):
+                log_message(f"Error backfilling {day}: {str(outcome)}")
+
+        log_message(
+            f"Backfill finished in {elapsed:.1f}s: {self.totals['days']} days, "
+            f"{self.totals['races']} races ({self.totals['races'] / elapsed:.2f} races/sec), "
+            f"{self.totals['rows']} rows ({self.totals['rows'] / elapsed:.1f} rows/sec)"
+        )
+        log_message(f"Dimension rows: {self.dimensions.stats()}")
+        if failed:
+            log_message(f"{len(failed)} day shards failed and will be retried by the next run")
+        return failed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Backfill historical results for a date range")
+    parser.add_argument("start", type=date.fromisoformat, help="First day, YYYY-MM-DD")
+    parser.add_argument("end", type=date.fromisoformat, help="Last day, YYYY-MM-DD (inclusive)")
+    parser.add_argument("--workers", type=int, default=RACING_API_MAX_CONCURRENCY, help="Concurrent day shards")
+    parser.add_argument("--no-resume", action="store_true", help="Refetch days an earlier run already stored")
+    args = parser.parse_args()
+
+    try:
+        log_message("Starting backfill script...")
+        failed = Backfill(workers=args.workers).run(args.start, args.end, resume=not args.no_resume)
+    except Exception as e:
+        log_message(f"Fatal error: {str(e)}")
+        sys.exit(1)
+    if failed:
+        sys.exit(1)
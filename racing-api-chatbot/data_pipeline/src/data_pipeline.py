@@ -1,8 +1,15 @@
 import sys
-from datetime import datetime
-from typing import  Generator
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from typing import  Generator, List
 from sqlalchemy import text
-from src.db.database import DatabaseManager
+from src.db.bulk_writer import (
+    BulkWriter, bookmaker_prices, expand_race_odds, stage_course, stage_horse, stage_odds, stage_racecard,
+    stage_result
+)
+from src.db.database import DatabaseManager, content_hash
+from src.db.dimension_cache import DimensionCache
+from src.db.statistics import refresh_statistics, touched_entities
 from src.db.models import (
     Course, Race, Horse, Trainer, Jockey, Owner,
     Runner, Result, Odds, RunnerMedical, RunnerQuote,
@@ -12,6 +19,11 @@ from src.utils.api_client import RaceAPIClient
 
 BATCH_SIZE = 100 
 
+# Pipeline stages in waves. Stages in a wave are independent and run
+# concurrently; a later wave reads the races and runners the first one wrote.
+PIPELINE_STAGES = [["courses", "racecards", "results"], ["odds", "horses"]]
+STAGE_DEPENDENCIES = {"odds": ["racecards"], "horses": ["racecards"]}
+
 def log_message(message: str):
     """Helper function to log messages with timestamp"""
     print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {message}", flush=True)
@@ -25,24 +37,26 @@ class DataPipeline:
     def __init__(self):
         log_message("Initializing DataPipeline...")
         self.api_client = RaceAPIClient()
-        self.db_manager = DatabaseManager()
+        # Every stage of a wave may run api_client.max_concurrency workers at once
+        self.db_manager = DatabaseManager(
+            max_workers=max(len(wave) for wave in PIPELINE_STAGES) * self.api_client.max_concurrency
+        )
+        # Loaded at the start of each run so dimension rows are only written when new or changed
+        self.dimensions = None
+        self.incremental = False
         log_message("Pipeline initialized successfully")
 
-    def _store_courses(self, courses_data: list) -> None:
-        """Store courses data in the database."""
+    def _store_courses(self, courses_data: list) -> int:
+        """Store courses data in the database and return how many were stored."""
         db = self.db_manager.SessionLocal()
         try:
             total_stored = 0
             for batch in batch_generator(courses_data, BATCH_SIZE):
                 try:
+                    writer = BulkWriter(db, dimensions=self.dimensions)
                     for course_data in batch:
-                        course = Course(
-                            course_id=course_data["id"],
-                            course=course_data["course"],
-                            region_code=course_data["region_code"],
-                            region=course_data["region"]
-                        )
-                        db.merge(course)
+                        stage_course(writer, course_data)
+                    writer.flush()
                     db.commit()
                     total_stored += len(batch)
                     log_message(f"Stored batch of {len(batch)} courses (Total: {total_stored})")
@@ -51,229 +65,59 @@ class DataPipeline:
                     log_message(f"Error storing course batch: {str(e)}")
                     continue
             log_message(f"Completed storing {total_stored} courses")
+            return total_stored
         finally:
             db.close()
 
-    def _store_racecards(self, racecards_data: list) -> None:
-        """Store racecards data in the database."""
+    def _store_racecards(self, racecards_data: list) -> int:
+        """Store racecards data in the database and return how many were stored."""
         db = self.db_manager.SessionLocal()
         try:
             total_stored = 0
             for batch in batch_generator(racecards_data, BATCH_SIZE):
                 try:
+                    # Stage the whole batch, then write each table with one
+                    # upsert per chunk instead of a merge per object
+                    writer = BulkWriter(db, dimensions=self.dimensions)
                     for racecard in batch:
-                        # Store course
-                        course = Course(
-                            course_id=racecard["course_id"],
-                            course=racecard["course"],
-                            region_code=racecard["region"],
-                            region=racecard["region"]
-                        )
-                        db.merge(course)
-
-                        # Store race
-                        race = Race(
-                            race_id=racecard["race_id"],
-                            course_id=racecard["course_id"],
-                            date=racecard.get("date"),
-                            off_time=racecard.get("off_time"),
-                            race_name=racecard.get("race_name"),
-                            distance=racecard.get("distance"),
-                            distance_f=racecard.get("distance_f"),
-                            region=racecard.get("region"),
-                            type=racecard.get("type"),
-                            going=racecard.get("going")
-                        )
-                        db.merge(race)
-
-                        # Store runners
-                        for runner_data in racecard.get("runners", []):
-                            # Store horse
-                            horse = Horse(
-                                horse_id=runner_data["horse_id"],
-                                horse=runner_data["horse"]
-                            )
-                            db.merge(horse)
-
-                            # Store trainer
-                            trainer = Trainer(
-                                trainer_id=runner_data["trainer_id"],
-                                trainer=runner_data["trainer"]
-                            )
-                            db.merge(trainer)
-
-                            # Store jockey if available - handle individually to avoid batch insert issues
-                            if "jockey_id" in runner_data and "jockey" in runner_data:
-                                jockey = Jockey(
-                                    jockey_id=runner_data["jockey_id"],
-                                    jockey=runner_data["jockey"]
-                                )
-                                try:
-                                    db.merge(jockey)
-                                    db.commit()  # Commit after each jockey to handle unique constraints
-                                except Exception as e:
-                                    db.rollback()
-                                    log_message(f"Error storing jockey {runner_data['jockey_id']}: {str(e)}")
-                                    continue
-
-                            # Store owner if available
-                            if "owner_id" in runner_data and "owner" in runner_data:
-                                owner = Owner(
-                                    owner_id=runner_data["owner_id"],
-                                    owner=runner_data["owner"]
-                                )
-                                db.merge(owner)
-
-                            # Store runner
-                            runner = Runner(
-                                runner_id=f"{racecard['race_id']}_{runner_data['horse_id']}",
-                                race_id=racecard["race_id"],
-                                horse_id=runner_data["horse_id"],
-                                jockey_id=runner_data.get("jockey_id"),
-                                trainer_id=runner_data["trainer_id"],
-                                owner_id=runner_data.get("owner_id"),
-                                number=runner_data.get("number", "0"),
-                                draw=runner_data.get("draw", "0"),
-                                lbs=runner_data.get("lbs", "0"),
-                                ofr=runner_data.get("ofr", "0"),
-                                rpr=runner_data.get("rpr", "0"),
-                                ts=runner_data.get("ts", "0"),
-                                last_run=runner_data.get("last_run", ""),
-                                form=runner_data.get("form", ""),
-                                comment=runner_data.get("comment", ""),
-                                spotlight=runner_data.get("spotlight", ""),
-                                silk_url=runner_data.get("silk_url", ""),
-                                headgear=runner_data.get("headgear", ""),
-                                headgear_run=runner_data.get("headgear_run", ""),
-                                wind_surgery=runner_data.get("wind_surgery", ""),
-                                wind_surgery_run=runner_data.get("wind_surgery_run", ""),
-                                trainer_rtf=runner_data.get("trainer_rtf", ""),
-                                is_non_runner=runner_data.get("is_non_runner", False)
-                            )
-                            db.merge(runner)
-
+                        stage_racecard(writer, racecard)
+                    counts = writer.flush()
                     db.commit()
                     total_stored += len(batch)
-                    log_message(f"Stored batch of {len(batch)} racecards (Total: {total_stored})")
+                    log_message(f"Stored batch of {len(batch)} racecards (Total: {total_stored}) - rows: {counts}")
                 except Exception as e:
                     db.rollback()
                     log_message(f"Error storing racecard batch: {str(e)}")
                     continue
 
             log_message(f"Completed storing {total_stored} racecards")
+            return total_stored
         finally:
             db.close()
 
-    def _store_results(self, results_data: list) -> None:
-        """Store results data in the database."""
+    def _store_results(self, results_data: list) -> int:
+        """Store results data in the database and return how many were stored."""
         db = self.db_manager.SessionLocal()
         try:
             total_stored = 0
             for batch in batch_generator(results_data, BATCH_SIZE):
                 try:
+                    writer = BulkWriter(db, dimensions=self.dimensions)
                     for result_data in batch:
-                        # Store course if not exists
-                        course = Course(
-                            course_id=result_data["course_id"],
-                            course=result_data["course"],
-                            region_code=result_data["region"],
-                            region=result_data["region"]
-                        )
-                        db.merge(course)
-
-                        # Store race if not exists
-                        race = Race(
-                            race_id=result_data["race_id"],
-                            course_id=result_data["course_id"],
-                            date=result_data.get("date"),
-                            off_time=result_data.get("off"),
-                            race_name=result_data.get("race_name"),
-                            distance=result_data.get("dist"),
-                            distance_f=result_data.get("dist_f"),
-                            region=result_data.get("region"),
-                            type=result_data.get("type"),
-                            going=result_data.get("going")
-                        )
-                        db.merge(race)
-
-                        # Store runners and their results
-                        for runner_data in result_data.get("runners", []):
-                            # Store horse if not exists
-                            horse = Horse(
-                                horse_id=runner_data["horse_id"],
-                                horse=runner_data["horse"]
-                            )
-                            db.merge(horse)
-
-                            # Store jockey if not exists - handle individually to avoid batch insert issues
-                            if "jockey_id" in runner_data and "jockey" in runner_data:
-                                jockey = Jockey(
-                                    jockey_id=runner_data["jockey_id"],
-                                    jockey=runner_data["jockey"]
-                                )
-                                try:
-                                    db.merge(jockey)
-                                    db.commit()  # Commit after each jockey to handle unique constraints
-                                except Exception as e:
-                                    db.rollback()
-                                    log_message(f"Error storing jockey {runner_data['jockey_id']}: {str(e)}")
-                                    continue
-
-                            # Store trainer if not exists
-                            if "trainer_id" in runner_data and "trainer" in runner_data:
-                                trainer = Trainer(
-                                    trainer_id=runner_data["trainer_id"],
-                                    trainer=runner_data["trainer"]
-                                )
-                                db.merge(trainer)
-
-                            # Store owner if not exists
-                            if "owner_id" in runner_data and "owner" in runner_data:
-                                owner = Owner(
-                                    owner_id=runner_data["owner_id"],
-                                    owner=runner_data["owner"]
-                                )
-                                db.merge(owner)
-
-                            # Store result
-                            result = Result(
-                                result_id=f"{result_data['race_id']}_{runner_data['horse_id']}",
-                                race_id=result_data["race_id"],
-                                horse_id=runner_data["horse_id"],
-                                jockey_id=runner_data.get("jockey_id"),
-                                trainer_id=runner_data.get("trainer_id"),
-                                owner_id=runner_data.get("owner_id", "unknown"),
-                                sp=runner_data.get("sp"),
-                                sp_dec=runner_data.get("sp_dec"),
-                                number=runner_data.get("number"),
-                                position=runner_data.get("position"),
-                                draw=runner_data.get("draw"),
-                                btn=runner_data.get("btn"),
-                                ovr_btn=runner_data.get("ovr_btn"),
-                                age=runner_data.get("age"),
-                                sex=runner_data.get("sex"),
-                                weight=runner_data.get("weight"),
-                                weight_lbs=runner_data.get("weight_lbs"),
-                                headgear=runner_data.get("headgear"),
-                                time=runner_data.get("time"),
-                                or_rating=runner_data.get("or"),
-                                rpr=runner_data.get("rpr"),
-                                tsr=runner_data.get("tsr"),
-                                prize=runner_data.get("prize"),
-                                comment=runner_data.get("comment", ""),
-                                silk_url=runner_data.get("silk_url", "")
-                            )
-                            db.merge(result)
-
+                        stage_result(writer, result_data)
+                    touched = touched_entities(writer.staged.get(Result, {}).values())
+                    counts = writer.flush()
+                    counts.update(refresh_statistics(db, touched))
                     db.commit()
                     total_stored += len(batch)
-                    log_message(f"Stored batch of {len(batch)} results (Total: {total_stored})")
+                    log_message(f"Stored batch of {len(batch)} results (Total: {total_stored}) - rows: {counts}")
                 except Exception as e:
                     db.rollback()
                     log_message(f"Error storing results batch: {str(e)}")
                     continue
 
             log_message(f"Completed storing {total_stored} results")
+            return total_stored
         finally:
             db.close()
 
@@ -291,50 +135,36 @@ class DataPipeline:
                 log_message(f"No runners found for race {race_id}, skipping odds storage")
                 return
 
-            # Get odds data for the race
+            # One race-level call prices every runner it covers
             odds_data = self.api_client.get_odds(race_id)
             if not odds_data:
                 log_message(f"No odds data found for race {race_id}")
                 return
+            prices = expand_race_odds(odds_data)
 
-            # Process odds for each runner
-            for runner in runners:
-                horse_id = runner.horse_id
-                # Get specific odds for this horse
+            # Only runners the race payload didn't price need their own call
+            missing = [runner.horse_id for runner in runners if runner.horse_id not in prices]
+            for horse_id in missing:
                 horse_odds = self.api_client.get_odds(race_id, horse_id)
-                if not horse_odds:
+                bookmakers = bookmaker_prices(horse_odds.get("odds")) if horse_odds else {}
+                if not bookmakers:
                     log_message(f"No odds data found for horse {horse_id} in race {race_id}")
                     continue
+                prices[horse_id] = bookmakers
 
-                # Store the odds data
-                for bookmaker, odds_info in horse_odds.get("odds", {}).items():
-                    # Create odds record
-                    odds = Odds(
-                        odds_id=f"{race_id}_{horse_id}_{bookmaker}",
-                        race_id=race_id,
-                        horse_id=horse_id,
-                        runner_id=f"{race_id}_{horse_id}",
-                        bookmaker=bookmaker,
-                        fractional=odds_info.get("fractional", ""),
-                        decimal=odds_info.get("decimal", ""),
-                        ew_places=odds_info.get("ew_places"),
-                        ew_denom=odds_info.get("ew_denom"),
-                        updated=odds_info.get("updated"),
-                        is_current=True
-                    )
-                    
-                    # Set previous odds for this runner/bookmaker as not current
-                    db.query(Odds).filter(
-                        Odds.race_id == race_id,
-                        Odds.horse_id == horse_id,
-                        Odds.bookmaker == bookmaker,
-                        Odds.is_current == True
-                    ).update({"is_current": False})
-                    
-                    db.merge(odds)
+            # Every poll appends a new price row; current_odds reads the latest
+            writer = BulkWriter(db)
+            observed_at = datetime.utcnow()
+            priced_horses = [runner.horse_id for runner in runners if runner.horse_id in prices]
+            for horse_id in priced_horses:
+                stage_odds(writer, race_id, horse_id, prices[horse_id], observed_at)
+            writer.flush()
 
             db.commit()
-            log_message(f"Successfully stored odds for race {race_id}")
+            log_message(
+                f"Successfully stored odds for race {race_id} "
+                f"({len(priced_horses)}/{len(runners)} runners priced, {len(missing)} per-horse calls)"
+            )
             
         except Exception as e:
             db.rollback()
@@ -343,9 +173,181 @@ class DataPipeline:
         finally:
             db.close()
 
-    def run_pipeline(self) -> None:
-        """Run the complete data pipeline."""
-        log_message("Starting data pipeline...")
+    def _sync_stage(self, endpoint: str, items: list, key: str, store, start_time: datetime,
+                    parameters: dict = None) -> bool:
+        """Store a payload's items, record the sync watermark and return whether every item was stored.
+
+        In incremental mode the payload is compared with the last successful
+        sync of the same endpoint and parameters: an identical payload is
+        skipped outright, otherwise only items whose hash changed are
+        written. A stage that fails to store some items doesn't record a
+        watermark, so the next run compares against the last complete one.
+        """
+        payload_hash = content_hash(items)
+        item_hashes = {str(item[key]): content_hash(item) for item in items}
+
+        changed = items
+        if self.incremental:
+            watermark = self.db_manager.get_sync_watermark(endpoint, parameters)
+            if watermark is not None and watermark.content_hash == payload_hash:
+                log_message(f"{endpoint} unchanged since {watermark.end_time}, skipping")
+                self.db_manager.log_api_sync(
+                    endpoint, parameters, records_processed=0, status="unchanged",
+                    start_time=start_time, content_hash=payload_hash
+                )
+                return True
+            previous = (watermark.item_hashes or {}) if watermark is not None else {}
+            changed = [item for item in items if previous.get(str(item[key])) != item_hashes[str(item[key])]]
+            log_message(f"{endpoint}: {len(changed)} of {len(items)} items new or changed")
+
+        stored = store(changed) if changed else 0
+        if stored < len(changed):
+            self.db_manager.log_api_sync(
+                endpoint, parameters, records_processed=stored, status="partial", start_time=start_time,
+                error_message=f"Stored {stored} of {len(changed)} items"
+            )
+            return False
+        else:
+            self.db_manager.log_api_sync(
+                endpoint, parameters, records_processed=stored, start_time=start_time,
+                content_hash=payload_hash, item_hashes=item_hashes
+            )
+            return True
+
+    def _todays_race_ids(self) -> List[str]:
+        db = self.db_manager.SessionLocal()
+        try:
+            rows = db.query(Race.race_id).filter(Race.date == date.today().isoformat()).all()
+            return [race_id for (race_id,) in rows]
+        finally:
+            db.close()
+
+    def _run_items(self, stage: str, items: List[str], store) -> bool:
+        """Store every item of a stage not yet checkpointed by this run, checkpointing each one."""
+        done = self.db_manager.get_checkpoints(self.run_id, stage)
+        todo = [item for item in items if item not in done]
+        log_message(f"{stage}: {len(todo)} of {len(items)} items to do ({len(items) - len(todo)} already done)")
+
+        def store_and_checkpoint(item):
+            store(item)
+            self.db_manager.save_checkpoint(self.run_id, stage, item)
+
+        # Items are independent, so fetch and store them concurrently;
+        # the client's rate limiter keeps us within the API quota
+        outcomes = self.api_client.map_concurrent(store_and_checkpoint, todo)
+        failed = 0
+        for item, outcome in zip(todo, outcomes):
+            if isinstance(outcome, Exception):
+                failed += 1
+                log_message(f"Error in {stage} for {item}: {str(outcome)}")
+        return failed == 0
+
+    def _stage_courses(self) -> bool:
+        stage_start = datetime.utcnow()
+        courses_data = self.api_client.get_courses()
+        if "courses" not in courses_data:
+            return False
+        return self._sync_stage("get_courses", courses_data["courses"], "id", self._store_courses, stage_start)
+
+    def _stage_racecards(self) -> bool:
+        stage_start = datetime.utcnow()
+        racecards_data = self.api_client.get_racecards_standard()
+        if "racecards" not in racecards_data:
+            return False
+        return self._sync_stage(
+            "get_racecards_standard", racecards_data["racecards"], "race_id", self._store_racecards, stage_start
+        )
+
+    def _stage_results(self) -> bool:
+        stage_start = datetime.utcnow()
+        results_data = self.api_client.get_today_results()
+        if "results" not in results_data:
+            return False
+        return self._sync_stage(
+            "get_today_results", results_data["results"], "race_id", self._store_results, stage_start
+        )
+
+    def _stage_odds(self) -> bool:
+        stage_start = datetime.utcnow()
+        self.db_manager.ensure_odds_history_partitions()
+        race_ids = self._todays_race_ids()
+        complete = self._run_items("odds", race_ids, self._store_odds)
+        self.db_manager.log_api_sync(
+            "get_odds", records_processed=len(race_ids), start_time=stage_start,
+            status="success" if complete else "partial"
+        )
+        return complete
+
+    def _stage_horses(self) -> bool:
+        """Fetch details and pedigree for today's runners that only have a name so far."""
+        stage_start = datetime.utcnow()
+        db = self.db_manager.SessionLocal()
+        try:
+            rows = db.query(Runner.horse_id).join(Horse, Horse.horse_id == Runner.horse_id).filter(
+                Runner.race_id.in_(self._todays_race_ids()),
+                Horse.dob.is_(None)
+            ).distinct().all()
+            horse_ids = [horse_id for (horse_id,) in rows]
+        finally:
+            db.close()
+        complete = self._run_items("horses", horse_ids, self._store_horse)
+        self.db_manager.log_api_sync(
+            "get_horse", records_processed=len(horse_ids), start_time=stage_start,
+            status="success" if complete else "partial"
+        )
+        return complete
+
+    def _store_horse(self, horse_id: str) -> None:
+        """Store a horse's details from the horses endpoint."""
+        horse_data = self.api_client.get_horse(horse_id)
+        db = self.db_manager.SessionLocal()
+        try:
+            writer = BulkWriter(db, dimensions=self.dimensions)
+            stage_horse(writer, {"horse_id": horse_id, **horse_data})
+            writer.flush()
+            db.commit()
+        except Exception as e:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _run_stage(self, stage: str) -> bool:
+        """Run one stage and checkpoint it if it finished every item."""
+        log_message(f"Running stage {stage}...")
+        try:
+            complete = getattr(self, f"_stage_{stage}")()
+        except Exception as e:
+            log_message(f"Error in stage {stage}: {str(e)}")
+            return False
+        if complete:
+            self.db_manager.save_checkpoint(self.run_id, stage)
+            log_message(f"Stage {stage} completed")
+        else:
+            log_message(f"Stage {stage} incomplete, the next run will pick it up")
+        return complete
+
+    def run_pipeline(self, incremental: bool = False, resume: bool = True) -> None:
+        """Run the complete data pipeline.
+
+        The pipeline is split into stages (courses, racecards, results, then
+        odds and horses), and a run checkpoints every finished stage and
+        every finished race or horse in Postgres. If a full run crashes, the
+        next one resumes it and only redoes the missing work.
+
+        Args:
+            incremental (bool): Only write courses, racecards and results that
+                changed since the last sync, so the pipeline can run every few
+                minutes. Odds are always refreshed. Incremental runs are
+                short and never resumed.
+            resume (bool): Resume a recent crashed full run instead of starting over.
+        """
+        mode = "incremental" if incremental else "full"
+        self.incremental = incremental
+        # Run and checkpoint tables may be newer than the database
+        self.db_manager.create_missing_tables()
+        self.run_id, resumed = self.db_manager.start_pipeline_run(mode, resume and not incremental)
+        log_message(f"{'Resuming' if resumed else 'Starting'} {mode} data pipeline run {self.run_id}...")
         
         try:
             # Get database session
@@ -354,41 +356,37 @@ class DataPipeline:
                 # Test database connection with proper text() usage
                 db.execute(text("SELECT 1"))
                 log_message("Database connection verified")
-                
-                # Fetch and store courses
-                log_message("Fetching and storing courses...")
-                courses_data = self.api_client.get_courses()
-                if "courses" in courses_data:
-                    self._store_courses(courses_data["courses"])
-                
-                # Fetch and store racecards
-                log_message("Fetching and storing racecards...")
-                racecards_data = self.api_client.get_racecards_standard()
-                if "racecards" in racecards_data:
-                    self._store_racecards(racecards_data["racecards"])
-                    
-                    # Fetch and store odds for each race
-                    log_message("Fetching and storing odds...")
-                    for racecard in racecards_data["racecards"]:
-                        race_id = racecard["race_id"]
-                        try:
-                            self._store_odds(race_id)
-                        except Exception as e:
-                            log_message(f"Error fetching odds for race {race_id}: {str(e)}")
-                            continue
-                
-                # Fetch and store results
-                log_message("Fetching and storing results...")
-                results_data = self.api_client.get_today_results()
-                if "results" in results_data:
-                    self._store_results(results_data["results"])
-                
-                log_message("Data pipeline completed successfully")
-                
+
+                self.dimensions = DimensionCache.load(db)
+                log_message(f"Loaded dimension cache: {self.dimensions.stats()}")
             finally:
                 db.close()
+
+            failed = []
+            for wave in PIPELINE_STAGES:
+                stages = []
+                for stage in wave:
+                    if "" in self.db_manager.get_checkpoints(self.run_id, stage):
+                        log_message(f"Stage {stage} already completed in this run, skipping")
+                    elif any(dependency in failed for dependency in STAGE_DEPENDENCIES.get(stage, [])):
+                        log_message(f"Skipping stage {stage}: a stage it depends on failed")
+                        failed.append(stage)
+                    else:
+                        stages.append(stage)
+
+                with ThreadPoolExecutor(max_workers=max(len(stages), 1)) as executor:
+                    for stage, complete in zip(stages, executor.map(self._run_stage, stages)):
+                        if not complete:
+                            failed.append(stage)
+
+            log_message(f"Dimension rows: {self.dimensions.stats()}")
+            if failed:
+                raise RuntimeError(f"Stages did not complete: {', '.join(failed)}")
+            self.db_manager.finish_pipeline_run(self.run_id)
+            log_message("Data pipeline completed successfully")
             
         except Exception as e:
+            self.db_manager.finish_pipeline_run(self.run_id, "failed", str(e))
             log_message(f"Error in data pipeline: {str(e)}")
             raise
 
@@ -396,7 +394,10 @@ if __name__ == "__main__":
     try:
         log_message("Starting data pipeline script...")
         pipeline = DataPipeline()
-        pipeline.run_pipeline()
+        pipeline.run_pipeline(
+            incremental="--incremental" in sys.argv[1:],
+            resume="--no-resume" not in sys.argv[1:]
+        )
         log_message("Data pipeline completed. Exiting...")
     except Exception as e:
         log_message(f"Fatal error: {str(e)}")
@@ -0,0 +1,497 @@
+import io
+import json
+import uuid
+from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import column, select, table
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from src.db.dimension_cache import DimensionCache
+from src.db.models import (
+    Base, Course, Race, Horse, Trainer, Jockey, Owner, Runner, Result, OddsHistory
+)
+
+# Rows per INSERT ... ON CONFLICT statement
+UPSERT_CHUNK_SIZE = 1000
+
+# Tables with at least this many staged rows are loaded with COPY into a
+# temporary table and merged from there in one statement
+COPY_THRESHOLD = 5000
+
+# Owner of results the API gives no owner for. results.owner_id is NOT NULL
+# and references owners, so this placeholder row is staged alongside them.
+UNKNOWN_OWNER = {"owner_id": "unknown", "owner": "Unknown"}
+
+
+def _copy_value(value: Any) -> str:
+    """Format a value for COPY ... FROM STDIN in Postgres text format."""
+    if value is None:
+        return "\\N"
+    if isinstance(value, bool):
+        return "t" if value else "f"
+    if isinstance(value, (dict, list)):
+        value = json.dumps(value)
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+class BulkWriter:
+    """
+    Stage rows per table and upsert them in bulk.
+
+    Rows are plain dicts of column values keyed by model. Rows with the same
+    primary key are merged while staged, so the last value for each column
+    wins, as with session.merge(). flush() then writes every table in
+    foreign key order with multi-row INSERT ... ON CONFLICT DO UPDATE, or
+    COPY into a temporary table for large tables. Only the columns a row
+    provides are updated on conflict. Models marked __append_only__ never
+    update on conflict; a row that already exists is left as it is. Models
+    with a surrogate primary key name the unique columns to merge and
+    upsert on in __upsert_key__ instead.
+
+    With a DimensionCache, staged course, horse, jockey, trainer and owner
+    rows that already match the database are dropped before the write.
+
+    The writer doesn't commit; the caller owns the transaction.
+
+    Usage:
+        writer = BulkWriter(db)
+        writer.add(Course, {"course_id": "crs_1", "course": "Ascot", ...})
+        writer.flush()
+        db.commit()
+    """
+
+    def __init__(self, db: Session, chunk_size: int = UPSERT_CHUNK_SIZE, copy_threshold: int = COPY_THRESHOLD,
+                 dimensions: Optional[DimensionCache] = None):
+        self.db = db
+        self.dimensions = dimensions
+        self.chunk_size = chunk_size
+        self.copy_threshold = copy_threshold
+        self.staged: Dict[Any, Dict[Tuple, Dict[str, Any]]] = {}
+
+    @staticmethod
+    def _key_columns(model) -> List[str]:
+        return list(getattr(model, "__upsert_key__", None) or [col.name for col in model.__table__.primary_key.columns])
+
+    def add(self, model, row: Dict[str, Any]) -> None:
+        """Stage one row, merging it with any staged row that has the same key."""
+        key = tuple(row.get(name) for name in self._key_columns(model))
+        rows = self.staged.setdefault(model, {})
+        if key in rows:
+            rows[key].update(row)
+        else:
+            rows[key] = dict(row)
+
+    def add_many(self, model, rows: Iterable[Dict[str, Any]]) -> None:
+        """Stage several rows for the same table."""
+        for row in rows:
+            self.add(model, row)
+
+    @property
+    def pending(self) -> int:
+        """Number of rows staged and not yet flushed."""
+        return sum(len(rows) for rows in self.staged.values())
+
+    def flush(self) -> Dict[str, int]:
+        """Write all staged rows, parents before children, and return the row count per table."""
+        counts = {}
+        models = {model.__table__: model for model in self.staged}
+        for sorted_table in Base.metadata.sorted_tables:
+            model = models.get(sorted_table)
+            if model is None:
+                continue
+            # Primary key order gives concurrent writers the same lock order,
+            # so overlapping batches wait for each other instead of deadlocking
+            staged = self.staged.pop(model)
+            rows = [staged[key] for key in sorted(staged, key=lambda key: tuple(str(part) for part in key))]
+            if self.dimensions is not None and model in self.dimensions:
+                rows = self.dimensions.filter(self.db, model, rows)
+            if not rows:
+                continue
+            # COPY writes every column of every row, so it is only used when
+            # the rows agree on which columns they provide
+            same_columns = len({tuple(sorted(row)) for row in rows}) == 1
+            if len(rows) >= self.copy_threshold and same_columns and self._supports_copy():
+                self._copy_upsert(model, rows)
+            else:
+                self._upsert(model, rows)
+            counts[sorted_table.name] = len(rows)
+        return counts
+
+    def _update_columns(self, model, columns: Iterable[str]) -> List[str]:
+        if getattr(model, "__append_only__", False):
+            return []
+        key = {col.name for col in model.__table__.primary_key.columns} | set(self._key_columns(model))
+        return [name for name in columns if name not in key and name != "created_at"]
+
+    def _upsert(self, model, rows: List[Dict[str, Any]]) -> None:
+        # Rows with the same set of columns share one statement
+        groups: Dict[Tuple[str, ...], List[Dict[str, Any]]] = {}
+        for row in rows:
+            groups.setdefault(tuple(sorted(row)), []).append(row)
+
+        target = model.__table__
+        key = self._key_columns(model)
+        for columns, group in groups.items():
+            statement = insert(target)
+            update_columns = self._update_columns(model, columns)
+            if update_columns:
+                set_ = {name: statement.excluded[name] for name in update_columns}
+                if "updated_at" in target.columns and "updated_at" not in set_:
+                    set_["updated_at"] = datetime.utcnow()
+                statement = statement.on_conflict_do_update(index_elements=key, set_=set_)
+            else:
+                statement = statement.on_conflict_do_nothing(index_elements=key)
+
+            for start in range(0, len(group), self.chunk_size):
+                self.db.execute(statement, group[start:start + self.chunk_size])
+
+    def _supports_copy(self) -> bool:
+        return self.db.get_bind().dialect.driver == "psycopg2"
+
+    def _copy_upsert(self, model, rows: List[Dict[str, Any]]) -> None:
+        target = model.__table__
+        key = self._key_columns(model)
+
+        # Every row is written with every provided column, so fill in the
+        # Python-side defaults the ORM would have applied on insert
+        provided = sorted(rows[0])
+        defaults = [
+            (col.name, col.default.arg)
+            for col in target.columns
+            if col.name not in provided and col.default is not None and col.computed is None
+        ]
+        columns = provided + [name for name, _ in defaults]
+        now = datetime.utcnow()
+
+        buffer = io.StringIO()
+        for row in rows:
+            values = [row[name] for name in provided]
+            # Callable defaults are wrapped by SQLAlchemy to take an execution context
+            values += [default(None) if callable(default) else default for _, default in defaults]
+            buffer.write("\t".join(_copy_value(value) for value in values) + "\n")
+        buffer.seek(0)
+
+        staging_name = f"bulk_{target.name}_{uuid.uuid4().hex[:8]}"
+        column_list = ", ".join(f'"{name}"' for name in columns)
+        cursor = self.db.connection().connection.cursor()
+        try:
+            cursor.execute(f"CREATE TEMP TABLE {staging_name} (LIKE {target.name} INCLUDING DEFAULTS) ON COMMIT DROP")
+            cursor.copy_expert(f"COPY {staging_name} ({column_list}) FROM STDIN", buffer)
+        finally:
+            cursor.close()
+
+        staging = table(staging_name, *[column(name) for name in columns])
+        statement = insert(target).from_select(columns, select(*[staging.c[name] for name in columns]))
+        update_columns = self._update_columns(model, provided)
+        if update_columns:
+            set_ = {name: statement.excluded[name] for name in update_columns}
+            if "updated_at" in target.columns and "updated_at" not in set_:
+                set_["updated_at"] = now
+            statement = statement.on_conflict_do_update(index_elements=key, set_=set_)
+        else:
+            statement = statement.on_conflict_do_nothing(index_elements=key)
+        self.db.execute(statement)
+
+
+# Staging helpers for Racing API payloads, shared by every ingestion path
+
+
+def stage_course(writer: BulkWriter, course_data: dict) -> None:
+    """Stage a course from the courses endpoint for a bulk write."""
+    writer.add(Course, {
+        "course_id": course_data["id"],
+        "course": course_data["course"],
+        "region_code": course_data["region_code"],
+        "region": course_data["region"]
+    })
+
+
+def stage_racecard(writer: BulkWriter, racecard: dict) -> None:
+    """Stage a racecard's course, race, people and runners for a bulk write."""
+    # Store course
+    writer.add(Course, {
+        "course_id": racecard["course_id"],
+        "course": racecard["course"],
+        "region_code": racecard["region"],
+        "region": racecard["region"]
+    })
+
+    # Store race
+    writer.add(Race, {
+        "race_id": racecard["race_id"],
+        "course_id": racecard["course_id"],
+        "date": racecard.get("date"),
+        "off_time": racecard.get("off_time"),
+        "off_dt": _timestamp(racecard.get("off_dt")),
+        "race_name": racecard.get("race_name"),
+        "distance": racecard.get("distance"),
+        "distance_f": racecard.get("distance_f"),
+        "region": racecard.get("region"),
+        "type": racecard.get("type"),
+        "going": racecard.get("going")
+    })
+
+    # Store runners
+    for runner_data in racecard.get("runners", []):
+        writer.add(Horse, {
+            "horse_id": runner_data["horse_id"],
+            "horse": runner_data["horse"]
+        })
+        writer.add(Trainer, {
+            "trainer_id": runner_data["trainer_id"],
+            "trainer": runner_data["trainer"]
+        })
+
+        # Store jockey and owner if available
+        if "jockey_id" in runner_data and "jockey" in runner_data:
+            writer.add(Jockey, {
+                "jockey_id": runner_data["jockey_id"],
+                "jockey": runner_data["jockey"]
+            })
+        if "owner_id" in runner_data and "owner" in runner_data:
+            writer.add(Owner, {
+                "owner_id": runner_data["owner_id"],
+                "owner": runner_data["owner"]
+            })
+
+        writer.add(Runner, {
+            "runner_id": f"{racecard['race_id']}_{runner_data['horse_id']}",
+            "race_id": racecard["race_id"],
+            "horse_id": runner_data["horse_id"],
+            "jockey_id": runner_data.get("jockey_id"),
+            "trainer_id": runner_data["trainer_id"],
+            "owner_id": runner_data.get("owner_id"),
+            "number": runner_data.get("number", "0"),
+            "draw": runner_data.get("draw", "0"),
+            "lbs": runner_data.get("lbs", "0"),
+            "ofr": runner_data.get("ofr", "0"),
+            "rpr": runner_data.get("rpr", "0"),
+            "ts": runner_data.get("ts", "0"),
+            "last_run": runner_data.get("last_run", ""),
+            "form": runner_data.get("form", ""),
+            "comment": runner_data.get("comment", ""),
+            "spotlight": runner_data.get("spotlight", ""),
+            "silk_url": runner_data.get("silk_url", ""),
+            "headgear": runner_data.get("headgear", ""),
+            "headgear_run": runner_data.get("headgear_run", ""),
+            "wind_surgery": runner_data.get("wind_surgery", ""),
+            "wind_surgery_run": runner_data.get("wind_surgery_run", ""),
+            "trainer_rtf": runner_data.get("trainer_rtf", ""),
+            "is_non_runner": runner_data.get("is_non_runner", False)
+        })
+
+
+def stage_horse(writer: BulkWriter, horse_data: dict) -> None:
+    """Stage a horse's details and pedigree from the horses endpoint for a bulk write."""
+    writer.add(Horse, {
+        "horse_id": horse_data.get("horse_id") or horse_data["id"],
+        "horse": horse_data.get("horse") or horse_data["name"],
+        **{
+            name: horse_data.get(name)
+            for name in (
+                "dob", "age", "sex", "sex_code", "colour", "region", "breeder",
+                "dam", "dam_id", "dam_region", "sire", "sire_id", "sire_region",
+                "damsire", "damsire_id", "damsire_region"
+            )
+            if name in horse_data
+        }
+    })
+
+
+def stage_result(writer: BulkWriter, result_data: dict) -> None:
+    """Stage a race result's course, race, people and results for a bulk write."""
+    # Store course if not exists
+    writer.add(Course, {
+        "course_id": result_data["course_id"],
+        "course": result_data["course"],
+        "region_code": result_data["region"],
+        "region": result_data["region"]
+    })
+
+    # Store race if not exists
+    writer.add(Race, {
+        "race_id": result_data["race_id"],
+        "course_id": result_data["course_id"],
+        "date": result_data.get("date"),
+        "off_time": result_data.get("off"),
+        "off_dt": _timestamp(result_data.get("off_dt")),
+        "race_name": result_data.get("race_name"),
+        "distance": result_data.get("dist"),
+        "distance_f": result_data.get("dist_f"),
+        "region": result_data.get("region"),
+        "type": result_data.get("type"),
+        "going": result_data.get("going")
+    })
+
+    # Store runners and their results
+    for runner_data in result_data.get("runners", []):
+        writer.add(Horse, {
+            "horse_id": runner_data["horse_id"],
+            "horse": runner_data["horse"]
+        })
+        if "jockey_id" in runner_data and "jockey" in runner_data:
+            writer.add(Jockey, {
+                "jockey_id": runner_data["jockey_id"],
+                "jockey": runner_data["jockey"]
+            })
+        if "trainer_id" in runner_data and "trainer" in runner_data:
+            writer.add(Trainer, {
+                "trainer_id": runner_data["trainer_id"],
+                "trainer": runner_data["trainer"]
+            })
+        if "owner_id" in runner_data and "owner" in runner_data:
+            writer.add(Owner, {
+                "owner_id": runner_data["owner_id"],
+                "owner": runner_data["owner"]
+            })
+
+        stage_result_row(writer, result_data["race_id"], runner_data)
+
+
+def stage_result_row(writer: BulkWriter, race_id: str, runner_data: dict) -> None:
+    """Stage one runner's result, with the placeholder owner if it has none."""
+    row = result_row(race_id, runner_data)
+    if row["owner_id"] == UNKNOWN_OWNER["owner_id"]:
+        writer.add(Owner, UNKNOWN_OWNER)
+    writer.add(Result, row)
+
+
+def result_row(race_id: str, runner_data: dict) -> Dict[str, Any]:
+    """Result columns of one runner of a race."""
+    return {
+        "result_id": f"{race_id}_{runner_data['horse_id']}",
+        "race_id": race_id,
+        "horse_id": runner_data["horse_id"],
+        "jockey_id": runner_data.get("jockey_id"),
+        "trainer_id": runner_data.get("trainer_id"),
+        "owner_id": runner_data.get("owner_id") or UNKNOWN_OWNER["owner_id"],
+        "sp": runner_data.get("sp"),
+        "sp_dec": runner_data.get("sp_dec"),
+        "number": runner_data.get("number"),
+        "position": runner_data.get("position"),
+        "draw": runner_data.get("draw"),
+        "btn": runner_data.get("btn"),
+        "ovr_btn": runner_data.get("ovr_btn"),
+        "age": runner_data.get("age"),
+        "sex": runner_data.get("sex"),
+        "weight": runner_data.get("weight"),
+        "weight_lbs": runner_data.get("weight_lbs"),
+        "headgear": runner_data.get("headgear"),
+        "time": runner_data.get("time"),
+        "or_rating": runner_data.get("or"),
+        "rpr": runner_data.get("rpr"),
+        "tsr": runner_data.get("tsr"),
+        "prize": runner_data.get("prize"),
+        "comment": runner_data.get("comment", ""),
+        "silk_url": runner_data.get("silk_url", "")
+    }
+
+
+def stage_jockey_results(writer: BulkWriter, jockey_data: dict) -> None:
+    """Stage a jockey and their results from the jockey results endpoint for a bulk write."""
+    writer.add(Jockey, {
+        name: jockey_data[name]
+        for name in ("jockey_id", "jockey", "first_name", "middle_name", "last_name", "first_name_initial", "type")
+        if name in jockey_data
+    })
+    for result_data in jockey_data.get("results", []):
+        stage_result_row(writer, result_data["race_id"], {**result_data, "jockey_id": jockey_data["jockey_id"]})
+
+
+def stage_trainer_results(writer: BulkWriter, trainer_data: dict) -> None:
+    """Stage a trainer and their results from the trainer results endpoint for a bulk write."""
+    writer.add(Trainer, {
+        "trainer_id": trainer_data["trainer_id"],
+        "trainer": trainer_data["trainer"],
+        "trainer_location": trainer_data.get("trainer_location", "")
+    })
+    for result_data in trainer_data.get("results", []):
+        stage_result_row(writer, result_data["race_id"], {**result_data, "trainer_id": trainer_data["trainer_id"]})
+
+
+def bookmaker_prices(odds: Any) -> Dict[str, dict]:
+    """
+    Normalise a runner's prices to {bookmaker: price}.
+
+    Prices come either keyed by bookmaker ({"Bet365": {...}}) or as a list
+    of entries that each carry their bookmaker ([{"bookmaker": "Bet365", ...}]).
+    """
+    if isinstance(odds, dict):
+        return {bookmaker: info for bookmaker, info in odds.items() if isinstance(info, dict)}
+    if isinstance(odds, list):
+        return {info["bookmaker"]: info for info in odds if isinstance(info, dict) and info.get("bookmaker")}
+    return {}
+
+
+def expand_race_odds(odds_data: dict) -> Dict[str, Dict[str, dict]]:
+    """
+    Expand a race-level odds response into {horse_id: {bookmaker: price}}.
+
+    Runners the response doesn't mention, or mentions without any prices,
+    are left out so the caller can fall back to the per-horse endpoint.
+    """
+    prices = {}
+    for runner_data in odds_data.get("runners", []) or []:
+        if not isinstance(runner_data, dict) or not runner_data.get("horse_id"):
+            continue
+        bookmakers = bookmaker_prices(runner_data.get("odds"))
+        if bookmakers:
+            prices[runner_data["horse_id"]] = bookmakers
+    return prices
+
+
+def _fraction(value: Any) -> Tuple[Optional[int], Optional[int]]:
+    text = str(value or "").strip().lower()
+    if text in ("evs", "evens", "evn"):
+        return 1, 1
+    numerator, _, denominator = text.partition("/")
+    if numerator.isdigit() and denominator.isdigit():
+        return int(numerator), int(denominator)
+    return None, None
+
+
+def _number(value: Any, cast=Decimal):
+    try:
+        return cast(str(value).strip()) if value not in (None, "") else None
+    except (InvalidOperation, ValueError):
+        return None
+
+
+def _timestamp(value: Any) -> Optional[datetime]:
+    # ISO timestamps, stored as naive UTC like the rest of the schema
+    try:
+        parsed = datetime.fromisoformat(str(value).replace("Z", "+00:00")) if value else None
+    except ValueError:
+        return None
+    if parsed is not None and parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
+
+
+def stage_odds(writer: BulkWriter, race_id: str, horse_id: str, bookmakers: Dict[str, dict],
+               observed_at: Optional[datetime] = None) -> None:
+    """Stage one runner's bookmaker prices as new odds_history rows."""
+    observed_at = observed_at or datetime.utcnow()
+    for bookmaker, odds_info in bookmakers.items():
+        frac_num, frac_den = _fraction(odds_info.get("fractional"))
+        writer.add(OddsHistory, {
+            "race_id": race_id,
+            "horse_id": horse_id,
+            "bookmaker": bookmaker,
+            "observed_at": observed_at,
+            "frac_num": frac_num,
+            "frac_den": frac_den,
+            "decimal": _number(odds_info.get("decimal")),
+            "ew_places": _number(odds_info.get("ew_places"), int),
+            "ew_denom": _number(odds_info.get("ew_denom"), int),
+            "updated": _timestamp(odds_info.get("updated"))
+        })
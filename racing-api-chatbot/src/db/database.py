@@ -1,17 +1,27 @@
 import os
 import json
+import hashlib
 from sqlalchemy import create_engine
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from datetime import datetime, timedelta
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.exc import SQLAlchemyError
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any, List, Set, Tuple
 from sqlalchemy.orm import Session, sessionmaker
+from .bulk_writer import (
+    BulkWriter, bookmaker_prices, expand_race_odds, stage_course, stage_horse, stage_jockey_results, stage_odds,
+    stage_racecard, stage_result, stage_trainer_results
+)
 from .models import (
     get_db_engine, init_db, ChatHistory, APICache,
     Course, Race, Horse, Trainer, Jockey, Owner,
-    Runner, Result, Odds, RunnerMedical, RunnerQuote,
-    ApiSyncLog, TrainerStatistics, JockeyStatistics, HorseStatistics,
-    User, Base
+    Runner, Result, Odds, OddsHistory, RunnerMedical, RunnerQuote,
+    ApiSyncLog, PipelineRun, PipelineCheckpoint, TrainerStatistics, JockeyStatistics, HorseStatistics,
+    User, Base, create_odds_history_partitions
 )
+from .statistics import refresh_statistics, touched_entities
+from .write_behind import WriteBehindQueue
 from langchain_core.messages import ToolMessage
 from sqlalchemy.sql import text
 from urllib.parse import urlparse, urlunparse
@@ -22,8 +32,27 @@ def log_message(message: str):
     print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {message}", flush=True)
 
 
+def content_hash(data: Any) -> str:
+    """Stable SHA-256 of a JSON-serialisable payload, independent of key order."""
+    encoded = json.dumps(data, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+def cache_key(endpoint: str, params_str: str) -> str:
+    """Key of an api_cache row, from its endpoint and canonical params JSON."""
+    return hashlib.sha256(f"{endpoint}\n{params_str}".encode("utf-8")).hexdigest()
+
+# Expired api_cache rows deleted per statement by the sweeper
+API_CACHE_SWEEP_BATCH = int(os.getenv("API_CACHE_SWEEP_BATCH", "5000"))
+
+# A crashed pipeline run older than this is abandoned rather than resumed
+PIPELINE_RESUME_WINDOW_HOURS = float(os.getenv("PIPELINE_RESUME_WINDOW_HOURS", "6"))
+
 class DatabaseManager:
-    def __init__(self):
+    def __init__(self, max_workers: int = 0):
+        """
+        max_workers is how many threads of a batch job may each hold a
+        session at once; the sync pool grows to fit them.
+        """
         # Get the database URL from environment
         db_url = os.getenv("DATABASE_URL")
         
@@ -63,7 +92,7 @@ class DatabaseManager:
             self.database_url,
             connect_args=connect_args,
             pool_size=5,
-            max_overflow=10,
+            max_overflow=max(10, max_workers),
             pool_timeout=120,
             pool_recycle=1800,
             pool_pre_ping=True
@@ -89,6 +118,50 @@ class DatabaseManager:
             expire_on_commit=False
         )
 
+        # Normalisation of cached API responses runs off the request path
+        self.write_behind = WriteBehindQueue(self)
+
+        # The async engine is created lazily so sync-only consumers such as the
+        # data pipeline don't need the asyncpg driver installed
+        self._async_engine = None
+        self._async_session_factory = None
+
+    @property
+    def async_engine(self) -> AsyncEngine:
+        """Get the asyncpg-backed engine used by the async request path."""
+        if self._async_engine is None:
+            async_url = make_url(self.database_url).set(drivername="postgresql+asyncpg")
+            print("Creating async database engine...")
+            self._async_engine = create_async_engine(
+                async_url,
+                connect_args={
+                    'timeout': 120,  # 120 seconds timeout for initial connection
+                    'server_settings': {
+                        'application_name': 'racing-api-chatbot',
+                        'statement_timeout': '300000',  # 5 minutes
+                        'lock_timeout': '300000',  # 5 minutes
+                        'idle_in_transaction_session_timeout': '300000',  # 5 minutes
+                    },
+                },
+                pool_size=10,
+                max_overflow=20,
+                pool_timeout=120,
+                pool_recycle=1800,
+                pool_pre_ping=True
+            )
+        return self._async_engine
+
+    @property
+    def AsyncSessionLocal(self) -> async_sessionmaker:
+        """Get the async session factory bound to the async engine."""
+        if self._async_session_factory is None:
+            self._async_session_factory = async_sessionmaker(
+                bind=self.async_engine,
+                autoflush=False,
+                expire_on_commit=False
+            )
+        return self._async_session_factory
+
     def init_db(self, session: Optional[Session] = None):
         """Initialize the database by dropping all tables and recreating them."""
         try:
@@ -139,6 +212,10 @@ class DatabaseManager:
             print(f"Database initialization failed: {str(e)}")
             raise
 
+    def create_missing_tables(self) -> None:
+        """Create any tables that don't exist yet, leaving existing tables and data alone."""
+        Base.metadata.create_all(bind=self.engine, checkfirst=True)
+
     def get_db(self):
         """Get a database session with proper transaction handling."""
         db = self.SessionLocal()
@@ -154,6 +231,15 @@ class DatabaseManager:
         finally:
             db.close()
 
+    async def get_async_db(self):
+        """Get an async database session with proper transaction handling."""
+        async with self.AsyncSessionLocal() as db:
+            try:
+                yield db
+            except Exception as e:
+                await db.rollback()
+                raise e
+
     def store_api_response(self, db: Session, endpoint: str, response_data: Dict[str, Any]) -> None:
         """Store API response data in normalized database tables."""
         try:
@@ -178,7 +264,7 @@ class DatabaseManager:
                         courses_data = response_data.get("courses", [])
                         print(f"Found {len(courses_data)} courses to process")
                         self._store_courses(db, courses_data)
-                    elif endpoint == "get_horse_results":
+                    elif endpoint == "get_horse_results" or endpoint == "get_today_results":
                         print("Processing horse results data...")
                         self._store_results(db, response_data)
                     elif endpoint == "get_odds":
@@ -210,93 +296,66 @@ class DatabaseManager:
                         raise
             
             # Log the sync status in a separate transaction
-            try:
-                sync_db = self.SessionLocal()
-                try:
-                    sync_log = ApiSyncLog(
-                        endpoint=endpoint,
-                        parameters=json.dumps(response_data.get("parameters", {})),
-                        status="success",
-                        start_time=datetime.utcnow(),
-                        end_time=datetime.utcnow(),
-                        records_processed=len(response_data)
-                    )
-                    sync_db.add(sync_log)
-                    sync_db.commit()
-                    print("API sync logged successfully")
-                finally:
-                    sync_db.close()
-            except Exception as e:
-                print(f"Error logging API sync: {str(e)}")
-                # Don't raise this error as the main data processing was successful
+            self.log_api_sync(
+                endpoint=endpoint,
+                parameters=response_data.get("parameters", {}),
+                records_processed=len(response_data)
+            )
             
         except Exception as e:
             print(f"Error storing API response: {str(e)}")
             raise
 
+    def log_api_sync(self, endpoint: str, parameters: Optional[Dict[str, Any]] = None, records_processed: int = 0,
+                     status: str = "success", start_time: Optional[datetime] = None,
+                     error_message: Optional[str] = None, content_hash: Optional[str] = None,
+                     item_hashes: Optional[Dict[str, str]] = None) -> None:
+        """Record a sync in api_sync_log using its own transaction.
+
+        Each new row other than an "unchanged" one also acts as a
+        data-freshness version for the answer cache. Successful rows with a
+        content_hash are the watermarks read by get_sync_watermark().
+        """
+        try:
+            sync_db = self.SessionLocal()
+            try:
+                end_time = datetime.utcnow()
+                start_time = start_time or end_time
+                sync_log = ApiSyncLog(
+                    endpoint=endpoint,
+                    parameters=json.dumps(parameters or {}, sort_keys=True),
+                    status=status,
+                    error_message=error_message,
+                    start_time=start_time,
+                    end_time=end_time,
+                    duration_seconds=int((end_time - start_time).total_seconds()),
+                    records_processed=records_processed,
+                    content_hash=content_hash,
+                    item_hashes=item_hashes
+                )
+                sync_db.add(sync_log)
+                sync_db.commit()
+                print("API sync logged successfully")
+            finally:
+                sync_db.close()
+        except Exception as e:
+            print(f"Error logging API sync: {str(e)}")
+            # Don't raise this error as the main data processing was successful
+
     def _store_courses(self, db: Session, courses_data: List[Dict]) -> None:
-        """Store courses data in batches."""
+        """Store courses data with one bulk upsert."""
         try:
             if not courses_data:
                 print("No courses data to process")
                 return
                 
             print(f"\nStoring {len(courses_data)} courses...")
-            batch_size = 25  # Further reduced batch size
-            total_batches = (len(courses_data) + batch_size - 1) // batch_size
-            
-            for batch_num in range(total_batches):
-                start_idx = batch_num * batch_size
-                end_idx = min((batch_num + 1) * batch_size, len(courses_data))
-                batch = courses_data[start_idx:end_idx]
-                
-                print(f"\nProcessing batch {batch_num + 1}/{total_batches} ({len(batch)} courses)...")
-                
-                # Create course objects for the batch
-                courses = []
-                for course_data in batch:
-                    try:
-                        course = Course(
-                            course_id=course_data["id"],  # Changed from "course_id" to "id" based on sample data
-                            course=course_data["course"],
-                            region_code=course_data["region_code"],
-                            region=course_data["region"]
-                        )
-                        courses.append(course)
-                        print(f"Prepared course: {course.course} (ID: {course.course_id})")
-                    except Exception as e:
-                        print(f"Error preparing course data: {str(e)}")
-                        print(f"Course data: {course_data}")
-                        raise
-                
-                # Bulk insert the batch with retry
-                max_retries = 5  # Increased retry count
-                retry_count = 0
-                while retry_count < max_retries:
-                    try:
-                        db.bulk_save_objects(courses)
-                        db.commit()
-                        print(f"Successfully stored batch {batch_num + 1}")
-                        break
-                    except Exception as e:
-                        retry_count += 1
-                        print(f"Error storing batch {batch_num + 1} (attempt {retry_count}/{max_retries}): {str(e)}")
-                        if retry_count < max_retries:
-                            print("Retrying after 10 seconds...")
-                            import time
-                            time.sleep(10)  # Increased delay between retries
-                            db.rollback()
-                        else:
-                            raise
-                
-                # Add a small delay between batches
-                import time
-                time.sleep(2)
-            
-            # Verify the data was stored
-            print("\nVerifying stored courses...")
-            stored_courses = db.query(Course).all()
-            print(f"Total courses in database: {len(stored_courses)}")
+            writer = BulkWriter(db)
+            for course_data in courses_data:
+                stage_course(writer, course_data)
+            writer.flush()
+            db.commit()
+            print(f"Successfully stored {len(courses_data)} courses")
             
         except Exception as e:
             print(f"Error storing courses: {str(e)}")
@@ -304,109 +363,38 @@ class DatabaseManager:
             raise
 
     def _store_racecards(self, db: Session, racecards_data: List[Dict]) -> None:
-        """Store racecards with proper jockey handling."""
+        """Store racecards, their races, people and runners with bulk upserts."""
         try:
+            writer = BulkWriter(db)
             for racecard in racecards_data:
-                # Store race data
-                race = Race(
-                    race_id=racecard["race_id"],
-                    course_id=racecard["course_id"],
-                    race_name=racecard.get("race_name"),
-                    race_type=racecard.get("race_type"),
-                    race_class=racecard.get("race_class"),
-                    race_distance=racecard.get("race_distance"),
-                    race_time=racecard.get("race_time"),
-                    created_at=datetime.utcnow(),
-                    updated_at=datetime.utcnow()
-                )
-                db.add(race)
-                db.flush()
-
-                # Store runners
-                for runner in racecard.get("runners", []):
-                    # Store jockey with unique constraint handling
-                    if "jockey" in runner:
-                        jockey = self._store_jockey(db, runner["jockey"])
-                        jockey_id = jockey.jockey_id
-                    else:
-                        jockey_id = None
-
-                    # Create runner
-                    runner_obj = Runner(
-                        runner_id=runner["runner_id"],
-                        race_id=race.race_id,
-                        horse_id=runner.get("horse_id"),
-                        jockey_id=jockey_id,
-                        trainer_id=runner.get("trainer_id"),
-                        owner_id=runner.get("owner_id"),
-                        created_at=datetime.utcnow(),
-                        updated_at=datetime.utcnow()
-                    )
-                    db.add(runner_obj)
-                    db.flush()
-
+                stage_racecard(writer, racecard)
+            counts = writer.flush()
             db.commit()
+            print(f"Stored {len(racecards_data)} racecards - rows: {counts}")
         except SQLAlchemyError as e:
             db.rollback()
             print(f"Error storing racecards: {str(e)}")
             raise
 
-    def _store_results(self, db: Session, results_data: List[Dict]) -> None:
-        """Store results with proper jockey handling."""
+    def _store_results(self, db: Session, response_data: Dict) -> None:
+        """Store race results, with their races and people, with bulk upserts, and refresh their statistics."""
         try:
-            for result in results_data:
-                # Store race result
-                race_result = Result(
-                    race_id=result["race_id"],
-                    result_status=result.get("result_status"),
-                    created_at=datetime.utcnow(),
-                    updated_at=datetime.utcnow()
-                )
-                db.add(race_result)
-                db.flush()
-
-                # Store runners
-                for runner in result.get("runners", []):
-                    # Store jockey with unique constraint handling
-                    if "jockey" in runner:
-                        jockey = self._store_jockey(db, runner["jockey"])
-                        jockey_id = jockey.jockey_id
-                    else:
-                        jockey_id = None
-
-                    # Update runner with result
-                    runner_obj = db.query(Runner).filter(
-                        Runner.runner_id == runner["runner_id"]
-                    ).first()
-
-                    if runner_obj:
-                        runner_obj.finishing_position = runner.get("finishing_position")
-                        runner_obj.distance_beaten = runner.get("distance_beaten")
-                        runner_obj.updated_at = datetime.utcnow()
-                    else:
-                        runner_obj = Runner(
-                            runner_id=runner["runner_id"],
-                            race_id=result["race_id"],
-                            horse_id=runner.get("horse_id"),
-                            jockey_id=jockey_id,
-                            trainer_id=runner.get("trainer_id"),
-                            owner_id=runner.get("owner_id"),
-                            finishing_position=runner.get("finishing_position"),
-                            distance_beaten=runner.get("distance_beaten"),
-                            created_at=datetime.utcnow(),
-                            updated_at=datetime.utcnow()
-                        )
-                        db.add(runner_obj)
-                    db.flush()
-
+            results_data = response_data.get("results", [])
+            writer = BulkWriter(db)
+            for result_data in results_data:
+                stage_result(writer, result_data)
+            touched = touched_entities(writer.staged.get(Result, {}).values())
+            counts = writer.flush()
+            counts.update(refresh_statistics(db, touched))
             db.commit()
+            print(f"Stored {len(results_data)} results - rows: {counts}")
         except SQLAlchemyError as e:
             db.rollback()
             print(f"Error storing results: {str(e)}")
             raise
 
     def _store_odds(self, db: Session, odds_data: Dict) -> None:
-        """Store odds data in the database.
+        """Append odds data to the odds history.
         
         Args:
             db (Session): Database session
@@ -424,46 +412,128 @@ class DatabaseManager:
                         }
                     }
                 }
+
+            A race-level response, {"race_id": str, "runners": [{"horse_id": str,
+            "odds": ...}]}, is also accepted and stored for every runner at once.
         """
         try:
             race_id = odds_data["race_id"]
-            horse_id = odds_data["horse_id"]
-            runner_id = f"{race_id}_{horse_id}"
-            
-            for bookmaker, odds_info in odds_data.get("odds", {}).items():
-                # Create odds record
-                odds = Odds(
-                    odds_id=f"{runner_id}_{bookmaker}",
-                    race_id=race_id,
-                    horse_id=horse_id,
-                    runner_id=runner_id,
-                    bookmaker=bookmaker,
-                    fractional=odds_info.get("fractional", ""),
-                    decimal=odds_info.get("decimal", ""),
-                    ew_places=odds_info.get("ew_places"),
-                    ew_denom=odds_info.get("ew_denom"),
-                    updated=odds_info.get("updated"),
-                    is_current=True
-                )
-                
-                # Set previous odds for this runner/bookmaker as not current
-                db.query(Odds).filter(
-                    Odds.race_id == race_id,
-                    Odds.horse_id == horse_id,
-                    Odds.bookmaker == bookmaker,
-                    Odds.is_current == True
-                ).update({"is_current": False})
-                
-                db.merge(odds)
-            
+            if "runners" in odds_data:
+                prices = expand_race_odds(odds_data)
+            else:
+                prices = {odds_data["horse_id"]: bookmaker_prices(odds_data.get("odds"))}
+            prices = {horse_id: bookmakers for horse_id, bookmakers in prices.items() if bookmakers}
+            if not prices:
+                log_message(f"No odds to store for race {race_id}")
+                return
+
+            writer = BulkWriter(db)
+            observed_at = datetime.utcnow()
+            for horse_id, bookmakers in prices.items():
+                stage_odds(writer, race_id, horse_id, bookmakers, observed_at)
+            writer.flush()
+
             db.commit()
-            log_message(f"Stored odds for race {race_id}, horse {horse_id}")
+            log_message(f"Stored odds for race {race_id}, {len(prices)} runners")
             
         except Exception as e:
             db.rollback()
             log_message(f"Error storing odds: {str(e)}")
             raise
 
+    def get_sync_watermark(self, endpoint: str, parameters: Optional[Dict[str, Any]] = None) -> Optional[ApiSyncLog]:
+        """Get the latest successful, hashed sync of an endpoint with these parameters.
+        
+        Args:
+            endpoint (str): API endpoint name, as passed to log_api_sync
+            parameters (Dict, optional): Request parameters the sync was made with
+            
+        Returns:
+            Optional[ApiSyncLog]: The watermark row, or None if the endpoint was never synced
+        """
+        db = self.SessionLocal()
+        try:
+            return db.query(ApiSyncLog).filter(
+                ApiSyncLog.endpoint == endpoint,
+                ApiSyncLog.status == "success",
+                ApiSyncLog.parameters == json.dumps(parameters or {}, sort_keys=True),
+                ApiSyncLog.content_hash.isnot(None)
+            ).order_by(ApiSyncLog.id.desc()).first()
+        finally:
+            db.close()
+
+    def start_pipeline_run(self, mode: str, resume: bool = True) -> Tuple[int, bool]:
+        """Start a pipeline run, or pick up a recent crashed run of the same mode.
+        
+        Only a run still marked "running" (its process died before finishing
+        it) started in the last PIPELINE_RESUME_WINDOW_HOURS is resumed. A
+        run that ended "failed" is never resumed, so its error is retried
+        from scratch rather than skipped over.
+        
+        Args:
+            mode (str): Pipeline mode, e.g. "full" or "incremental"
+            resume (bool): Whether a crashed run may be resumed
+            
+        Returns:
+            Tuple[int, bool]: The run id and whether it is a resumed run
+        """
+        db = self.SessionLocal()
+        try:
+            run = None
+            if resume:
+                since = datetime.utcnow() - timedelta(hours=PIPELINE_RESUME_WINDOW_HOURS)
+                run = db.query(PipelineRun).filter(
+                    PipelineRun.mode == mode,
+                    PipelineRun.status == "running",
+                    PipelineRun.started_at >= since
+                ).order_by(PipelineRun.id.desc()).first()
+            resumed = run is not None
+            if run is None:
+                run = PipelineRun(mode=mode)
+                db.add(run)
+            run.status = "running"
+            run.error_message = None
+            db.commit()
+            return run.id, resumed
+        finally:
+            db.close()
+
+    def finish_pipeline_run(self, run_id: int, status: str = "completed", error_message: Optional[str] = None) -> None:
+        """Mark a pipeline run as completed or failed."""
+        db = self.SessionLocal()
+        try:
+            db.query(PipelineRun).filter(PipelineRun.id == run_id).update({
+                "status": status,
+                "error_message": error_message,
+                "finished_at": datetime.utcnow()
+            })
+            db.commit()
+        finally:
+            db.close()
+
+    def get_checkpoints(self, run_id: int, stage: str) -> Set[str]:
+        """Get the item keys of a stage a run has finished ('' means the whole stage)."""
+        db = self.SessionLocal()
+        try:
+            rows = db.query(PipelineCheckpoint.item_key).filter(
+                PipelineCheckpoint.run_id == run_id,
+                PipelineCheckpoint.stage == stage
+            ).all()
+            return {item_key for (item_key,) in rows}
+        finally:
+            db.close()
+
+    def save_checkpoint(self, run_id: int, stage: str, item_key: str = "", records_processed: int = 0) -> None:
+        """Record that a run finished a stage, or one item of it, in its own transaction."""
+        db = self.SessionLocal()
+        try:
+            db.execute(pg_insert(PipelineCheckpoint).values(
+                run_id=run_id, stage=stage, item_key=item_key, records_processed=records_processed
+            ).on_conflict_do_nothing())
+            db.commit()
+        finally:
+            db.close()
+
     def get_current_odds_by_race(self, db: Session, race_id: str) -> List[Odds]:
         """Get current odds for all runners in a race.
         
@@ -474,10 +544,7 @@ class DatabaseManager:
         Returns:
             List[Odds]: List of current odds for all runners in the race
         """
-        return db.query(Odds).filter(
-            Odds.race_id == race_id,
-            Odds.is_current == True
-        ).all()
+        return db.query(Odds).filter(Odds.race_id == race_id).all()
 
     def get_current_odds_by_runner(self, db: Session, runner_id: str) -> List[Odds]:
         """Get current odds for a specific runner.
@@ -489,74 +556,73 @@ class DatabaseManager:
         Returns:
             List[Odds]: List of current odds for the runner
         """
+        runner = db.get(Runner, runner_id)
+        if runner is None:
+            return []
+        # Filter on the view's DISTINCT ON columns so the filter reaches the index
         return db.query(Odds).filter(
-            Odds.runner_id == runner_id,
-            Odds.is_current == True
+            Odds.race_id == runner.race_id,
+            Odds.horse_id == runner.horse_id
         ).all()
 
-    def get_odds_history(self, db: Session, runner_id: str, bookmaker: str = None) -> List[Odds]:
+    def get_odds_history(self, db: Session, runner_id: str, bookmaker: str = None,
+                         since: Optional[datetime] = None, until: Optional[datetime] = None) -> List[OddsHistory]:
         """Get odds history for a runner.
         
         Args:
             db (Session): Database session
             runner_id (str): Runner ID (format: race_id_horse_id)
             bookmaker (str, optional): Filter by specific bookmaker
+            since (datetime, optional): Only prices observed at or after this time
+            until (datetime, optional): Only prices observed before this time
             
         Returns:
-            List[Odds]: List of odds history for the runner
+            List[OddsHistory]: Prices observed for the runner, newest first
         """
-        query = db.query(Odds).filter(Odds.runner_id == runner_id)
+        runner = db.get(Runner, runner_id)
+        if runner is None:
+            return []
+        query = db.query(OddsHistory).filter(
+            OddsHistory.race_id == runner.race_id,
+            OddsHistory.horse_id == runner.horse_id
+        )
         if bookmaker:
-            query = query.filter(Odds.bookmaker == bookmaker)
-        return query.order_by(Odds.created_at.desc()).all()
+            query = query.filter(OddsHistory.bookmaker == bookmaker)
+        if since:
+            query = query.filter(OddsHistory.observed_at >= since)
+        if until:
+            query = query.filter(OddsHistory.observed_at < until)
+        return query.order_by(OddsHistory.observed_at.desc()).all()
+
+    def ensure_odds_history_partitions(self) -> None:
+        """Create the odds_history partitions for this month and the next few, if missing."""
+        with self.engine.begin() as conn:
+            create_odds_history_partitions(conn)
 
     def _store_horse(self, db: Session, horse_data: Dict) -> None:
-        """Store detailed horse data."""
-        horse = Horse(
-            horse_id=horse_data["horse_id"],
-            horse=horse_data["horse"],
-            dob=horse_data.get("dob"),
-            age=horse_data.get("age"),
-            sex=horse_data.get("sex"),
-            sex_code=horse_data.get("sex_code"),
-            colour=horse_data.get("colour"),
-            region=horse_data.get("region"),
-            breeder=horse_data.get("breeder"),
-            dam=horse_data.get("dam"),
-            dam_id=horse_data.get("dam_id"),
-            dam_region=horse_data.get("dam_region", ""),
-            sire=horse_data.get("sire"),
-            sire_id=horse_data.get("sire_id"),
-            sire_region=horse_data.get("sire_region", ""),
-            damsire=horse_data.get("damsire"),
-            damsire_id=horse_data.get("damsire_id"),
-            damsire_region=horse_data.get("damsire_region", "")
-        )
-        db.merge(horse)
-        
-        # Store medical history if available
-        for medical in horse_data.get("medical_history", []):
-            medical_record = RunnerMedical(
-                horse_id=horse_data["horse_id"],
-                date=medical.get("date"),
-                type=medical.get("type")
-            )
-            db.add(medical_record)
-            
-        # Store quotes if available
-        for quote in horse_data.get("quotes", []):
-            quote_record = RunnerQuote(
-                horse_id=horse_data["horse_id"],
-                date=quote.get("date"),
-                race=quote.get("race"),
-                course=quote.get("course"),
-                course_id=quote.get("course_id"),
-                distance_f=quote.get("distance_f"),
-                distance_y=quote.get("distance_y"),
-                quote=quote.get("quote")
-            )
-            db.add(quote_record)
-            
+        """Store detailed horse data with a bulk upsert, and append its medical history and quotes."""
+        writer = BulkWriter(db)
+        stage_horse(writer, {
+            "dam_region": "", "sire_region": "", "damsire_region": "", **horse_data
+        })
+        writer.flush()
+
+        # Medical records and quotes have no natural key to upsert on, so
+        # each one is appended; all of them go in one INSERT per table
+        medical_rows = [
+            {"horse_id": horse_data["horse_id"], "date": medical.get("date"), "type": medical.get("type")}
+            for medical in horse_data.get("medical_history", [])
+        ]
+        if medical_rows:
+            db.execute(pg_insert(RunnerMedical), medical_rows)
+        quote_columns = ("date", "race", "course", "course_id", "distance_f", "distance_y", "quote")
+        quote_rows = [
+            {"horse_id": horse_data["horse_id"], **{name: quote.get(name) for name in quote_columns}}
+            for quote in horse_data.get("quotes", [])
+        ]
+        if quote_rows:
+            db.execute(pg_insert(RunnerQuote), quote_rows)
+
         db.commit()
 
     def filter_api_response(self, db: Session, response_data: Dict[str, Any], filters: Dict[str, Any], max_results: int = 5) -> Dict[str, Any]:
@@ -613,43 +679,64 @@ class DatabaseManager:
         """Get a cached API response if available and not expired."""
         try:
             params_str = json.dumps(params, sort_keys=True) if params else "{}"
-            cache_entry = db.query(APICache).filter(
-                APICache.endpoint == endpoint,
-                APICache.params == params_str,
+            response_data = db.query(APICache.response_data).filter(
+                APICache.cache_key == cache_key(endpoint, params_str),
                 APICache.expires_at > datetime.utcnow()
-            ).first()
-            
-            if cache_entry:
-                return json.loads(cache_entry.response_data)
-            return None
+            ).scalar()
+            return response_data
         except SQLAlchemyError as e:
             db.rollback()
             raise e
 
-    def store_cache_entry(self, db: Session, endpoint: str, params: dict, response_data: dict, ttl_hours: int = 24):
-        """Store an API response in the cache."""
+    def store_cache_entry(self, db: Session, endpoint: str, params: dict, response_data: dict, ttl_hours: float = 24,
+                          normalize: bool = True):
+        """Store an API response in the cache, replacing any entry for the same endpoint and params.
+
+        With normalize=True the response is also queued for the normalised
+        tables, which a write-behind worker fills after this returns. Pass
+        normalize=False for responses that were built from the normalised
+        tables in the first place.
+        """
         try:
-            # First store the normalized data
-            self.store_api_response(db, endpoint, response_data)
+            if normalize:
+                self.write_behind.submit(endpoint, response_data)
             
-            # Then store in cache
             params_str = json.dumps(params, sort_keys=True) if params else "{}"
-            expires_at = datetime.utcnow() + timedelta(hours=ttl_hours)
-            
-            cache_entry = APICache(
+            now = datetime.utcnow()
+            statement = pg_insert(APICache).values(
+                cache_key=cache_key(endpoint, params_str),
                 endpoint=endpoint,
                 params=params_str,
-                response_data=json.dumps(response_data),
-                expires_at=expires_at
+                response_data=response_data,
+                created_at=now,
+                expires_at=now + timedelta(hours=ttl_hours)
             )
-            
-            db.add(cache_entry)
+            db.execute(statement.on_conflict_do_update(
+                index_elements=[APICache.cache_key],
+                set_={
+                    "response_data": statement.excluded.response_data,
+                    "created_at": statement.excluded.created_at,
+                    "expires_at": statement.excluded.expires_at,
+                }
+            ))
             db.commit()
-            return cache_entry
         except SQLAlchemyError as e:
             db.rollback()
             raise e
 
+    def purge_expired_cache(self, batch_size: int = API_CACHE_SWEEP_BATCH) -> int:
+        """Delete expired api_cache rows in batches, returning how many were removed."""
+        removed = 0
+        while True:
+            with self.engine.begin() as conn:
+                deleted = conn.execute(text(
+                    "DELETE FROM api_cache WHERE id IN ("
+                    "SELECT id FROM api_cache WHERE expires_at <= :now LIMIT :batch_size)"
+                ), {"now": datetime.utcnow(), "batch_size": batch_size}).rowcount
+            removed += deleted
+            if deleted < batch_size:
+                return removed
+
     def _serialize_response(self, response: Any) -> Dict[str, Any]:
         if isinstance(response, ToolMessage):
             try:
@@ -717,6 +804,26 @@ class DatabaseManager:
             db.rollback()
             raise e
 
+    async def asave_chat_history(self, db: AsyncSession, thread_id: str, user_key: str, query: str, response: Any) -> ChatHistory:
+        """Save chat history to the database using an async session."""
+        try:
+            serialized_response = self._serialize_response(response)
+
+            chat_history = ChatHistory(
+                thread_id=thread_id,
+                user_key=user_key,
+                query=query,
+                response=serialized_response
+            )
+
+            db.add(chat_history)
+            await db.commit()
+            await db.refresh(chat_history)
+            return chat_history
+        except SQLAlchemyError as e:
+            await db.rollback()
+            raise e
+
     def get_chat_history(self, db: Session, thread_id: Optional[str] = None, user_key: Optional[str] = None, limit: int = 10) -> list[ChatHistory]:
         """Get chat history from the database."""
         query = db.query(ChatHistory)
@@ -730,116 +837,33 @@ class DatabaseManager:
         """Get all runners for a specific race."""
         return db.query(Runner).filter(Runner.race_id == race_id).all()
 
-    def _store_jockey(self, db: Session, jockey_data: Dict) -> None:
-        """Store a jockey with unique constraint handling."""
-        try:
-            jockey = db.query(Jockey).filter(Jockey.jockey_id == jockey_data["jockey_id"]).first()
-            if not jockey:
-                jockey = Jockey(
-                    jockey_id=jockey_data["jockey_id"],
-                    jockey=jockey_data.get("jockey"),
-                    first_name=jockey_data.get("first_name"),
-                    middle_name=jockey_data.get("middle_name"),
-                    last_name=jockey_data.get("last_name"),
-                    first_name_initial=jockey_data.get("first_name_initial"),
-                    type=jockey_data.get("type"),
-                    created_at=datetime.utcnow(),
-                    updated_at=datetime.utcnow()
-                )
-                db.add(jockey)
-                db.flush()
-            return jockey
-        except SQLAlchemyError as e:
-            db.rollback()
-            print(f"Error storing jockey: {str(e)}")
-            raise
-
     def _store_jockey_results(self, db: Session, response_data: Dict) -> None:
-        """Store jockey results data."""
+        """Store jockeys and their results with bulk upserts, and refresh their statistics."""
         try:
+            writer = BulkWriter(db)
             for jockey_data in response_data.get("jockey_results", []):
-                # Store jockey with unique constraint handling
-                jockey = self._store_jockey(db, jockey_data)
-                jockey_id = jockey.jockey_id
-
-                # Store results
-                for result_data in jockey_data.get("results", []):
-                    result = Result(
-                        result_id=f"{result_data['race_id']}_{result_data['horse_id']}",
-                        race_id=result_data["race_id"],
-                        horse_id=result_data["horse_id"],
-                        jockey_id=jockey_id,
-                        trainer_id=result_data["trainer_id"],
-                        owner_id=result_data["owner_id"],
-                        sp=result_data.get("sp"),
-                        sp_dec=result_data.get("sp_dec"),
-                        number=result_data.get("number"),
-                        position=result_data.get("position"),
-                        draw=result_data.get("draw"),
-                        btn=result_data.get("btn"),
-                        ovr_btn=result_data.get("ovr_btn"),
-                        age=result_data.get("age"),
-                        sex=result_data.get("sex"),
-                        weight=result_data.get("weight"),
-                        weight_lbs=result_data.get("weight_lbs"),
-                        headgear=result_data.get("headgear"),
-                        time=result_data.get("time"),
-                        or_rating=result_data.get("or"),
-                        rpr=result_data.get("rpr"),
-                        tsr=result_data.get("tsr"),
-                        prize=result_data.get("prize"),
-                        comment=result_data.get("comment"),
-                        silk_url=result_data.get("silk_url", "")
-                    )
-                    db.merge(result)
+                stage_jockey_results(writer, jockey_data)
+            touched = touched_entities(writer.staged.get(Result, {}).values())
+            counts = writer.flush()
+            counts.update(refresh_statistics(db, touched))
             db.commit()
+            print(f"Stored jockey results - rows: {counts}")
         except Exception as e:
             print(f"Error storing jockey results: {str(e)}")
             db.rollback()
             raise
 
     def _store_trainer_results(self, db: Session, response_data: Dict) -> None:
-        """Store trainer results data."""
+        """Store trainers and their results with bulk upserts, and refresh their statistics."""
         try:
+            writer = BulkWriter(db)
             for trainer_data in response_data.get("trainer_results", []):
-                # Store trainer
-                trainer = Trainer(
-                    trainer_id=trainer_data["trainer_id"],
-                    trainer=trainer_data["trainer"],
-                    trainer_location=trainer_data.get("trainer_location", "")
-                )
-                db.merge(trainer)
-
-                # Store results
-                for result_data in trainer_data.get("results", []):
-                    result = Result(
-                        result_id=f"{result_data['race_id']}_{result_data['horse_id']}",
-                        race_id=result_data["race_id"],
-                        horse_id=result_data["horse_id"],
-                        trainer_id=trainer_data["trainer_id"],
-                        owner_id=result_data["owner_id"],
-                        sp=result_data.get("sp"),
-                        sp_dec=result_data.get("sp_dec"),
-                        number=result_data.get("number"),
-                        position=result_data.get("position"),
-                        draw=result_data.get("draw"),
-                        btn=result_data.get("btn"),
-                        ovr_btn=result_data.get("ovr_btn"),
-                        age=result_data.get("age"),
-                        sex=result_data.get("sex"),
-                        weight=result_data.get("weight"),
-                        weight_lbs=result_data.get("weight_lbs"),
-                        headgear=result_data.get("headgear"),
-                        time=result_data.get("time"),
-                        or_rating=result_data.get("or"),
-                        rpr=result_data.get("rpr"),
-                        tsr=result_data.get("tsr"),
-                        prize=result_data.get("prize"),
-                        comment=result_data.get("comment"),
-                        silk_url=result_data.get("silk_url", "")
-                    )
-                    db.merge(result)
+                stage_trainer_results(writer, trainer_data)
+            touched = touched_entities(writer.staged.get(Result, {}).values())
+            counts = writer.flush()
+            counts.update(refresh_statistics(db, touched))
             db.commit()
+            print(f"Stored trainer results - rows: {counts}")
         except Exception as e:
             print(f"Error storing trainer results: {str(e)}")
             db.rollback()
@@ -0,0 +1,106 @@
+import threading
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session
+
+from src.db.models import Course, Horse, Jockey, Trainer, Owner
+
+# Dimension tables and the columns ingestion writes to them. A staged row
+# whose values for these columns match the database needs no write at all.
+DIMENSION_COLUMNS = {
+    Course: ("course", "region_code", "region"),
+    Horse: ("horse",),
+    Jockey: ("jockey",),
+    Trainer: ("trainer",),
+    Owner: ("owner",),
+}
+
+
+class DimensionCache:
+    """
+    Ingestion-scoped view of which courses, horses, jockeys, trainers and
+    owners are already stored, and under which names.
+
+    Loaded with one SELECT per dimension table, then used by BulkWriter to
+    split staged dimension rows into inserts, updates and rows to skip
+    without asking the database. Rows written in a transaction only become
+    known once that transaction commits, so a rolled back batch is staged
+    again by the next one.
+
+    Usage:
+        dimensions = DimensionCache.load(db)
+        writer = BulkWriter(db, dimensions=dimensions)
+    """
+
+    def __init__(self):
+        self.known: Dict[Any, Dict[Any, Tuple]] = {model: {} for model in DIMENSION_COLUMNS}
+        self.counts = {"inserted": 0, "updated": 0, "skipped": 0}
+        self._pending: Dict[int, Dict[Any, Dict[Any, Tuple]]] = {}
+        self._lock = threading.Lock()
+        # Kept as attributes so the same listener objects can be checked for
+        self._on_commit = self._commit
+        self._on_rollback = self._rollback
+
+    @classmethod
+    def load(cls, db: Session) -> "DimensionCache":
+        """Build a cache holding the ids and names of every stored dimension row."""
+        cache = cls()
+        for model, columns in DIMENSION_COLUMNS.items():
+            primary_key = model.__table__.primary_key.columns[0]
+            table_columns = [model.__table__.columns[name] for name in columns]
+            rows = db.execute(select(primary_key, *table_columns)).all()
+            cache.known[model] = {row[0]: tuple(row[1:]) for row in rows}
+        return cache
+
+    def __contains__(self, model) -> bool:
+        return model in DIMENSION_COLUMNS
+
+    def filter(self, db: Session, model, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Return the staged rows of a dimension table that need writing.
+
+        New ids are inserts and known ids with different values are updates;
+        the rest are dropped. Rows carrying columns the cache doesn't track
+        are always written.
+        """
+        columns = DIMENSION_COLUMNS[model]
+        key_name = model.__table__.primary_key.columns[0].name
+        self._track(db)
+
+        changed = []
+        with self._lock:
+            known = self.known[model]
+            pending = self._pending.setdefault(id(db), {}).setdefault(model, {})
+            for row in rows:
+                key = row[key_name]
+                stored = pending.get(key, known.get(key))
+                values = tuple(row.get(name, stored[i] if stored else None) for i, name in enumerate(columns))
+                if stored is not None and values == stored and set(row) <= {key_name, *columns}:
+                    self.counts["skipped"] += 1
+                    continue
+                self.counts["inserted" if stored is None else "updated"] += 1
+                pending[key] = values
+                changed.append(row)
+        return changed
+
+    def _track(self, db: Session) -> None:
+        if not event.contains(db, "after_commit", self._on_commit):
+            event.listen(db, "after_commit", self._on_commit)
+            event.listen(db, "after_rollback", self._on_rollback)
+
+    def _commit(self, session: Session) -> None:
+        with self._lock:
+            for model, rows in self._pending.pop(id(session), {}).items():
+                self.known[model].update(rows)
+
+    def _rollback(self, session: Session) -> None:
+        with self._lock:
+            self._pending.pop(id(session), None)
+
+    def stats(self) -> Dict[str, int]:
+        """Known rows per table and how staged rows were resolved."""
+        return {
+            **{model.__tablename__: len(rows) for model, rows in self.known.items()},
+            **self.counts,
+        }
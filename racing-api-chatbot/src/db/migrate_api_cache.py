@@ -0,0 +1,60 @@
+"""
+Move an existing api_cache table to hash-keyed, JSONB rows.
+
+Drops expired rows, adds the cache_key column computed exactly as
+database.cache_key() does, keeps only the newest row per key, unwraps
+response_data that was stored as a JSON-encoded string and converts the
+column to JSONB, then adds the unique key index.
+
+Usage:
+    python -m src.db.migrate_api_cache
+"""
+from datetime import datetime
+
+from sqlalchemy import text
+
+from src.db.database import db_manager
+
+
+def log_message(message: str):
+    """Helper function to log messages with timestamp"""
+    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {message}", flush=True)
+
+
+def migrate():
+    log_message("Starting api_cache migration...")
+    with db_manager.engine.begin() as conn:
+        conn.execute(text("SET statement_timeout = '1800000'"))  # 30 minutes
+        expired = conn.execute(text("DELETE FROM api_cache WHERE expires_at <= now() AT TIME ZONE 'UTC'")).rowcount
+        log_message(f"Deleted {expired} expired rows")
+
+        conn.execute(text("ALTER TABLE api_cache ADD COLUMN IF NOT EXISTS cache_key VARCHAR(64)"))
+        conn.execute(text(
+            "UPDATE api_cache SET cache_key = encode(sha256(convert_to(endpoint || E'\\n' || params, 'UTF8')), 'hex') "
+            "WHERE cache_key IS NULL"
+        ))
+        duplicates = conn.execute(text(
+            "DELETE FROM api_cache a USING api_cache b "
+            "WHERE a.cache_key = b.cache_key AND a.id < b.id"
+        )).rowcount
+        log_message(f"Deleted {duplicates} duplicate rows")
+        conn.execute(text("ALTER TABLE api_cache ALTER COLUMN cache_key SET NOT NULL"))
+
+        # Rows were written with json.dumps() into a JSON column, so most hold
+        # a JSON string wrapping the real document
+        conn.execute(text(
+            "ALTER TABLE api_cache ALTER COLUMN response_data TYPE JSONB USING "
+            "CASE WHEN json_typeof(response_data) = 'string' THEN (response_data #>> '{}')::jsonb "
+            "ELSE response_data::jsonb END"
+        ))
+
+        conn.execute(text("DROP INDEX IF EXISTS idx_api_cache_endpoint"))
+        conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS idx_api_cache_key ON api_cache (cache_key)"))
+
+    with db_manager.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("VACUUM ANALYZE api_cache"))
+    log_message("api_cache migration completed")
+
+
+if __name__ == "__main__":
+    migrate()
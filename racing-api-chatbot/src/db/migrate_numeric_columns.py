@@ -0,0 +1,99 @@
+"""
+Add the generated numeric shadow columns and their indexes to an existing database.
+
+init_db() drops and recreates every table, so databases created before the
+*_num columns existed need this instead. Postgres computes a stored
+generated column for every existing row when it is added, which is the
+backfill; indexes are then built CONCURRENTLY so reads aren't blocked.
+
+Usage:
+    python -m src.db.migrate_numeric_columns            # add columns, indexes, analyze
+    python -m src.db.migrate_numeric_columns --check    # only report coverage
+"""
+import sys
+from datetime import datetime
+
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql
+
+from src.db.database import db_manager
+from src.db.models import Result, Runner
+
+SHADOWED_MODELS = [Result, Runner]
+
+
+def log_message(message: str):
+    """Helper function to log messages with timestamp"""
+    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {message}", flush=True)
+
+
+def shadow_columns(model):
+    """Generated numeric columns of a model, as (column, source column name)."""
+    columns = []
+    for column in model.__table__.columns:
+        if column.computed is not None and column.name.endswith("_num"):
+            columns.append((column, column.name[:-len("_num")]))
+    return columns
+
+
+def shadow_indexes(model):
+    """Indexes of a model that cover a generated numeric column."""
+    return [
+        index for index in model.__table__.indexes
+        if any(column.computed is not None for column in index.columns)
+    ]
+
+
+def add_columns():
+    dialect = postgresql.dialect()
+    with db_manager.engine.begin() as conn:
+        conn.execute(text("SET statement_timeout = '1800000'"))  # 30 minutes
+        for model in SHADOWED_MODELS:
+            table = model.__tablename__
+            for column, _ in shadow_columns(model):
+                column_type = column.type.compile(dialect=dialect)
+                log_message(f"Adding {table}.{column.name} (rewrites the table once)...")
+                conn.execute(text(
+                    f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {column.name} {column_type} "
+                    f"GENERATED ALWAYS AS ({column.computed.sqltext}) STORED"
+                ))
+
+
+def add_indexes():
+    # CREATE INDEX CONCURRENTLY can't run inside a transaction block
+    with db_manager.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        for model in SHADOWED_MODELS:
+            table = model.__tablename__
+            for index in shadow_indexes(model):
+                columns = ", ".join(column.name for column in index.columns)
+                log_message(f"Creating index {index.name} on {table} ({columns})...")
+                conn.execute(text(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {index.name} ON {table} ({columns})"))
+            conn.execute(text(f"ANALYZE {table}"))
+
+
+def check_coverage():
+    """Report, per column, how many non-empty values could not be parsed as numbers."""
+    with db_manager.engine.connect() as conn:
+        for model in SHADOWED_MODELS:
+            table = model.__tablename__
+            for column, source in shadow_columns(model):
+                total, parsed = conn.execute(text(
+                    f'SELECT COUNT(*) FILTER (WHERE COALESCE("{source}", \'\') <> \'\'), '
+                    f"COUNT({column.name}) FROM {table}"
+                )).one()
+                log_message(f"{table}.{column.name}: {parsed}/{total} non-empty {source} values are numeric")
+
+
+def migrate():
+    log_message("Starting numeric column migration...")
+    add_columns()
+    add_indexes()
+    check_coverage()
+    log_message("Numeric column migration completed")
+
+
+if __name__ == "__main__":
+    if "--check" in sys.argv[1:]:
+        check_coverage()
+    else:
+        migrate()
@@ -0,0 +1,71 @@
+"""
+Move an existing database from the odds table to odds_history.
+
+Creates the partitioned odds_history table, its monthly partitions and the
+current_odds view, then copies every row of the old odds table across as
+one history row each. The old table is left in place; drop it once the
+copy has been checked.
+
+Usage:
+    python -m src.db.migrate_odds_history
+"""
+from datetime import datetime
+
+from sqlalchemy import text
+
+from src.db.database import db_manager
+from src.db.models import ODDS_HISTORY_PARTITION_MONTHS, OddsHistory, create_odds_history_partitions
+
+
+def log_message(message: str):
+    """Helper function to log messages with timestamp"""
+    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {message}", flush=True)
+
+
+BACKFILL_SQL = r"""
+INSERT INTO odds_history (race_id, horse_id, bookmaker, observed_at, frac_num, frac_den, decimal, ew_places, ew_denom, updated)
+SELECT
+    race_id,
+    horse_id,
+    bookmaker,
+    COALESCE(created_at, now() AT TIME ZONE 'UTC'),
+    CASE WHEN fractional ~ '^[0-9]+/[0-9]+$' THEN split_part(fractional, '/', 1)::integer
+         WHEN lower(fractional) IN ('evs', 'evens') THEN 1 END,
+    CASE WHEN fractional ~ '^[0-9]+/[0-9]+$' THEN split_part(fractional, '/', 2)::integer
+         WHEN lower(fractional) IN ('evs', 'evens') THEN 1 END,
+    CASE WHEN "decimal" ~ '^[0-9]+(\.[0-9]+)?$' THEN "decimal"::numeric(8, 2) END,
+    CASE WHEN ew_places ~ '^[0-9]+$' THEN ew_places::smallint END,
+    CASE WHEN ew_denom ~ '^[0-9]+$' THEN ew_denom::smallint END,
+    CASE WHEN updated ~ '^\d{4}-\d{2}-\d{2}[T ]\d{2}:\d{2}:\d{2}' THEN left(updated, 19)::timestamp END
+FROM odds
+ON CONFLICT DO NOTHING
+"""
+
+
+def migrate():
+    log_message("Starting odds history migration...")
+    with db_manager.engine.begin() as conn:
+        conn.execute(text("SET statement_timeout = '1800000'"))  # 30 minutes
+        OddsHistory.__table__.create(conn, checkfirst=True)
+
+        legacy = conn.execute(text("SELECT to_regclass('public.odds') IS NOT NULL")).scalar()
+        if not legacy:
+            log_message("No odds table found, nothing to backfill")
+        else:
+            # Give every month the old rows fall in its own partition, so
+            # none of them end up in the default partition
+            first = conn.execute(text("SELECT min(created_at) FROM odds")).scalar()
+            if first:
+                now = datetime.utcnow()
+                months = (now.year - first.year) * 12 + now.month - first.month + ODDS_HISTORY_PARTITION_MONTHS
+                create_odds_history_partitions(conn, first.date(), months)
+            copied = conn.execute(text(BACKFILL_SQL)).rowcount
+            log_message(f"Copied {copied} rows from odds into odds_history")
+
+    with db_manager.engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("ANALYZE odds_history"))
+    log_message("Odds history migration completed")
+
+
+if __name__ == "__main__":
+    migrate()
@@ -0,0 +1,65 @@
+"""
+Prepare the statistics tables of an existing database for the statistics
+engine, then fill them.
+
+Drops duplicate trainer and jockey rows, adds the unique constraints the
+engine upserts on and rebuilds every statistic from the results table.
+
+Usage:
+    python -m src.db.migrate_statistics
+"""
+from datetime import datetime
+
+from sqlalchemy import text
+
+from src.db.database import db_manager
+from src.db.statistics import refresh_statistics
+
+
+def log_message(message: str):
+    """Helper function to log messages with timestamp"""
+    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {message}", flush=True)
+
+
+# table, entity column, constraint name
+CONSTRAINTS = [
+    ("trainer_statistics", "trainer_id", "uq_trainer_stat"),
+    ("jockey_statistics", "jockey_id", "uq_jockey_stat"),
+]
+
+
+def migrate():
+    log_message("Starting statistics migration...")
+    with db_manager.engine.begin() as conn:
+        conn.execute(text("SET statement_timeout = '1800000'"))  # 30 minutes
+        for table, column, constraint in CONSTRAINTS:
+            duplicates = conn.execute(text(
+                f"DELETE FROM {table} a USING {table} b "
+                f"WHERE a.{column} = b.{column} AND a.period_type = b.period_type "
+                f"AND a.period_value IS NOT DISTINCT FROM b.period_value AND a.id < b.id"
+            )).rowcount
+            log_message(f"Deleted {duplicates} duplicate rows from {table}")
+            exists = conn.execute(
+                text("SELECT 1 FROM pg_constraint WHERE conname = :name"), {"name": constraint}
+            ).scalar()
+            if not exists:
+                conn.execute(text(
+                    f"ALTER TABLE {table} ADD CONSTRAINT {constraint} UNIQUE ({column}, period_type, period_value)"
+                ))
+
+    db = db_manager.SessionLocal()
+    try:
+        log_message("Rebuilding statistics from results...")
+        counts = refresh_statistics(db)
+        db.commit()
+        log_message(f"Statistics rows written: {counts}")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+    log_message("Statistics migration completed")
+
+
+if __name__ == "__main__":
+    migrate()
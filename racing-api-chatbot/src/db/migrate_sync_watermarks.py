@@ -0,0 +1,31 @@
+"""
+Add the incremental sync watermark columns to an existing api_sync_log table.
+
+Usage:
+    python -m src.db.migrate_sync_watermarks
+"""
+from datetime import datetime
+
+from sqlalchemy import text
+
+from src.db.database import db_manager
+
+
+def log_message(message: str):
+    """Helper function to log messages with timestamp"""
+    print(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}] {message}", flush=True)
+
+
+def migrate():
+    log_message("Adding sync watermark columns to api_sync_log...")
+    with db_manager.engine.begin() as conn:
+        conn.execute(text("ALTER TABLE api_sync_log ADD COLUMN IF NOT EXISTS content_hash VARCHAR(64)"))
+        conn.execute(text("ALTER TABLE api_sync_log ADD COLUMN IF NOT EXISTS item_hashes JSON"))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS idx_api_sync_log_endpoint ON api_sync_log (endpoint, status, id)"
+        ))
+    log_message("Sync watermark migration completed")
+
+
+if __name__ == "__main__":
+    migrate()
@@ -1,15 +1,40 @@
 from sqlalchemy import (
     Column, Integer, String, Float, Boolean, 
     DateTime, Date, Time, ForeignKey, Text,
-    UniqueConstraint, Index, Numeric, JSON, create_engine
+    UniqueConstraint, Index, Numeric, JSON, Computed, MetaData, SmallInteger, Table,
+    create_engine, event, text
 )
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import Session, relationship
-from datetime import datetime
+from datetime import date, datetime
 from typing import List, Dict
 
 Base = declarative_base()
 
+# Views are created by DDL hooks on the tables they read from, so they live
+# outside Base.metadata where create_all()/drop_all() would treat them as tables
+view_metadata = MetaData()
+
+# Monthly odds_history partitions created ahead of the current month
+ODDS_HISTORY_PARTITION_MONTHS = 3
+
+def numeric_shadow(column_name: str, integer: bool = False) -> Computed:
+    """
+    Postgres-generated numeric copy of a string column.
+
+    Non-numeric values such as 'PU', '-' or '' become NULL, so range filters
+    and sorts can use a plain B-tree index instead of casting every row.
+    """
+    # Quoted because some source columns ("position", "decimal") are SQL keywords
+    column = f'"{column_name}"'
+    if integer:
+        return Computed(f"CASE WHEN {column} ~ '^[0-9]+$' THEN {column}::integer END", persisted=True)
+    return Computed(
+        f"CASE WHEN {column} ~ '^[0-9]+(\\.[0-9]+)?$' THEN {column}::double precision END",
+        persisted=True,
+    )
+
 class ChatHistory(Base):
     __tablename__ = "chat_history"
 
@@ -192,6 +217,10 @@ class Runner(Base):
     silk_url = Column(Text, default="")
     trainer_rtf = Column(Text)
     is_non_runner = Column(Boolean, default=False)
+    lbs_num = Column(Integer, numeric_shadow("lbs", integer=True))
+    ofr_num = Column(Integer, numeric_shadow("ofr", integer=True))
+    rpr_num = Column(Integer, numeric_shadow("rpr", integer=True))
+    ts_num = Column(Integer, numeric_shadow("ts", integer=True))
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -200,7 +229,10 @@ class Runner(Base):
     jockey = relationship("Jockey", back_populates="runners")
     trainer = relationship("Trainer", back_populates="runners")
     owner = relationship("Owner", back_populates="runners")
-    odds = relationship("Odds", back_populates="runner")
+    odds = relationship(
+        "Odds", back_populates="runner", viewonly=True,
+        primaryjoin="Runner.runner_id == foreign(Odds.runner_id)",
+    )
     
     __table_args__ = (
         UniqueConstraint("race_id", "horse_id", name="uq_runners_race_horse"),
@@ -211,6 +243,8 @@ class Runner(Base):
         Index("idx_runners_headgear", headgear),
         Index("idx_runners_wind_surgery", wind_surgery),
         Index("idx_runners_non_runner", is_non_runner),
+        Index("idx_runners_ofr_num", ofr_num),
+        Index("idx_runners_rpr_num", rpr_num),
     )
 
 class Result(Base):
@@ -241,6 +275,12 @@ class Result(Base):
     prize = Column(String(20))
     comment = Column(Text)
     silk_url = Column(String(255), default="")
+    sp_dec_num = Column(Float, numeric_shadow("sp_dec"))
+    position_num = Column(Integer, numeric_shadow("position", integer=True))
+    weight_lbs_num = Column(Integer, numeric_shadow("weight_lbs", integer=True))
+    or_rating_num = Column(Integer, numeric_shadow("or_rating", integer=True))
+    rpr_num = Column(Integer, numeric_shadow("rpr", integer=True))
+    tsr_num = Column(Integer, numeric_shadow("tsr", integer=True))
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
@@ -255,31 +295,110 @@ class Result(Base):
         Index("idx_results_race", race_id),
         Index("idx_results_horse", horse_id),
         Index("idx_results_position", position),
+        Index("idx_results_position_num", position_num),
+        Index("idx_results_sp_dec_num", sp_dec_num),
     )
 
-class Odds(Base):
-    __tablename__ = "odds"
-    
-    odds_id = Column(String(40), primary_key=True)
-    race_id = Column(String(30), nullable=False)
-    horse_id = Column(String(30), nullable=False)
-    runner_id = Column(String(40), ForeignKey("runners.runner_id"))
-    bookmaker = Column(String(50), nullable=False)
-    fractional = Column(String(20), nullable=False)
-    decimal = Column(String(20), nullable=False)
-    ew_places = Column(String(10))
-    ew_denom = Column(String(10))
-    updated = Column(String(30))
-    is_current = Column(Boolean, default=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    
-    runner = relationship("Runner", back_populates="odds")
-    
+class OddsHistory(Base):
+    """
+    Append-only log of every bookmaker price seen, one row per poll.
+
+    Range-partitioned by month on observed_at. Prices are stored as numbers
+    (fraction numerator/denominator, decimal) rather than strings, and the
+    primary key doubles as the index for a runner's price history.
+    """
+    __tablename__ = "odds_history"
+    __append_only__ = True
+
+    race_id = Column(String(30), primary_key=True)
+    horse_id = Column(String(30), primary_key=True)
+    bookmaker = Column(String(50), primary_key=True)
+    observed_at = Column(DateTime, primary_key=True, default=datetime.utcnow)
+    frac_num = Column(Integer)
+    frac_den = Column(Integer)
+    decimal = Column(Numeric(8, 2))
+    ew_places = Column(SmallInteger)
+    ew_denom = Column(SmallInteger)
+    updated = Column(DateTime)
+
     __table_args__ = (
-        Index("idx_odds_race_horse", race_id, horse_id),
-        Index("idx_odds_current", is_current),
+        Index("idx_odds_history_observed", observed_at),
+        {"postgresql_partition_by": "RANGE (observed_at)"},
+    )
+
+class Odds(Base):
+    """
+    Current price per runner and bookmaker: the latest odds_history row.
+
+    Read-only, backed by the current_odds view, with the same columns the
+    odds table used to have so queries against it are unchanged.
+    """
+    __table__ = Table(
+        "current_odds", view_metadata,
+        Column("odds_id", String(40), primary_key=True),
+        Column("race_id", String(30), nullable=False),
+        Column("horse_id", String(30), nullable=False),
+        Column("runner_id", String(40)),
+        Column("bookmaker", String(50), nullable=False),
+        Column("fractional", String(20)),
+        Column("decimal", String(20)),
+        Column("ew_places", String(10)),
+        Column("ew_denom", String(10)),
+        Column("updated", String(30)),
+        Column("is_current", Boolean),
+        Column("decimal_num", Float, info={"numeric_shadow": True}),
+        Column("created_at", DateTime),
+    )
+
+    runner = relationship(
+        "Runner", back_populates="odds", viewonly=True,
+        primaryjoin="foreign(Odds.runner_id) == Runner.runner_id",
     )
 
+# DISTINCT ON walks the odds_history primary key backwards per runner and
+# bookmaker, so a filter on race_id or horse_id is an index range scan
+CURRENT_ODDS_VIEW = """
+CREATE OR REPLACE VIEW current_odds AS
+SELECT DISTINCT ON (race_id, horse_id, bookmaker)
+    race_id || '_' || horse_id || '_' || bookmaker AS odds_id,
+    race_id,
+    horse_id,
+    race_id || '_' || horse_id AS runner_id,
+    bookmaker,
+    CASE WHEN frac_den IS NOT NULL THEN frac_num || '/' || frac_den END AS fractional,
+    decimal::text AS decimal,
+    ew_places::text AS ew_places,
+    ew_denom::text AS ew_denom,
+    to_char(updated, 'YYYY-MM-DD"T"HH24:MI:SS') AS updated,
+    TRUE AS is_current,
+    decimal::double precision AS decimal_num,
+    observed_at AS created_at
+FROM odds_history
+ORDER BY race_id, horse_id, bookmaker, observed_at DESC
+"""
+
+def create_odds_history_partitions(connection, start: date = None, months: int = ODDS_HISTORY_PARTITION_MONTHS) -> None:
+    """Create the monthly odds_history partitions from start's month onwards, if missing."""
+    month = (start or datetime.utcnow().date()).replace(day=1)
+    for _ in range(months):
+        next_month = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+        connection.execute(text(
+            f"CREATE TABLE IF NOT EXISTS odds_history_{month:%Y_%m} PARTITION OF odds_history "
+            f"FOR VALUES FROM ('{month.isoformat()}') TO ('{next_month.isoformat()}')"
+        ))
+        month = next_month
+
+@event.listens_for(OddsHistory.__table__, "after_create")
+def _create_odds_history_children(target, connection, **kw):
+    # Rows outside the prepared months land in the default partition rather than failing
+    connection.execute(text("CREATE TABLE IF NOT EXISTS odds_history_default PARTITION OF odds_history DEFAULT"))
+    create_odds_history_partitions(connection)
+    connection.execute(text(CURRENT_ODDS_VIEW))
+
+@event.listens_for(OddsHistory.__table__, "before_drop")
+def _drop_current_odds_view(target, connection, **kw):
+    connection.execute(text("DROP VIEW IF EXISTS current_odds"))
+
 class RunnerMedical(Base):
     __tablename__ = "runner_medical"
     
@@ -323,30 +442,65 @@ class ApiSyncLog(Base):
     start_time = Column(DateTime)
     end_time = Column(DateTime)
     duration_seconds = Column(Integer)
+    # Watermark for incremental syncs: hash of the whole payload and of each item in it
+    content_hash = Column(String(64))
+    item_hashes = Column(JSON)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("idx_api_sync_log_endpoint", endpoint, status, id),
+    )
+
+class PipelineRun(Base):
+    """One run of the data pipeline; a crashed full run is resumed by the next one."""
+    __tablename__ = "pipeline_runs"
+
+    id = Column(Integer, primary_key=True)
+    mode = Column(String(20), nullable=False)
+    status = Column(String(20), nullable=False, default="running")
+    error_message = Column(Text)
+    started_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime)
+
+class PipelineCheckpoint(Base):
+    """
+    Work a pipeline run has finished: a whole stage (item_key '') or one
+    item of it, such as the odds of one race.
+    """
+    __tablename__ = "pipeline_checkpoints"
+
+    run_id = Column(Integer, ForeignKey("pipeline_runs.id", ondelete="CASCADE"), primary_key=True)
+    stage = Column(String(30), primary_key=True)
+    item_key = Column(String(50), primary_key=True, default="")
+    records_processed = Column(Integer)
     created_at = Column(DateTime, default=datetime.utcnow)
 
 class APICache(Base):
     __tablename__ = "api_cache"
     
     id = Column(Integer, primary_key=True)
+    # SHA-256 of endpoint and params, see database.cache_key()
+    cache_key = Column(String(64), nullable=False)
     endpoint = Column(String(100), nullable=False)
     params = Column(Text, nullable=False)
-    response_data = Column(JSON, nullable=False)
+    # JSONB is stored decomposed and TOAST-compressed
+    response_data = Column(JSONB, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     expires_at = Column(DateTime, nullable=False)
     
     __table_args__ = (
-        Index("idx_api_cache_endpoint", endpoint),
+        Index("idx_api_cache_key", cache_key, unique=True),
         Index("idx_api_cache_expires", expires_at),
     )
 
 class TrainerStatistics(Base):
     __tablename__ = "trainer_statistics"
+    __upsert_key__ = ("trainer_id", "period_type", "period_value")
     
     id = Column(Integer, primary_key=True)
     trainer_id = Column(String(30), ForeignKey("trainers.trainer_id"), nullable=False)
-    period_type = Column(String(20), nullable=False)  # 14_days, season, course, etc.
-    period_value = Column(String(30))  # course_id, season_year, etc.
+    period_type = Column(String(20), nullable=False)  # career, 14_days, season, course, course_season
+    period_value = Column(String(30))  # all, current, season year, course_id, course_id:year
     runs = Column(Integer, nullable=False, default=0)
     wins = Column(Integer, nullable=False, default=0)
     places = Column(Integer, nullable=False, default=0)
@@ -356,12 +510,14 @@ class TrainerStatistics(Base):
     last_calculated = Column(DateTime, default=datetime.utcnow)
     
     __table_args__ = (
+        UniqueConstraint("trainer_id", "period_type", "period_value", name="uq_trainer_stat"),
         Index("idx_trainer_statistics_trainer", trainer_id),
         Index("idx_trainer_statistics_period", period_type, period_value),
     )
 
 class JockeyStatistics(Base):
     __tablename__ = "jockey_statistics"
+    __upsert_key__ = ("jockey_id", "period_type", "period_value")
     
     id = Column(Integer, primary_key=True)
     jockey_id = Column(String(30), ForeignKey("jockeys.jockey_id"), nullable=False)
@@ -376,12 +532,14 @@ class JockeyStatistics(Base):
     last_calculated = Column(DateTime, default=datetime.utcnow)
     
     __table_args__ = (
+        UniqueConstraint("jockey_id", "period_type", "period_value", name="uq_jockey_stat"),
         Index("idx_jockey_statistics_jockey", jockey_id),
         Index("idx_jockey_statistics_period", period_type, period_value),
     )
 
 class HorseStatistics(Base):
     __tablename__ = "horse_statistics"
+    __upsert_key__ = ("horse_id", "stat_type", "stat_value")
     
     id = Column(Integer, primary_key=True)
     horse_id = Column(String(30), ForeignKey("horses.horse_id"), nullable=False)
@@ -436,10 +594,12 @@ def init_db(engine):
         Race.__table__,    # Depends on Course
         Runner.__table__,  # Depends on Race, Horse, Trainer, Jockey, Owner
         Result.__table__,  # Depends on Race, Horse, Trainer, Jockey, Owner
-        Odds.__table__,    # Depends on Runner
+        OddsHistory.__table__,  # Also creates its partitions and the current_odds view
         RunnerMedical.__table__,  # Depends on Horse
         RunnerQuote.__table__,    # Depends on Horse
         ApiSyncLog.__table__,
+        PipelineRun.__table__,
+        PipelineCheckpoint.__table__,  # Depends on PipelineRun
         APICache.__table__,
         TrainerStatistics.__table__,  # Depends on Trainer
         JockeyStatistics.__table__,   # Depends on Jockey
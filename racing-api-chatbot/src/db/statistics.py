@@ -0,0 +1,220 @@
+"""
+Trainer, jockey and horse statistics, rolled up from results with SQL.
+
+refresh_statistics() recomputes the rows of the entities a batch touched,
+inside the batch's transaction; `python -m src.db.statistics` rebuilds all.
+"""
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Optional, Set
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+ROLLING_DAYS = 14
+
+# Runners in the race: the declared field size, else the results recorded for it
+FIELD_SIZE_SQL = """
+CROSS JOIN LATERAL (
+    SELECT COALESCE(
+        CASE WHEN ra.field_size ~ '^[0-9]+$' THEN ra.field_size::integer END,
+        (SELECT count(*) FROM results f WHERE f.race_id = r.race_id)
+    ) AS runners
+) fs"""
+
+# Per-runner facts every statistic is built from, over results r, races ra
+# and FIELD_SIZE_SQL. Places follow the usual each-way terms: only the
+# winner under 5 runners, 2 places up to 7, 3 from 8, and 4 in handicaps of
+# 16 or more. expected is the win chance the starting price implied and
+# profit the return of a one-unit win bet at SP; both are 0 for runners
+# without a numeric SP, which A/E and P/L don't count.
+RUN_FACTS_SQL = """
+    COALESCE(r.position_num = 1, false) AS won,
+    COALESCE(r.position_num <= CASE
+        WHEN fs.runners < 5 THEN 1
+        WHEN fs.runners < 8 THEN 2
+        WHEN fs.runners >= 16 AND ra.race_name ILIKE '%handicap%' THEN 4
+        ELSE 3
+    END, false) AS placed,
+    COALESCE(r.sp_dec_num > 0, false) AS priced,
+    CASE WHEN r.sp_dec_num > 0 THEN 1.0 / r.sp_dec_num ELSE 0 END AS expected,
+    CASE WHEN r.sp_dec_num > 0 THEN
+        CASE WHEN r.position_num = 1 THEN r.sp_dec_num - 1 ELSE -1 END
+    ELSE 0 END AS profit"""
+
+RUNS_SQL = """
+SELECT
+    r.{entity} AS entity_id,
+    ra.date,
+    ra.course_id,
+    ra.going,
+    ra.distance_f,
+    ra.race_class,
+    r.position_num,
+    r.sp_dec_num,""" + RUN_FACTS_SQL + """
+FROM results r
+JOIN races ra ON ra.race_id = r.race_id""" + FIELD_SIZE_SQL + """
+WHERE r.{entity} IS NOT NULL {entity_filter}
+"""
+
+PERIODS_SQL = """
+(VALUES
+    ('career', 'all'),
+    ('14_days', CASE WHEN runs.date > :since THEN 'current' END),
+    ('season', to_char(runs.date, 'YYYY')),
+    ('course', runs.course_id),
+    ('course_season', runs.course_id || ':' || to_char(runs.date, 'YYYY'))
+) AS p(period_type, period_value)
+"""
+
+HORSE_SPLITS_SQL = """
+(VALUES
+    ('career', 'all'),
+    ('course', runs.course_id),
+    ('going', runs.going),
+    ('distance', runs.distance_f),
+    ('class', runs.race_class)
+) AS p(period_type, period_value)
+"""
+
+# A/E is priced wins over the wins the starting prices implied, capped to
+# fit its column; P/L is a one-unit win bet on every priced runner at SP.
+PEOPLE_SQL = """
+INSERT INTO {table} ({entity}, period_type, period_value, {runs}, wins, places, win_percentage, ae, pl, last_calculated)
+SELECT
+    runs.entity_id,
+    p.period_type,
+    p.period_value,
+    count(*),
+    count(*) FILTER (WHERE runs.won),
+    count(*) FILTER (WHERE runs.placed),
+    round(100.0 * count(*) FILTER (WHERE runs.won) / count(*), 2),
+    LEAST(round(
+        (count(*) FILTER (WHERE runs.won AND runs.priced))::numeric
+        / NULLIF(sum(runs.expected), 0)::numeric,
+        2
+    ), 999.99),
+    round(sum(runs.profit)::numeric, 2),
+    :now
+FROM ({runs_sql}) runs
+CROSS JOIN LATERAL {periods}
+WHERE p.period_value IS NOT NULL
+GROUP BY runs.entity_id, p.period_type, p.period_value
+ORDER BY runs.entity_id, p.period_type, p.period_value
+ON CONFLICT ({entity}, period_type, period_value) DO UPDATE SET
+    {runs} = excluded.{runs},
+    wins = excluded.wins,
+    places = excluded.places,
+    win_percentage = excluded.win_percentage,
+    ae = excluded.ae,
+    pl = excluded.pl,
+    last_calculated = excluded.last_calculated
+"""
+
+HORSE_SQL = """
+INSERT INTO horse_statistics (horse_id, stat_type, stat_value, runs, wins, places, win_percentage, best_position, last_calculated)
+SELECT
+    runs.entity_id,
+    p.period_type,
+    p.period_value,
+    count(*),
+    count(*) FILTER (WHERE runs.won),
+    count(*) FILTER (WHERE runs.placed),
+    round(100.0 * count(*) FILTER (WHERE runs.won) / count(*), 2),
+    min(runs.position_num)::text,
+    :now
+FROM ({runs_sql}) runs
+CROSS JOIN LATERAL {periods}
+WHERE p.period_value IS NOT NULL
+GROUP BY runs.entity_id, p.period_type, p.period_value
+ORDER BY runs.entity_id, p.period_type, p.period_value
+ON CONFLICT (horse_id, stat_type, stat_value) DO UPDATE SET
+    runs = excluded.runs,
+    wins = excluded.wins,
+    places = excluded.places,
+    win_percentage = excluded.win_percentage,
+    best_position = excluded.best_position,
+    last_calculated = excluded.last_calculated
+"""
+
+# table, entity column, runs column, insert template, periods
+STATISTICS_TABLES = {
+    "trainer": ("trainer_statistics", "trainer_id", "runs", PEOPLE_SQL, PERIODS_SQL),
+    "jockey": ("jockey_statistics", "jockey_id", "rides", PEOPLE_SQL, PERIODS_SQL),
+    "horse": ("horse_statistics", "horse_id", "runs", HORSE_SQL, HORSE_SPLITS_SQL),
+}
+
+
+def touched_entities(result_rows: Iterable[Dict]) -> Dict[str, Set[str]]:
+    """Trainer, jockey and horse ids appearing in a batch of result rows."""
+    touched = {kind: set() for kind in STATISTICS_TABLES}
+    for row in result_rows:
+        for kind, (_, column, *_rest) in STATISTICS_TABLES.items():
+            if row.get(column):
+                touched[kind].add(row[column])
+    return touched
+
+
+def _rolled_over(db: Session, table: str, column: str, today: date) -> Set[str]:
+    # Entities whose 14-day window was computed on an earlier day: their
+    # oldest runs have dropped out since, even with no new results
+    rows = db.execute(text(
+        f"SELECT DISTINCT {column} FROM {table} "
+        f"WHERE period_type = '14_days' AND last_calculated < :today"
+    ), {"today": today}).all()
+    return {row[0] for row in rows}
+
+
+def refresh_statistics(db: Session, touched: Optional[Dict[str, Set[str]]] = None,
+                       today: Optional[date] = None) -> Dict[str, int]:
+    """
+    Recompute statistics rows, returning how many were written per table.
+
+    With touched, only those trainers, jockeys and horses are recomputed
+    (plus anyone whose 14-day window rolled over since it was computed);
+    without it, every entity is. Rows for periods an entity no longer has
+    any runs in are removed. The caller owns the transaction.
+    """
+    today = today or date.today()
+    now = datetime.utcnow()
+    since = today - timedelta(days=ROLLING_DAYS)
+    counts = {}
+    for kind, (table, column, runs_column, template, periods) in STATISTICS_TABLES.items():
+        params = {"now": now, "since": since}
+        if touched is None:
+            entity_filter = ""
+        else:
+            ids = set(touched.get(kind, ()))
+            if template is PEOPLE_SQL:
+                ids |= _rolled_over(db, table, column, today)
+            if not ids:
+                counts[table] = 0
+                continue
+            entity_filter = f"AND r.{column} = ANY(:ids)"
+            params["ids"] = sorted(ids)
+
+        runs_sql = RUNS_SQL.format(entity=column, entity_filter=entity_filter)
+        statement = template.format(
+            table=table, entity=column, runs=runs_column, runs_sql=runs_sql, periods=periods
+        )
+        counts[table] = db.execute(text(statement), params).rowcount
+
+        # Anything not rewritten above belongs to a period that no longer applies
+        scope = "" if touched is None else f"AND {column} = ANY(:ids)"
+        db.execute(text(f"DELETE FROM {table} WHERE last_calculated < :now {scope}"), params)
+    return counts
+
+
+if __name__ == "__main__":
+    from src.db.database import db_manager, log_message
+
+    log_message("Rebuilding trainer, jockey and horse statistics...")
+    db = db_manager.SessionLocal()
+    try:
+        counts = refresh_statistics(db)
+        db.commit()
+        log_message(f"Statistics rebuilt: {counts}")
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
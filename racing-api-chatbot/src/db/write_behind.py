@@ -0,0 +1,162 @@
+import os
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Normalisation jobs waiting for a worker; submit() drops jobs once it is full
+WRITE_BEHIND_MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "256"))
+WRITE_BEHIND_WORKERS = int(os.getenv("WRITE_BEHIND_WORKERS", "2"))
+# Jobs a worker takes off the queue at once
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "32"))
+
+# Endpoints whose responses are a single list under one key. Queued
+# responses of the same endpoint are concatenated and stored in one go.
+MERGEABLE_ENDPOINTS = {
+    "get_racecards_pro": "racecards",
+    "get_racecards_standard": "racecards",
+    "get_courses": "courses",
+    "get_horse_results": "results",
+    "get_today_results": "results",
+}
+
+# endpoint, response, called once the response is stored
+Job = Tuple[str, Dict[str, Any], Optional[Callable[[], None]]]
+
+
+def merge_jobs(jobs: List[Job]) -> List[Tuple[str, Dict[str, Any], List[Job]]]:
+    """
+    Combine queued responses of list-shaped endpoints, keeping the rest in
+    order. Each write comes with the jobs it covers.
+    """
+    merged: Dict[str, Tuple[str, Dict[str, Any], List[Job]]] = {}
+    batch = []
+    for job in jobs:
+        endpoint, response_data, _ = job
+        key = MERGEABLE_ENDPOINTS.get(endpoint)
+        if key is None:
+            batch.append((endpoint, response_data, [job]))
+        elif endpoint not in merged:
+            merged[endpoint] = (endpoint, {key: list(response_data.get(key, []))}, [job])
+            batch.append(merged[endpoint])
+        else:
+            merged[endpoint][1][key].extend(response_data.get(key, []))
+            merged[endpoint][2].append(job)
+    return batch
+
+
+def _items(endpoint: str, response_data: Dict[str, Any]) -> int:
+    # Records a response carries: the length of its list, or one
+    key = MERGEABLE_ENDPOINTS.get(endpoint)
+    return len(response_data.get(key, [])) if key else 1
+
+
+class WriteBehindQueue:
+    """
+    Bounded queue of API responses waiting to be written to the normalised
+    tables, drained by a small pool of worker threads.
+
+    Producers (the cache warmer, store_cache_entry()) enqueue and return at
+    once, so a slow or retrying normalisation never holds them up. submit()
+    never blocks: when the queue is full the job is dropped and counted, and
+    the tables are filled by the next pipeline run instead. A job may carry
+    a callback, run by the worker once its response is stored.
+
+    Usage:
+        queue = WriteBehindQueue(db_manager)
+        queue.submit("get_courses", response_data)
+    """
+
+    def __init__(self, db_manager, workers: int = WRITE_BEHIND_WORKERS,
+                 max_pending: int = WRITE_BEHIND_MAX_PENDING, batch_size: int = WRITE_BEHIND_BATCH_SIZE):
+        self.db_manager = db_manager
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.jobs: "queue.Queue[Job]" = queue.Queue(maxsize=max_pending)
+        self.counts = {
+            "submitted": 0, "dropped": 0, "batches": 0,
+            "jobs_stored": 0, "items_stored": 0, "jobs_failed": 0,
+        }
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+
+    def _start(self) -> None:
+        # Workers start on first use, so processes that never submit
+        # (the pipeline, migrations) run no extra threads
+        with self._lock:
+            if self._threads:
+                return
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"write-behind-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def submit(self, endpoint: str, response_data: Dict[str, Any],
+               on_stored: Optional[Callable[[], None]] = None) -> bool:
+        """Queue a response for normalisation; False if it was dropped because the queue is full."""
+        self._start()
+        try:
+            self.jobs.put_nowait((endpoint, response_data, on_stored))
+        except queue.Full:
+            with self._lock:
+                self.counts["dropped"] += 1
+            print(f"Write-behind queue full, dropped normalisation of {endpoint}")
+            return False
+        with self._lock:
+            self.counts["submitted"] += 1
+        return True
+
+    def _work(self) -> None:
+        while True:
+            jobs = [self.jobs.get()]
+            while len(jobs) < self.batch_size:
+                try:
+                    jobs.append(self.jobs.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._store(jobs)
+            finally:
+                for _ in jobs:
+                    self.jobs.task_done()
+
+    def _store(self, jobs: List[Job]) -> None:
+        db = self.db_manager.SessionLocal()
+        try:
+            for endpoint, response_data, covered in merge_jobs(jobs):
+                try:
+                    self.db_manager.store_api_response(db, endpoint, response_data)
+                except Exception as e:
+                    db.rollback()
+                    print(f"Error normalising queued {endpoint} response: {str(e)}")
+                    with self._lock:
+                        self.counts["jobs_failed"] += len(covered)
+                    continue
+                with self._lock:
+                    self.counts["jobs_stored"] += len(covered)
+                    self.counts["items_stored"] += _items(endpoint, response_data)
+                for _, _, on_stored in covered:
+                    if on_stored is None:
+                        continue
+                    try:
+                        on_stored()
+                    except Exception as e:
+                        print(f"Error after storing queued {endpoint} response: {str(e)}")
+        finally:
+            db.close()
+        with self._lock:
+            self.counts["batches"] += 1
+
+    def drain(self, timeout: float = 30) -> bool:
+        """Wait up to timeout seconds for queued jobs to be stored; True if the queue emptied."""
+        deadline = time.monotonic() + timeout
+        while self.jobs.unfinished_tasks:
+            if time.monotonic() >= deadline:
+                return False
+            time.sleep(0.1)
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        """Queue depth and job counters for monitoring."""
+        with self._lock:
+            return {"pending": self.jobs.qsize(), "workers": len(self._threads), **self.counts}
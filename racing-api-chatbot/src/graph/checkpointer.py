@@ -0,0 +1,80 @@
+import os
+import threading
+from collections import OrderedDict
+
+from langgraph.checkpoint.memory import MemorySaver
+
+# Conversations kept in memory, least recently used dropped first
+CHECKPOINT_MAX_THREADS = int(os.getenv("CHECKPOINT_MAX_THREADS", "500"))
+# Checkpoints kept per conversation; only the latest is needed to continue it
+CHECKPOINT_KEEP_PER_THREAD = int(os.getenv("CHECKPOINT_KEEP_PER_THREAD", "2"))
+
+
+class PrunedMemorySaver(MemorySaver):
+    """
+    In-memory checkpointer that doesn't grow for the life of the process.
+
+    MemorySaver keeps every checkpoint of every thread, and a new checkpoint
+    is written after each node of each turn. This one keeps the latest few
+    checkpoints of each thread, drops the channel values only older ones
+    referenced, and forgets the least recently used threads.
+    """
+
+    def __init__(self, max_threads: int = CHECKPOINT_MAX_THREADS, keep_per_thread: int = CHECKPOINT_KEEP_PER_THREAD):
+        super().__init__()
+        self.max_threads = max_threads
+        self.keep_per_thread = max(1, keep_per_thread)
+        self.threads: "OrderedDict[str, None]" = OrderedDict()
+        self.evicted = 0
+        self._lock = threading.Lock()
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        with self._lock:
+            next_config = super().put(config, checkpoint, metadata, new_versions)
+            thread_id = config["configurable"]["thread_id"]
+            self._prune(thread_id, config["configurable"]["checkpoint_ns"])
+            self.threads[thread_id] = None
+            self.threads.move_to_end(thread_id)
+            while len(self.threads) > self.max_threads:
+                oldest, _ = self.threads.popitem(last=False)
+                super().delete_thread(oldest)
+                self.evicted += 1
+        return next_config
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        with self._lock:
+            super().put_writes(config, writes, task_id, task_path)
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            super().delete_thread(thread_id)
+            self.threads.pop(thread_id, None)
+
+    def _prune(self, thread_id: str, checkpoint_ns: str) -> None:
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        # Checkpoint ids sort in creation order
+        stale = sorted(checkpoints)[:-self.keep_per_thread]
+        if not stale:
+            return
+        dropped = set()
+        for checkpoint_id in stale:
+            dropped.update(self._channel_versions(checkpoints.pop(checkpoint_id)))
+            self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+
+        # Keep the channel values the remaining checkpoints still point at
+        for saved in checkpoints.values():
+            dropped.difference_update(self._channel_versions(saved))
+        for channel, version in dropped:
+            self.blobs.pop((thread_id, checkpoint_ns, channel, version), None)
+
+    def _channel_versions(self, saved):
+        return self.serde.loads_typed(saved[0]).get("channel_versions", {}).items()
+
+    def stats(self):
+        """Checkpoint storage counters for monitoring."""
+        return {
+            "threads": len(self.threads),
+            "evicted_threads": self.evicted,
+            "checkpoints": sum(len(ns) for thread in self.storage.values() for ns in thread.values()),
+            "blobs": len(self.blobs),
+        }
@@ -1,6 +1,6 @@
+import asyncio
 import json
-import time
-from typing import Dict, List, Any
+from typing import Dict, Any
 
 from langchain_core.messages import ToolMessage
 from langchain_core.runnables import RunnableConfig
@@ -10,136 +10,123 @@ from src.graph.complex_query_agent.chains import (
     COMPLEX_QUERY_ANALYSIS_CHAIN,
     COMPLEX_QUERY_EXECUTION_CHAIN
 )
-from src.utils.cached_api_client import CachedRaceAPIClient
+from src.graph.simple_query_agent.nodes import execute_query_params
+from src.utils.context import get_database_context
+from src.utils.form_analysis import analyse_entities, without_figures
 from src.db.database import db_manager
 
-# Rate limiting constants
-RATE_LIMIT_DELAY = 1.0  # 1 second delay between API calls
+# Retry constants for the LLM calls
+RETRY_DELAY = 1.0  # seconds, doubled on each retry
 MAX_RETRIES = 3
-CHUNK_SIZE = 5  # Process data in chunks of 5 items
 
-def chunk_data(data: List[Any], chunk_size: int) -> List[List[Any]]:
-    """Split data into chunks of specified size."""
-    return [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+async def _ainvoke_with_retries(chain, inputs: Dict[str, Any]) -> Dict[str, Any]:
+    """Invoke a JSON chain, backing off exponentially between failed attempts."""
+    retries = 0
+    while True:
+        try:
+            response = await chain.ainvoke(inputs)
+            return response if isinstance(response, dict) else json.loads(response)
+        except Exception:
+            retries += 1
+            if retries == MAX_RETRIES:
+                raise
+            await asyncio.sleep(RETRY_DELAY * (2 ** retries))
 
-def complex_query_handler_node(
+async def complex_query_handler_node(
     state: Dict[str, Any], writer: StreamWriter, config: RunnableConfig
 ) -> Command:
     """Handle complex analytical queries by breaking them down into steps and executing them."""
     print("In Complex Query Handler node")
     
     try:
-        # Initialize API client
-        api_client = CachedRaceAPIClient(cache_ttl_hours=24)
-        
-        # Read API client context
-        with open("src/utils/api_client.py", "r") as file:
-            context = file.read()
+        # Get database context (for the LLM)
+        context = get_database_context()
         
         # Step 1: Analyze the query and create an analysis plan
-        analysis_response = COMPLEX_QUERY_ANALYSIS_CHAIN.invoke({
+        analysis_plan = await _ainvoke_with_retries(COMPLEX_QUERY_ANALYSIS_CHAIN, {
             "query": state["input"],
             "context": context
         })
         
         print("*" * 100)
         print("ANALYSIS PLAN")
-        print(analysis_response)
-        
-        # Parse the analysis plan
-        analysis_plan = json.loads(analysis_response.content)
+        print(analysis_plan)
         
-        # Step 2: Execute each step of the analysis plan with rate limiting
+        # Step 2: Read the data each step of the plan needs. Every table
+        # request is run as a single-table payload, on the async connection
+        # so the event loop is never blocked.
         collected_data = {}
         
-        for step in analysis_plan["analysis_steps"]:
-            step_data = {}
-            
-            # Collect required data for this step
-            for data_req in step["required_data"]:
-                func_name = data_req["function"]
-                params = data_req.get("parameters", {})
-                filters = data_req.get("filters", {})
+        async with db_manager.AsyncSessionLocal() as db:
+            for step in analysis_plan.get("analysis_steps", []):
+                step_data = {}
+                
+                for data_req in step.get("required_data", []):
+                    table_name = data_req.get("table")
+                    filters = data_req.get("filters") or {}
+                    if table_name not in context["tables"]:
+                        step_data[table_name] = {"error": f"Unknown table {table_name}"}
+                        continue
+                    try:
+                        query_response = await db.run_sync(
+                            execute_query_params, {"filters": {table_name: filters}, "content": []}, context
+                        )
+                        step_data[table_name] = query_response.get(table_name, [])
+                    except Exception as e:
+                        print(f"Error reading {table_name}: {str(e)}")
+                        step_data[table_name] = {"error": str(e)}
+                        await db.rollback()
                 
-                # Get the method from the API client
-                func = getattr(api_client, func_name, None)
-                if callable(func):
-                    retries = 0
-                    while retries < MAX_RETRIES:
-                        try:
-                            # Execute the API call with filters
-                            result = func(**params, filters=filters)
-                            
-                            # If result is a list, process in chunks
-                            if isinstance(result, list):
-                                chunks = chunk_data(result, CHUNK_SIZE)
-                                processed_chunks = []
-                                for chunk in chunks:
-                                    # Add rate limiting delay between chunks
-                                    time.sleep(RATE_LIMIT_DELAY)
-                                    processed_chunks.extend(chunk)
-                                result = processed_chunks
-                            
-                            step_data[func_name] = result
-                            break
-                        except Exception as e:
-                            retries += 1
-                            if retries == MAX_RETRIES:
-                                print(f"Error executing {func_name} after {MAX_RETRIES} retries: {str(e)}")
-                                step_data[func_name] = {"error": str(e)}
-                            else:
-                                # Exponential backoff
-                                time.sleep(RATE_LIMIT_DELAY * (2 ** retries))
-                                continue
+                collected_data[f"step_{step.get('step')}"] = step_data
             
-            collected_data[f"step_{step['step']}"] = step_data
-        
-        # Step 3: Execute the analysis and generate insights with rate limiting
-        execution_response = None
-        retries = 0
-        while retries < MAX_RETRIES:
+            # Step 3: Precompute form figures for every horse, trainer and jockey
+            # the collected data mentions, so the model narrates numbers instead
+            # of calculating them from raw rows
             try:
-                execution_response = COMPLEX_QUERY_EXECUTION_CHAIN.invoke({
-                    "query": state["input"],
-                    "analysis_plan": analysis_plan,
-                    "data": collected_data
-                })
-                break
+                form_analysis = await db.run_sync(analyse_entities, collected_data)
             except Exception as e:
-                retries += 1
-                if retries == MAX_RETRIES:
-                    raise e
-                time.sleep(RATE_LIMIT_DELAY * (2 ** retries))
+                print(f"Error computing form analysis: {str(e)}")
+                form_analysis = None
+                await db.rollback()
+        
+        if form_analysis and any(form_analysis.values()):
+            # Figures come from the analysis; the collected rows still carry
+            # the names, dates, courses and going the figures don't
+            execution_data = {"form_analysis": form_analysis, "context": without_figures(collected_data)}
+        else:
+            execution_data = collected_data
+
+        # Step 4: Execute the analysis and generate insights
+        execution_results = await _ainvoke_with_retries(COMPLEX_QUERY_EXECUTION_CHAIN, {
+            "query": state["input"],
+            "analysis_plan": analysis_plan,
+            "data": json.dumps(execution_data, default=str)
+        })
         
         print("*" * 100)
         print("EXECUTION RESULTS")
-        print(execution_response)
+        print(execution_results)
         
-        # Parse the execution results
-        execution_results = json.loads(execution_response.content)
-        
-        # Step 4: Create a serializable response
+        # Step 5: Create a serializable response
         serialized_response = {
             "content": execution_results,
             "type": "complex_analysis_response",
             "analysis_plan": analysis_plan,
-            "collected_data": collected_data
+            "collected_data": collected_data,
+            "form_analysis": form_analysis
         }
         
-        # Step 5: Store in chat history
-        db = db_manager.SessionLocal()
-        try:
-            db_manager.save_chat_history(
+        # Step 6: Store in chat history
+        async with db_manager.AsyncSessionLocal() as db:
+            await db_manager.asave_chat_history(
                 db=db,
                 thread_id=state.get("thread_id"),
                 user_key=state.get("user_key"),
                 query=state["input"],
                 response=serialized_response
             )
-        finally:
-            db.close()
         
-        # Step 6: Return command to move to human facing response
+        # Step 7: Return command to move to human facing response
         return Command(
             update={
                 "messages": [
@@ -167,17 +154,17 @@ def complex_query_handler_node(
         }
         
         # Store error in chat history
-        db = db_manager.SessionLocal()
-        try:
-            db_manager.save_chat_history(
-                db=db,
-                thread_id=state.get("thread_id"),
-                user_key=state.get("user_key"),
-                query=state["input"],
-                response=serialized_error
-            )
-        finally:
-            db.close()
+        async with db_manager.AsyncSessionLocal() as db:
+            try:
+                await db_manager.asave_chat_history(
+                    db=db,
+                    thread_id=state.get("thread_id"),
+                    user_key=state.get("user_key"),
+                    query=state["input"],
+                    response=serialized_error
+                )
+            except Exception as e:
+                print(f"Error saving chat history: {str(e)}")
 
         return Command(
             update={
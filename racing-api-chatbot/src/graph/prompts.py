@@ -1,25 +1,13 @@
 from langchain.prompts import PromptTemplate
 
-# Query Validation Chain Prompt
-QUERY_VALIDATION_PROMPT = PromptTemplate(
+# Query Qualifier Chain Prompt
+QUERY_QUALIFIER_PROMPT = PromptTemplate(
     input_variables=["query"],
-    template="""You are a racing expert assistant. Your task is to determine if a query is related to horse racing or not.
+    template="""You are a racing expert assistant. Your task is to determine if a query is related to horse racing and, if it is, classify it into a 'simple' or 'complex' category.
 
 Query: {query}
 
-Analyze the query and respond with only 'yes' or 'no' based on whether it is related to horse racing.
-- Respond with 'yes' if the query is about horse racing, racing data, horses, jockeys, races, or betting.
-- Respond with 'no' if the query is about anything else.
-
-Response:"""
-)
-
-# Query Classifier Chain Prompt
-QUERY_CLASSIFIER_PROMPT = PromptTemplate(
-    input_variables=["query"],
-    template="""You are a racing expert assistant. Your task is to classify racing-related queries into 'simple' or 'complex' categories.
-
-Query: {query}
+A query is related to horse racing if it is about horse racing, racing data, horses, jockeys, races, or betting. Anything else is not related.
 
 A simple query is one that can be answered with a single database query or a small set of related queries. Examples:
 - "Show me today's races at Aintree"
@@ -31,10 +19,11 @@ A complex query requires multiple database queries and data analysis. Examples:
 - "Compare the performance of horses A and B"
 - "Analyze the winning patterns of jockey X"
 
-Classify the query and respond in this exact format:
+Analyze the query and respond in this exact format:
 {{
-    "next_node": "simple" or "complex",
-    "reasoning": "Brief explanation of why the query is simple or complex"
+    "is_racing_query": true or false,
+    "next_node": "simple" or "complex" (use "none" if the query is not related to horse racing),
+    "reasoning": "Brief explanation of the decision"
 }}
 
 Response:"""
@@ -342,6 +331,8 @@ Analysis Plan:
 Available Data:
 {data}
 
+When the data contains "form_analysis", its figures (runs, wins, places, strike_rate, place_rate, ae, pl, roi, rating trends) are already computed from the full results history. Quote them as given; do not recompute, estimate or invent numbers. "context" then holds the collected records with their numbers removed; use it for names, dates, courses, going and other details. If form_analysis has "truncated", say in limitations how many horses, trainers or jockeys were left out of the analysis.
+
 Execute the analysis and generate insights. Respond in this exact format:
 {{
     "insights": [
@@ -380,6 +371,7 @@ Rules:
 5. Suggest appropriate visualizations
 6. Acknowledge limitations
 7. Focus on answering the original query
+8. Never do arithmetic on the data; every number you state must appear in it
 
 Response:"""
 ) 
\ No newline at end of file
@@ -0,0 +1,251 @@
+import re
+import time
+import asyncio
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from src.db.database import db_manager
+from src.db.models import Course, Horse, Jockey, Trainer
+
+# How long the in-memory name index is trusted before it is reloaded
+ENTITY_INDEX_TTL_SECONDS = 900
+
+# Longest entity name (in words) looked up when scanning a query
+MAX_NAME_WORDS = 6
+
+RESULT_FIELDS = ["result_id", "race_id", "horse_id", "position", "sp", "sp_dec", "jockey_id", "trainer_id"]
+RUNNER_FIELDS = ["runner_id", "race_id", "horse_id", "jockey_id", "trainer_id", "number", "draw", "form", "ofr", "rpr"]
+ODDS_FIELDS = ["odds_id", "race_id", "horse_id", "bookmaker", "fractional", "decimal", "updated"]
+HORSE_FIELDS = ["horse_id", "horse"]
+
+
+def normalize_name(name: str) -> str:
+    """Lower-case a name and strip region suffixes such as '(IRE)', possessives and punctuation."""
+    name = re.sub(r"\([^)]*\)", " ", name.lower())
+    name = re.sub(r"'s\b", "", name)
+    name = re.sub(r"[^a-z0-9' ]+", " ", name)
+    return " ".join(name.replace("'", "").split())
+
+
+class EntityIndex:
+    """In-memory name -> id index over courses, horses, jockeys and trainers."""
+
+    def __init__(self, ttl_seconds: int = ENTITY_INDEX_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self.names: Dict[str, Dict[str, List[str]]] = {}
+        self.display_names: Dict[str, Dict[str, str]] = {}
+        self.loaded_at = 0.0
+        self._lock = asyncio.Lock()
+
+    def _load(self, db: Session) -> Tuple[Dict[str, Dict[str, List[str]]], Dict[str, Dict[str, str]]]:
+        names, display_names = {}, {}
+        for kind, id_column, name_column in (
+            ("course", Course.course_id, Course.course),
+            ("horse", Horse.horse_id, Horse.horse),
+            ("jockey", Jockey.jockey_id, Jockey.jockey),
+            ("trainer", Trainer.trainer_id, Trainer.trainer),
+        ):
+            kind_names, kind_display_names = {}, {}
+            for entity_id, entity_name in db.execute(select(id_column, name_column)):
+                if entity_name:
+                    kind_names.setdefault(normalize_name(entity_name), []).append(entity_id)
+                    kind_display_names[entity_id] = entity_name
+            names[kind] = kind_names
+            display_names[kind] = kind_display_names
+        return names, display_names
+
+    async def ensure_loaded(self) -> None:
+        """Load or refresh the index if it is older than its TTL."""
+        if time.monotonic() - self.loaded_at < self.ttl_seconds:
+            return
+        async with self._lock:
+            if time.monotonic() - self.loaded_at < self.ttl_seconds:
+                return
+            async with db_manager.AsyncSessionLocal() as db:
+                self.names, self.display_names = await db.run_sync(self._load)
+            self.loaded_at = time.monotonic()
+            print(f"Entity index loaded: { {kind: len(v) for kind, v in self.names.items()} }")
+
+    def find(self, kind: str, text: str) -> Optional[Tuple[str, str]]:
+        """Find the longest unambiguous entity name of a kind in normalized text."""
+        kind_names = self.names.get(kind, {})
+        words = text.split()
+        for size in range(min(MAX_NAME_WORDS, len(words)), 0, -1):
+            for start in range(len(words) - size + 1):
+                candidate = " ".join(words[start:start + size])
+                ids = kind_names.get(candidate)
+                if ids:
+                    # Ambiguous names (e.g. two courses called Newcastle) go to the LLM
+                    return (ids[0], candidate) if len(ids) == 1 else None
+        return None
+
+    def find_all(self, words: List[str]) -> List[Tuple[int, int, str, str]]:
+        """
+        Find every unambiguous entity name in a list of words.
+
+        Returns non-overlapping (start, end, kind, id) matches, preferring the
+        longest name. Names shared by several entities, or by entities of
+        different kinds, are skipped.
+        """
+        matches = []
+        taken = set()
+        for size in range(min(MAX_NAME_WORDS, len(words)), 0, -1):
+            for start in range(len(words) - size + 1):
+                span = range(start, start + size)
+                if taken.intersection(span):
+                    continue
+                candidate = " ".join(words[start:start + size])
+                found = [
+                    (kind, ids) for kind, kind_names in self.names.items()
+                    for ids in [kind_names.get(candidate)] if ids
+                ]
+                if not found:
+                    continue
+                # Claim the words even when ambiguous so a shorter name inside
+                # them isn't picked up instead
+                taken.update(span)
+                if len(found) == 1 and len(found[0][1]) == 1:
+                    matches.append((start, start + size, found[0][0], found[0][1][0]))
+        return sorted(matches)
+
+
+entity_index = EntityIndex()
+
+
+# Dates the fast path can't resolve: years, months, weekdays, spans such as
+# "last week" and explicit dates like 12/05 or 2024-05-12
+OTHER_DATE_WORDS = re.compile(
+    r"\b((19|20)\d{2}|january|february|march|april|may|june|july|august|september|october|november|december"
+    r"|jan|feb|mar|apr|jun|jul|aug|sep|sept|oct|nov|dec"
+    r"|monday|tuesday|wednesday|thursday|friday|saturday|sunday|weekend|fortnight|season"
+    r"|(last|next|this|past|previous) (week|month|year|night|time|few|\d+)|ago|since|until|recent|recently"
+    r"|\d{1,2}(st|nd|rd|th))\b"
+)
+EXPLICIT_DATE = re.compile(r"\b\d{1,4}[/-]\d{1,2}([/-]\d{2,4})?\b")
+
+
+def _resolve_date(text: str, query: str) -> Optional[str]:
+    """Date of today, yesterday or tomorrow, or None if the query names any other date."""
+    if OTHER_DATE_WORDS.search(text) or EXPLICIT_DATE.search(query):
+        return None
+    today = date.today()
+    if "yesterday" in text:
+        return (today - timedelta(days=1)).isoformat()
+    if "tomorrow" in text:
+        return (today + timedelta(days=1)).isoformat()
+    return today.isoformat()
+
+
+def _resolve_off_time(text: str) -> Optional[str]:
+    match = re.search(r"\b(\d{1,2})[:.](\d{2})\b", text)
+    if not match:
+        return None
+    hour, minute = int(match.group(1)), match.group(2)
+    # Off times are stored on a 12-hour clock, e.g. '3:30' for 15:30
+    if hour > 12:
+        hour -= 12
+    return f"{hour}:{minute}"
+
+
+def match_fast_path(query: str, index: EntityIndex = entity_index) -> Optional[Dict[str, Any]]:
+    """
+    Build a PAYLOAD_GENERATOR_CHAIN-style payload for well-known query shapes.
+
+    Returns None when the query doesn't match a known pattern, an entity
+    can't be resolved unambiguously or the query mentions a date other than
+    today, yesterday or tomorrow, in which case the LLM route is used.
+    """
+    text = normalize_name(query)
+    race_date = _resolve_date(text, query)
+    if race_date is None:
+        return None
+    off_time = _resolve_off_time(query)
+
+    # "odds for <horse>"
+    if re.search(r"\b(odds|price|prices)\b", text):
+        horse = index.find("horse", text)
+        if horse:
+            return {
+                "filters": {
+                    "Horse": {"horse_id": horse[0], "sort": ["horse", "asc"], "limit": 1, "fields": HORSE_FIELDS},
+                    "Odds": {
+                        "horse_id": horse[0],
+                        "is_current": True,
+                        "sort": ["bookmaker", "asc"],
+                        "limit": 50,
+                        "fields": ODDS_FIELDS,
+                    },
+                },
+                "content": [],
+            }
+
+    # "runners in the 3:30 at <course>"
+    if re.search(r"\b(runners|runner|field|card|racecard|declared)\b", text):
+        course = index.find("course", text)
+        if course and off_time:
+            return {
+                "filters": {
+                    "Runner": {
+                        "course_id": course[0],
+                        "date": {"range": [race_date, race_date]},
+                        "off_time": {"contains": off_time},
+                        "sort": ["number", "asc"],
+                        "limit": 40,
+                        "fields": RUNNER_FIELDS,
+                    },
+                },
+                "content": [],
+            }
+
+    # "results at <course> today"
+    if re.search(r"\b(results?|won|winners?|who won)\b", text):
+        course = index.find("course", text)
+        if course:
+            result_filters = {
+                "course_id": course[0],
+                "date": {"range": [race_date, race_date]},
+                "sort": ["position", "asc"],
+                "limit": 100,
+                "fields": RESULT_FIELDS,
+            }
+            if off_time:
+                result_filters["off_time"] = {"contains": off_time}
+            return {"filters": {"Result": result_filters}, "content": []}
+
+        # "results for <horse>"
+        horse = index.find("horse", text)
+        if horse:
+            return {
+                "filters": {
+                    "Result": {
+                        "horse_id": horse[0],
+                        "sort": ["date", "desc"],
+                        "limit": 10,
+                        "fields": RESULT_FIELDS,
+                    },
+                },
+                "content": [],
+            }
+
+    # "rides for <jockey> today" / "runners for <trainer> today"
+    if re.search(r"\b(rides|riding|mounts|runners|running|today|tomorrow)\b", text):
+        for kind in ("jockey", "trainer"):
+            entity = index.find(kind, text)
+            if entity:
+                return {
+                    "filters": {
+                        "Runner": {
+                            f"{kind}_id": entity[0],
+                            "date": {"range": [race_date, race_date]},
+                            "sort": ["race_id", "asc"],
+                            "limit": 40,
+                            "fields": RUNNER_FIELDS,
+                        },
+                    },
+                    "content": [],
+                }
+
+    return None
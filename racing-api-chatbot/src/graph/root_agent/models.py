@@ -1,6 +1,6 @@
 import operator
 
-from typing import Annotated, List, Literal, Sequence, Tuple, TypedDict, Union
+from typing import Annotated, Any, Dict, List, Literal, Optional, Sequence, Tuple, TypedDict, Union
 
 
 from langchain_core.messages import BaseMessage
@@ -57,8 +57,11 @@ class PlanExecute(TypedDict):
     input: str
     plan: List[str]
     original_plan: List[str]
-    past_steps: Annotated[List[Tuple], operator.add]
+    # Per-turn: replaced, not accumulated, so a thread's history doesn't
+    # pile up in the checkpointer
+    past_steps: List[Tuple]
     response: str
+    query_params: Optional[Dict[str, Any]]
     messages: Annotated[Sequence[BaseMessage], add_messages]
     debug_messages: Annotated[Sequence[BaseMessage], add_messages]
     token_details: List
@@ -99,5 +102,7 @@ class GroupExtractInput(BaseModel):
 
 #----------------------------------------------------------
 
-class QueryClassifierResponse(BaseModel):
-    next_node: str = Field(description="Simple or complex node to move to")
\ No newline at end of file
+class QueryQualifierResponse(BaseModel):
+    is_racing_query: bool = Field(description="Whether the query is related to horse racing")
+    next_node: str = Field(description="Simple or complex node to move to, none if not a racing query")
+    reasoning: str = Field(description="Brief explanation of the decision")
\ No newline at end of file
@@ -1,45 +1,139 @@
 import json
 from typing import Literal, Dict, Any
 
-from langgraph.types import Command
+from langgraph.graph import END
+from langgraph.types import Command, StreamWriter
 from langchain_core.messages import ToolMessage
 
 from src.graph.root_agent.chains import (
-    QUERY_VALIDATION_CHAIN,
-    HUMAN_FACING_RESPONSE_CHAIN,
-    QUERY_CLASSIFER_CHAIN
+    QUERY_QUALIFIER_CHAIN,
+    HUMAN_FACING_RESPONSE_CHAIN
 )
 
 from src.graph.root_agent.models import PlanExecute, Response
+from src.graph.root_agent.fast_path import entity_index, match_fast_path
+from src.utils.answer_cache import answer_cache
 from src.db.database import db_manager
 from src.db.database import init_db
 
+# Nodes whose ToolMessage holds this turn's data; only answers built on
+# their output are worth caching
+ANSWER_SOURCES = ("simple_query_handler_node", "cached_query_handler_node", "complex_query_handler_node")
 
-def qualify_queries_node(
-    state: PlanExecute
-) -> Command[Literal["human_facing_response"]]:
+
+async def answer_cache_node(
+    state: PlanExecute, writer: StreamWriter
+) -> Command[Literal["fast_path_router", "__end__"]]:
+    print("in answer cache node")
+
+    try:
+        cached_response = await answer_cache.lookup(state["input"])
+    except Exception as e:
+        print(f"Error reading answer cache: {str(e)}")
+        cached_response = None
+
+    if cached_response:
+        print("Answer cache hit: ", answer_cache.stats())
+        writer(
+            {
+                "response": f"user - Answered from cache - {state['input']}",
+                "type": "thinking_message",
+            }
+        )
+        return Command(
+                update={"response": cached_response, "query_params": None},
+                goto=END,
+            )
+
+    return Command(update={}, goto="fast_path_router")
+
+
+async def fast_path_router_node(
+    state: PlanExecute, writer: StreamWriter
+) -> Command[Literal["simple_query_handler", "qualify_queries", "__end__"]]:
+    print("in fast path router node")
+
+    # Recognise well-known query shapes and build the database payload
+    # directly, skipping the qualifier and payload generator LLM calls
+    try:
+        await entity_index.ensure_loaded()
+        query_params = match_fast_path(state["input"])
+    except Exception as e:
+        print(f"Error in fast path router: {str(e)}")
+        query_params = None
+
+    if query_params:
+        print("Fast path payload: ", query_params)
+        writer(
+            {
+                "response": f"user - Matched a known query pattern - {state['input']}",
+                "type": "thinking_message",
+            }
+        )
+        return Command(
+                update={
+                    "messages": [],
+                    "debug_messages": [],
+                    "query_params": query_params,
+                },
+                goto="simple_query_handler",
+            )
+
+    # Only now try a semantic answer cache match; it costs an embeddings call
+    try:
+        cached_response = await answer_cache.lookup_similar(state["input"])
+    except Exception as e:
+        print(f"Error reading answer cache: {str(e)}")
+        cached_response = None
+
+    if cached_response:
+        print("Answer cache semantic hit: ", answer_cache.stats())
+        writer(
+            {
+                "response": f"user - Answered from cache - {state['input']}",
+                "type": "thinking_message",
+            }
+        )
+        return Command(
+                update={"response": cached_response, "query_params": None},
+                goto=END,
+            )
+
+    # Clear any payload left in the thread state by a previous turn
+    return Command(
+            update={"query_params": None},
+            goto="qualify_queries",
+        )
+
+
+async def qualify_queries_node(
+    state: PlanExecute, writer: StreamWriter
+) -> Command[Literal["simple_query_handler", "complex_query_handler", "human_facing_response"]]:
     print("in qualify queries node")
     
     print("State: ", state)
 
-    print(
+    writer(
         {
             "response": f"user - User has given me a query - {state['input']}",
             "type": "thinking_message",
         }
     )
 
-    qualify_query_response = QUERY_VALIDATION_CHAIN.invoke(
+    # Relevance check and simple/complex routing in a single LLM round-trip
+    response = await QUERY_QUALIFIER_CHAIN.ainvoke(
         {
             "query": state["input"],
         }
     )
 
-    print("Response: ", qualify_query_response)
+    print("Qualifier Response: ", response)
+
+    is_racing_query = str(response.get("is_racing_query", "")).lower() in ("true", "yes")
 
-    if str(qualify_query_response).lower() == 'no':
+    if not is_racing_query:
         latest_message = ToolMessage(
-                content=json.dumps({"query": qualify_query_response}),
+                content=json.dumps({"query": "no"}),
                 name="general_queries",
                 tool_call_id="qualify_queries_node",
             )
@@ -52,17 +146,9 @@ def qualify_queries_node(
                 goto="human_facing_response",
             )
         
-    elif str(qualify_query_response).lower() == 'yes':
-        response = QUERY_CLASSIFER_CHAIN.invoke(
-            {
-            "query" : state["input"]
-            }
-        )
-        
-        print("Classifier Response: ", response)
-        
+    else:
         # Handle dictionary response
-        next_node = response.get("next_node", "").lower()
+        next_node = str(response.get("next_node", "")).lower()
         if next_node == "simple":
             return Command(
                     update={
@@ -99,7 +185,7 @@ def qualify_queries_node(
 
 
 
-def human_facing_response_node(state: Dict[str, Any]) -> Dict[str, Any]:
+async def human_facing_response_node(state: Dict[str, Any]) -> Dict[str, Any]:
     try:
         print("*" * 100)
         print("in human facing response node")
@@ -140,11 +226,17 @@ def human_facing_response_node(state: Dict[str, Any]) -> Dict[str, Any]:
                         
                         if has_valid_data:
                             # Generate human-readable response for the entire data
-                            final_user_facing_response = HUMAN_FACING_RESPONSE_CHAIN.invoke({
+                            final_user_facing_response = await HUMAN_FACING_RESPONSE_CHAIN.ainvoke({
                                 "query": original_query,
                                 "content": json.dumps(message_content)
                             })
                             
+                            if last_message.tool_call_id in ANSWER_SOURCES:
+                                try:
+                                    await answer_cache.store(original_query, final_user_facing_response)
+                                except Exception as e:
+                                    print(f"Error writing answer cache: {str(e)}")
+                            
                 except json.JSONDecodeError:
                     pass
         
@@ -165,24 +257,18 @@ def human_facing_response_node(state: Dict[str, Any]) -> Dict[str, Any]:
         
         print({"response": final_user_facing_response, "type": "user_facing_message"})
         
-        # Get database session without initializing
-        db = db_manager.SessionLocal()
-        try:
+        async with db_manager.AsyncSessionLocal() as db:
             # Store chat history with serialized response
             try:
-                db_manager.save_chat_history(
+                await db_manager.asave_chat_history(
                     db=db,
                     thread_id=state.get("thread_id"),
                     user_key=state.get("user_key"),
                     query=original_query,
                     response=serialized_response
                 )
-                db.commit()  # Commit the transaction
             except Exception as e:
                 print(f"Error saving chat history: {str(e)}")
-                db.rollback()  # Rollback on error
-        finally:
-            db.close()
         
         return {
             "response": final_user_facing_response,
@@ -203,24 +289,18 @@ def human_facing_response_node(state: Dict[str, Any]) -> Dict[str, Any]:
             "type": "error_message"
         }
         
-        # Get database session without initializing
-        db = db_manager.SessionLocal()
-        try:
+        async with db_manager.AsyncSessionLocal() as db:
             # Store error in chat history
             try:
-                db_manager.save_chat_history(
+                await db_manager.asave_chat_history(
                     db=db,
                     thread_id=state.get("thread_id"),
                     user_key=state.get("user_key"),
                     query=original_query,
                     response=serialized_error
                 )
-                db.commit()  # Commit the transaction
             except Exception as e:
                 print(f"Error saving chat history: {str(e)}")
-                db.rollback()  # Rollback on error
-        finally:
-            db.close()
         
         return {
             "response": error_response,
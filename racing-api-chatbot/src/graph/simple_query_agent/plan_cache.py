@@ -0,0 +1,217 @@
+import os
+import re
+import copy
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.graph.root_agent.fast_path import EntityIndex, entity_index, normalize_name
+
+PLAN_CACHE_MAX_ENTRIES = int(os.getenv("PLAN_CACHE_MAX_ENTRIES", "500"))
+
+# Dates written in a question: ISO (2024-05-01) or UK style (01/05/2024)
+DATE_PATTERN = re.compile(r"\b(\d{4}-\d{2}-\d{2}|\d{1,2}/\d{1,2}/\d{4})\b")
+ISO_DATE_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+# Slot markers left in a cached payload, e.g. '{{horse_0.id}}', '{{date_0}}', '{{today-7}}'
+SLOT_PATTERN = re.compile(r"^\{\{(\w+?)(?:\.(id|name))?\}\}$")
+TODAY_PATTERN = re.compile(r"^\{\{today([+-]\d+)\}\}$")
+
+# Words that tie a question's dates to the day it is asked. Only these let a
+# plan store its dates as offsets from today; "in June" or "3rd May" don't.
+RELATIVE_DATE_WORDS = re.compile(
+    r"\b(today|tonight|yesterday|tomorrow|(last|past|next) \d+ days|\d+ days ago)\b"
+)
+WEEKDAY_WORDS = re.compile(r"\b(monday|tuesday|wednesday|thursday|friday|saturday|sunday)\b")
+
+
+def _to_iso(text: str) -> Optional[str]:
+    for fmt in ("%Y-%m-%d", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+def template_query(query: str, index: EntityIndex = entity_index) -> Tuple[str, Dict[str, Dict[str, str]]]:
+    """
+    Replace the dates and known entity names in a question with numbered slots.
+
+    "Results for Frankel on 2024-05-01" becomes "results for {horse_0} on
+    {date_0}", with the horse id and the ISO date returned as slot values.
+    """
+    slots = {}
+    words = []
+    for i, part in enumerate(DATE_PATTERN.split(query)):
+        if i % 2:
+            iso_date = _to_iso(part)
+            if iso_date:
+                slot = f"date_{sum(name.startswith('date_') for name in slots)}"
+                slots[slot] = {"value": iso_date}
+                words.append("{" + slot + "}")
+                continue
+        words.extend(normalize_name(part).split())
+
+    counts = {}
+    template_words = []
+    position = 0
+    for start, end, kind, entity_id in index.find_all(words):
+        template_words.extend(words[position:start])
+        slot = f"{kind}_{counts.get(kind, 0)}"
+        counts[kind] = counts.get(kind, 0) + 1
+        slots[slot] = {
+            "id": entity_id,
+            "name": index.display_names.get(kind, {}).get(entity_id, " ".join(words[start:end])),
+        }
+        template_words.append("{" + slot + "}")
+        position = end
+    template_words.extend(words[position:])
+
+    return " ".join(template_words), slots
+
+
+class PlanCache:
+    """
+    Cache of PAYLOAD_GENERATOR_CHAIN payloads keyed by the templated question.
+
+    The payload only depends on the shape of the question, so once a plan
+    has been validated against the database the same plan can be reused for
+    a question that differs only in the horse, course, jockey, trainer or
+    date it mentions. Dates the LLM derived from 'today', 'yesterday' or a
+    weekday are stored relative to the day the plan is replayed; plans whose
+    dates came from absolute phrasing ("in June") are not cached.
+    """
+
+    def __init__(self, max_entries: int = PLAN_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.plans: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.stored = 0
+        self.rejected = 0
+
+    @staticmethod
+    def _key(template: str, today: date) -> str:
+        # "on saturday" is a different offset from each day of the week, so
+        # such plans are only replayed on the weekday they were made
+        if WEEKDAY_WORDS.search(template):
+            return f"{template} @{today.strftime('%a').lower()}"
+        return template
+
+    async def lookup(self, query: str) -> Optional[Dict[str, Any]]:
+        """Return a payload for the question built from a cached plan, if there is one."""
+        await entity_index.ensure_loaded()
+        template, slots = template_query(query)
+        today = date.today()
+        key = self._key(template, today)
+        plan = self.plans.get(key)
+        if plan is None:
+            self.misses += 1
+            return None
+
+        self.plans.move_to_end(key)
+        self.hits += 1
+        print(f"Plan cache hit: {template}")
+        return self._fill(copy.deepcopy(plan), slots, today)
+
+    async def store(self, query: str, payload: Dict[str, Any]) -> bool:
+        """
+        Cache a payload that has been executed successfully.
+
+        The plan is only kept if every entity and date in the question could
+        be traced to a value in the payload; otherwise replaying it for a
+        different entity would silently query the original one. Other dates
+        in the payload must come from relative words in the question.
+        """
+        await entity_index.ensure_loaded()
+        template, slots = template_query(query)
+
+        markers = {}
+        for slot, values in slots.items():
+            if "value" in values:
+                markers[values["value"]] = "{{" + slot + "}}"
+            else:
+                markers[values["id"]] = "{{" + slot + ".id}}"
+                markers[normalize_name(values["name"])] = "{{" + slot + ".name}}"
+
+        relative = bool(RELATIVE_DATE_WORDS.search(template) or WEEKDAY_WORDS.search(template))
+        # Years written in the question ("winners in 2023") pin dates in place
+        years = set(re.findall(r"\b\d{4}\b", template))
+        used = set()
+        absolute = []
+        today = date.today()
+        plan = self._generalize(copy.deepcopy(payload), markers, relative, years, used, absolute, today)
+        if {marker.split(".")[0].strip("{}") for marker in used} != set(slots):
+            self.rejected += 1
+            print(f"Plan cache rejected (unmatched slots): {template}")
+            return False
+        if absolute:
+            self.rejected += 1
+            print(f"Plan cache rejected (absolute dates {', '.join(sorted(set(absolute)))}): {template}")
+            return False
+
+        key = self._key(template, today)
+        self.plans[key] = plan
+        self.plans.move_to_end(key)
+        while len(self.plans) > self.max_entries:
+            self.plans.popitem(last=False)
+        self.stored += 1
+        return True
+
+    def _generalize(self, value: Any, markers: Dict[str, str], relative: bool, years: set,
+                    used: set, absolute: List[str], today: date) -> Any:
+        if isinstance(value, dict):
+            return {
+                key: self._generalize(item, markers, relative, years, used, absolute, today)
+                for key, item in value.items()
+            }
+        if isinstance(value, list):
+            return [self._generalize(item, markers, relative, years, used, absolute, today) for item in value]
+        if isinstance(value, str):
+            marker = markers.get(value) or markers.get(normalize_name(value))
+            if marker:
+                used.add(marker)
+                return marker
+            if ISO_DATE_PATTERN.match(value) and value[:4] not in years:
+                try:
+                    offset = (date.fromisoformat(value) - today).days
+                except ValueError:
+                    return value
+                if not relative:
+                    # Worked out from "in June", "3rd May" etc., which the
+                    # template keeps as words; an offset from today would move daily
+                    absolute.append(value)
+                    return value
+                # A date the LLM worked out from 'today', 'yesterday' etc.
+                return "{{today%+d}}" % offset
+        return value
+
+    def _fill(self, value: Any, slots: Dict[str, Dict[str, str]], today: date) -> Any:
+        if isinstance(value, dict):
+            return {key: self._fill(item, slots, today) for key, item in value.items()}
+        if isinstance(value, list):
+            return [self._fill(item, slots, today) for item in value]
+        if isinstance(value, str):
+            match = TODAY_PATTERN.match(value)
+            if match:
+                return (today + timedelta(days=int(match.group(1)))).isoformat()
+            match = SLOT_PATTERN.match(value)
+            if match and match.group(1) in slots:
+                return slots[match.group(1)][match.group(2) or "value"]
+        return value
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss counters for monitoring."""
+        total = self.hits + self.misses
+        return {
+            "entries": len(self.plans),
+            "hits": self.hits,
+            "misses": self.misses,
+            "stored": self.stored,
+            "rejected": self.rejected,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+plan_cache = PlanCache()
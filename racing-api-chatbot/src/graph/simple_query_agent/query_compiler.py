@@ -0,0 +1,415 @@
+import os
+import math
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, date, time
+from decimal import Decimal
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import Integer, select
+from sqlalchemy.orm import Session
+
+from src.db.models import (
+    Course, Race, Horse, Trainer, Jockey, Owner,
+    Runner, Result, Odds, RunnerMedical, RunnerQuote,
+    TrainerStatistics, JockeyStatistics, HorseStatistics
+)
+
+# Tables a payload may query, by the name the LLM uses for them
+MODELS = {
+    model.__name__: model
+    for model in (
+        Course, Race, Horse, Trainer, Jockey, Owner,
+        Runner, Result, Odds, RunnerMedical, RunnerQuote,
+        TrainerStatistics, JockeyStatistics, HorseStatistics
+    )
+}
+
+# Many-to-one joins between tables, as table -> {parent table: shared column}.
+# Odds has no foreign keys to races or horses but carries the same ids.
+JOIN_FIELDS = {
+    "Result": {"Race": "race_id", "Horse": "horse_id", "Jockey": "jockey_id", "Trainer": "trainer_id", "Owner": "owner_id"},
+    "Runner": {"Race": "race_id", "Horse": "horse_id", "Jockey": "jockey_id", "Trainer": "trainer_id", "Owner": "owner_id"},
+    "Odds": {"Race": "race_id", "Horse": "horse_id", "Runner": "runner_id"},
+    "RunnerMedical": {"Horse": "horse_id"},
+    "RunnerQuote": {"Horse": "horse_id"},
+    "TrainerStatistics": {"Trainer": "trainer_id"},
+    "JockeyStatistics": {"Jockey": "jockey_id"},
+    "HorseStatistics": {"Horse": "horse_id"},
+    "Race": {"Course": "course_id"},
+}
+
+# The most granular table in a payload drives the statement; everything it
+# references is joined onto it, so each of its rows appears exactly once
+ROOT_PRIORITY = [
+    "Odds", "Result", "Runner", "RunnerMedical", "RunnerQuote",
+    "TrainerStatistics", "JockeyStatistics", "HorseStatistics",
+    "Race", "Course", "Horse", "Jockey", "Trainer", "Owner",
+]
+
+# Tables whose queries join Race and Course, so they can be filtered, sorted
+# and enriched by the race they belong to
+RACE_SCOPED_TABLES = ("Result", "Runner")
+
+# Race details added to every row of a race-scoped table
+RACE_INFO_COLUMNS = [
+    ("race_name", Race.race_name),
+    ("date", Race.date),
+    ("course", Course.course),
+    ("distance", Race.distance),
+    ("going", Race.going),
+    ("type", Race.type),
+    ("race_class", Race.race_class),
+]
+
+PAYLOAD_KEYS = ("sort", "limit", "fields")
+
+# Most rows a "content" context table returns per question
+CONTEXT_TABLE_ROW_LIMIT = int(os.getenv("CONTEXT_TABLE_ROW_LIMIT", "200"))
+
+# Read context tables through a server-side cursor in batches of this size
+CONTEXT_TABLE_STREAM = os.getenv("CONTEXT_TABLE_STREAM", "false").lower() in ("true", "1", "t")
+CONTEXT_TABLE_STREAM_BATCH = 100
+
+
+@dataclass
+class TableOutput:
+    """How to rebuild one table's rows from the joined result set."""
+    key_label: str
+    fields: List[Tuple[str, str]]
+    race_info: bool = False
+    limit: Optional[int] = None
+
+
+@dataclass
+class CompiledQuery:
+    statement: Any
+    outputs: Dict[str, TableOutput] = field(default_factory=dict)
+
+
+def serialize_value(value: Any) -> Any:
+    """Convert a column value into something json.dumps can handle."""
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    return value
+
+
+def _join_path(root: str, target: str) -> Optional[List[Tuple[str, str, str]]]:
+    """Shortest chain of (parent, child, column) joins from root to target."""
+    if root == target:
+        return []
+    previous = {root: None}
+    queue = deque([root])
+    while queue:
+        table = queue.popleft()
+        for parent, column in JOIN_FIELDS.get(table, {}).items():
+            if parent in previous:
+                continue
+            previous[parent] = (table, column)
+            if parent == target:
+                path = []
+                while previous[parent]:
+                    child, column = previous[parent]
+                    path.append((child, parent, column))
+                    parent = child
+                return path[::-1]
+            queue.append(parent)
+    return None
+
+
+def _column(table_name: str, field_name: str):
+    """Resolve a payload field, falling back to the race for race-scoped tables."""
+    candidates = [MODELS[table_name]]
+    if table_name in RACE_SCOPED_TABLES:
+        candidates += [Race, Course]
+    for model in candidates:
+        if field_name in model.__table__.columns:
+            return getattr(model, field_name)
+    return None
+
+
+def _numeric_twin(column):
+    """The generated numeric copy of a string column (see models.numeric_shadow), if it has one."""
+    twin = column.expression.table.columns.get(f"{column.key}_num")
+    if twin is None or (twin.computed is None and not twin.info.get("numeric_shadow")):
+        return None
+    return twin
+
+
+def _numeric_bound(numeric, value: Any, upper: bool = False):
+    # Compare integer columns with integers so Postgres keeps using the index
+    number = float(value)
+    if isinstance(numeric.type, Integer):
+        return math.floor(number) if upper else math.ceil(number)
+    return number
+
+
+def _filter_clauses(column, field_name: str, value: Any) -> list:
+    """Translate one payload filter into WHERE clauses."""
+    # Numbers stored as strings (sp_dec, position, ratings) are compared on
+    # their indexed numeric twin instead of casting every row
+    numeric = _numeric_twin(column)
+
+    if isinstance(value, dict):
+        if 'range' in value:
+            min_val, max_val = value['range']
+            if numeric is not None:
+                try:
+                    clauses = []
+                    if min_val is not None:
+                        clauses.append(numeric >= _numeric_bound(numeric, min_val))
+                    if max_val is not None:
+                        clauses.append(numeric <= _numeric_bound(numeric, max_val, upper=True))
+                    return clauses
+                except (ValueError, TypeError):
+                    # Skip invalid numeric values
+                    return []
+            return [column >= min_val, column <= max_val]
+        if 'contains' in value:
+            if field_name == 'off_time':
+                try:
+                    return [column == datetime.strptime(value['contains'], '%H:%M').time()]
+                except ValueError:
+                    return []
+            return [column.contains(value['contains'])]
+        return []
+
+    if numeric is not None:
+        try:
+            number = float(value)
+            if not isinstance(numeric.type, Integer):
+                return [numeric == number]
+            if number.is_integer():
+                return [numeric == int(number)]
+        except (ValueError, TypeError):
+            pass
+        # Non-numeric values such as 'PU' only exist in the string column
+        return [column == str(value)]
+    return [column == value]
+
+
+def _compile_component(root: str, members: List[str], filters: Dict[str, dict], context: dict) -> CompiledQuery:
+    joins: Dict[str, Tuple[str, str, bool]] = {}
+
+    def add_join(table_name: str, outer: bool) -> None:
+        for parent, child, column in _join_path(root, table_name):
+            if child not in joins:
+                joins[child] = (parent, column, outer)
+            elif not outer:
+                joins[child] = (parent, column, False)
+
+    for table_name in members:
+        add_join(table_name, outer=False)
+
+    race_info = any(table_name in RACE_SCOPED_TABLES for table_name in members)
+    if race_info:
+        add_join("Course", outer=False)
+
+    # Tables the schema marks as required context for a queried table are
+    # pulled in through the same statement instead of follow-up IN queries
+    related_fields: Dict[str, List[str]] = {}
+    queue = deque(members)
+    while queue:
+        table_name = queue.popleft()
+        for related_table, relationship in context.get("relationships", {}).get(table_name, {}).items():
+            if (
+                relationship.get("required", False)
+                and related_table in MODELS
+                and related_table not in members
+                and related_table not in related_fields
+                and JOIN_FIELDS.get(table_name, {}).get(related_table) == relationship.get("join_field")
+            ):
+                add_join(related_table, outer=True)
+                related_fields[related_table] = context["tables"].get(related_table, {}).get("required_fields", [])
+                queue.append(related_table)
+
+    columns = []
+    outputs = {}
+    for table_name in list(members) + list(related_fields):
+        model_class = MODELS[table_name]
+        table_columns = model_class.__table__.columns
+        if table_name in related_fields:
+            requested_fields = related_fields[table_name]
+        else:
+            requested_fields = filters.get(table_name, {}).get("fields") or table_columns.keys()
+
+        key_column = list(model_class.__table__.primary_key.columns)[0]
+        key_label = f"{table_name}__{key_column.name}__key"
+        columns.append(key_column.label(key_label))
+
+        output_fields = []
+        for field_name in requested_fields:
+            if field_name in table_columns:
+                label = f"{table_name}__{field_name}"
+                columns.append(table_columns[field_name].label(label))
+                output_fields.append((field_name, label))
+
+        limit = filters.get(table_name, {}).get("limit")
+        outputs[table_name] = TableOutput(
+            key_label=key_label,
+            fields=output_fields,
+            race_info=table_name in RACE_SCOPED_TABLES,
+            limit=int(limit) if limit and table_name != root else None,
+        )
+
+    if race_info:
+        columns += [column.label(f"race__{name}") for name, column in RACE_INFO_COLUMNS]
+
+    statement = select(*columns).select_from(MODELS[root])
+    for child, (parent, column, outer) in joins.items():
+        statement = statement.join(
+            MODELS[child],
+            getattr(MODELS[parent], column) == getattr(MODELS[child], column),
+            isouter=outer,
+        )
+
+    order_by = []
+    for table_name in members:
+        table_filters = filters.get(table_name, {})
+        for field_name, value in table_filters.items():
+            if field_name in PAYLOAD_KEYS:
+                continue
+            column = _column(table_name, field_name)
+            if column is not None:
+                statement = statement.where(*_filter_clauses(column, field_name, value))
+
+        sort = table_filters.get("sort")
+        if isinstance(sort, (list, tuple)) and len(sort) == 2:
+            sort_field, sort_order = sort
+            column = _column(table_name, sort_field)
+            if column is not None:
+                # Sort numbers stored as strings numerically, non-numeric values last
+                numeric = _numeric_twin(column)
+                if numeric is not None:
+                    column = numeric
+                column = column.desc().nulls_last() if str(sort_order).lower() == 'desc' else column.asc().nulls_last()
+                # The root table's sort decides which rows the limit keeps
+                if table_name == root:
+                    order_by.insert(0, column)
+                else:
+                    order_by.append(column)
+
+    if order_by:
+        statement = statement.order_by(*order_by)
+
+    root_limit = filters.get(root, {}).get("limit")
+    if root_limit:
+        statement = statement.limit(int(root_limit))
+
+    return CompiledQuery(statement=statement, outputs=outputs)
+
+
+def compile_payload(query_params: dict, context: dict) -> List[CompiledQuery]:
+    """
+    Compile the filters of a PAYLOAD_GENERATOR_CHAIN payload into joined SELECTs.
+
+    Tables that can be joined to each other are read with one statement,
+    rooted at the most granular of them. Only tables with no join path
+    between them (e.g. Horse and Course on their own) need a statement each.
+    """
+    filters = {
+        table_name: table_filters if isinstance(table_filters, dict) else {}
+        for table_name, table_filters in query_params.get('filters', {}).items()
+        if table_name in MODELS
+    }
+
+    compiled = []
+    remaining = list(filters)
+    while remaining:
+        root = min(remaining, key=ROOT_PRIORITY.index)
+        members = [table_name for table_name in remaining if _join_path(root, table_name) is not None]
+        remaining = [table_name for table_name in remaining if table_name not in members]
+        compiled.append(_compile_component(root, members, filters, context))
+    return compiled
+
+
+def execute_compiled(db: Session, compiled: List[CompiledQuery]) -> Dict[str, Any]:
+    """Run compiled statements and split the joined rows back into per-table lists."""
+    query_response = {}
+    for query in compiled:
+        try:
+            rows = db.execute(query.statement).mappings().all()
+        except Exception as e:
+            print(f"Error querying {', '.join(query.outputs)}: {str(e)}")
+            db.rollback()  # Rollback on error
+            for table_name in query.outputs:
+                query_response.setdefault(table_name, {"error": str(e)})
+            continue
+
+        for table_name, output in query.outputs.items():
+            seen = set()
+            records = []
+            for row in rows:
+                key = row[output.key_label]
+                # Skip repeats of a joined row and outer joins that found nothing
+                if key is None or key in seen:
+                    continue
+                seen.add(key)
+
+                record = {}
+                if output.race_info:
+                    record.update({name: serialize_value(row[f"race__{name}"]) for name, _ in RACE_INFO_COLUMNS})
+                for field_name, label in output.fields:
+                    record[field_name] = serialize_value(row[label])
+                records.append(record)
+
+            if output.limit is not None:
+                records = records[:output.limit]
+            if records:
+                query_response.setdefault(table_name, records)
+                print(f"{table_name} -> Data retrieved successfully")
+            else:
+                print(f"{table_name} -> No results returned")
+
+    return query_response
+
+
+def read_context_table(
+    db: Session,
+    table_name: str,
+    fields: List[str],
+    limit: int = CONTEXT_TABLE_ROW_LIMIT,
+    after: Any = None,
+    stream: bool = CONTEXT_TABLE_STREAM,
+) -> Tuple[List[dict], Any]:
+    """
+    Read one page of a context table, projecting only the given fields.
+
+    Rows are ordered by primary key and start after the `after` key, so a
+    caller can page through a large table with the returned next key, which
+    is None once the table is exhausted. The page size is capped at
+    CONTEXT_TABLE_ROW_LIMIT whatever the caller asks for.
+    """
+    model_class = MODELS[table_name]
+    table_columns = model_class.__table__.columns
+    key_column = list(model_class.__table__.primary_key.columns)[0]
+    limit = max(1, min(int(limit or CONTEXT_TABLE_ROW_LIMIT), CONTEXT_TABLE_ROW_LIMIT))
+
+    output_fields = [field_name for field_name in (fields or table_columns.keys()) if field_name in table_columns]
+    statement = select(
+        key_column.label("__key"),
+        *[table_columns[field_name].label(field_name) for field_name in output_fields],
+    ).order_by(key_column).limit(limit + 1)
+    if after is not None:
+        statement = statement.where(key_column > after)
+    if stream:
+        statement = statement.execution_options(stream_results=True, yield_per=CONTEXT_TABLE_STREAM_BATCH)
+
+    records = []
+    next_key = None
+    result = db.execute(statement)
+    try:
+        last_key = None
+        for row in result.mappings():
+            # The extra row only tells us whether there is another page
+            if len(records) == limit:
+                next_key = last_key
+                break
+            last_key = row["__key"]
+            records.append({field_name: serialize_value(row[field_name]) for field_name in output_fields})
+    finally:
+        result.close()
+
+    return records, next_key
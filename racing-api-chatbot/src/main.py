@@ -1,17 +1,27 @@
 from fastapi import Depends, FastAPI, HTTPException, status
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import timedelta
+import json
 import os
 import sys
 
 
-from langgraph.checkpoint.memory import MemorySaver
+from langchain_core.messages import RemoveMessage
+from langgraph.graph.message import REMOVE_ALL_MESSAGES
 from src.graph import initialize_graph
+from src.graph.checkpointer import PrunedMemorySaver
 from src.db.database import db_manager
 from src.db.models import User, Base
+from src.graph.simple_query_agent.plan_cache import plan_cache
+from src.utils.answer_cache import answer_cache
+from src.utils.cached_api_client import response_cache
+from src.utils.cache_warmer import cache_warmer, CACHE_WARMER_ENABLED
+from src.utils.cache_sweeper import cache_sweeper
 from src.auth.schemas import UserCreate, Token
 from src.auth.utils import (
     get_password_hash,
@@ -52,10 +62,40 @@ async def startup_event():
         print("Initializing database...")
         db_manager.init_db()
         print("Database initialized successfully")
+
+        # Compile the graph once and share it across requests. The checkpointer
+        # keeps the latest state of recently active threads.
+        print("Compiling query graph...")
+        app.state.checkpointer = PrunedMemorySaver()
+        app.state.graph = initialize_graph(checkpointer=app.state.checkpointer)
+        print("Query graph compiled successfully")
+
+        cache_sweeper.start()
+        if CACHE_WARMER_ENABLED:
+            print("Starting cache warmer...")
+            cache_warmer.start()
     except Exception as e:
         print(f"Error during startup: {str(e)}")
         raise
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop background work."""
+    cache_warmer.stop()
+    cache_sweeper.stop()
+    if not db_manager.write_behind.drain(timeout=30):
+        print("Write-behind queue not drained before shutdown")
+
+def _turn_inputs(query: str) -> dict:
+    """Graph inputs for a new turn, clearing the per-turn channels the checkpointer restores."""
+    return {
+        "input": query,
+        "past_steps": [],
+        "query_params": None,
+        "messages": [RemoveMessage(id=REMOVE_ALL_MESSAGES)],
+        "debug_messages": [RemoveMessage(id=REMOVE_ALL_MESSAGES)],
+    }
+
 class QueryRequest(BaseModel):
     query: str
     thread_id: str
@@ -64,7 +104,7 @@ class QueryRequest(BaseModel):
 @app.post("/chat")
 async def chat(
     request: QueryRequest, 
-    db: Session = Depends(db_manager.get_db),
+    db: AsyncSession = Depends(db_manager.get_async_db),
     current_user: User = Depends(get_current_active_user)
 ):
     # Use the authenticated user's token instead of a default token
@@ -81,15 +121,14 @@ async def chat(
         "recursion_limit": 100,
     }
 
-    checkpointer = MemorySaver()
-    graph = initialize_graph(checkpointer=checkpointer)
+    graph = app.state.graph
 
     # Generate response
-    inputs = {"input": request.query, "past_steps": [], "messages": []}
-    response = graph.invoke(inputs, thread_config)
+    inputs = _turn_inputs(request.query)
+    response = await graph.ainvoke(inputs, thread_config)
 
     # Save chat history to database
-    db_manager.save_chat_history(
+    await db_manager.asave_chat_history(
         db=db,
         thread_id=request.thread_id,
         user_key=request.user_key,
@@ -99,6 +138,97 @@ async def chat(
 
     return {"response": response['response']}
 
+# Nodes that hand this turn's data to human_facing_response
+ANSWER_HANDLERS = ("qualify_queries", "simple_query_handler", "cached_query_handler", "complex_query_handler")
+
+def _sse_event(event: str, data: dict) -> str:
+    """Format a server-sent event frame."""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+@app.post("/chat/stream")
+async def chat_stream(
+    request: QueryRequest,
+    current_user: User = Depends(get_current_active_user)
+):
+    """Stream node progress and the answer tokens as server-sent events."""
+    print(request)
+
+    thread_config = {
+        "configurable": {
+            "thread_id": request.thread_id,
+            "user_key": request.user_key,
+            "user_email": current_user.email,
+        },
+        "recursion_limit": 100,
+    }
+
+    graph = app.state.graph
+    inputs = _turn_inputs(request.query)
+
+    async def event_generator():
+        final_response = None
+        handled = False
+        try:
+            async for mode, payload in graph.astream(
+                inputs, thread_config, stream_mode=["updates", "custom", "messages"]
+            ):
+                if mode == "updates":
+                    for node_name, update in payload.items():
+                        yield _sse_event("progress", {"node": node_name})
+                        if node_name in ANSWER_HANDLERS:
+                            handled = True
+                        if isinstance(update, dict) and "response" in update:
+                            final_response = update["response"]
+                elif mode == "custom":
+                    yield _sse_event("progress", payload)
+                elif mode == "messages":
+                    # Only forward tokens of the user-facing answer, not the
+                    # intermediate validation/classification/payload calls,
+                    # and only from the run that follows this turn's handler
+                    chunk, metadata = payload
+                    if handled and metadata.get("langgraph_node") == "human_facing_response" and chunk.content:
+                        yield _sse_event("token", {"content": chunk.content})
+
+            yield _sse_event("done", {"response": final_response})
+        except Exception as e:
+            print(f"Error streaming chat response: {str(e)}")
+            yield _sse_event("error", {"error": str(e)})
+            return
+
+        # The request-scoped session is already closed once streaming starts,
+        # so history is saved on a session owned by the generator
+        async with db_manager.AsyncSessionLocal() as db:
+            try:
+                state = await graph.aget_state(thread_config)
+                await db_manager.asave_chat_history(
+                    db=db,
+                    thread_id=request.thread_id,
+                    user_key=request.user_key,
+                    query=request.query,
+                    response=state.values
+                )
+            except Exception as e:
+                print(f"Error saving chat history: {str(e)}")
+
+    return StreamingResponse(
+        event_generator(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/cache/stats")
+async def cache_stats(current_user: User = Depends(get_current_active_user)):
+    """Hit/miss statistics for the answer, query plan and API response caches, and their background workers."""
+    return {
+        "answer_cache": answer_cache.stats(),
+        "plan_cache": plan_cache.stats(),
+        "response_cache": response_cache.stats(),
+        "cache_warmer": cache_warmer.stats(),
+        "cache_sweeper": cache_sweeper.stats(),
+        "write_behind": db_manager.write_behind.stats(),
+        "checkpointer": app.state.checkpointer.stats(),
+    }
+
 @app.get("/chat/history")
 async def get_chat_history(
     thread_id: str = None,
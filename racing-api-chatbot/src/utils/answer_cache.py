@@ -0,0 +1,266 @@
+import os
+import re
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy import func, select
+from langchain_openai import OpenAIEmbeddings
+
+from src.db.database import db_manager
+from src.db.models import ApiSyncLog
+
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", "1800"))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "1000"))
+ANSWER_CACHE_SEMANTIC = os.getenv("ANSWER_CACHE_SEMANTIC", "true").lower() in ("true", "1", "t")
+ANSWER_CACHE_SIMILARITY = float(os.getenv("ANSWER_CACHE_SIMILARITY", "0.97"))
+
+# How long the data-freshness versions are trusted before api_sync_log is re-read
+VERSION_CHECK_SECONDS = 10
+
+# Data domain of an api_sync_log endpoint, by the first fragment it contains
+ENDPOINT_DOMAINS = [
+    ("odds", "odds"),
+    ("result", "results"),
+    ("racecard", "racecards"),
+    ("course", "courses"),
+    ("horse", "horses"),
+]
+# Domains a question reads, by the words it uses. Courses, horses and
+# anything else change rarely, so every answer depends on them; a question
+# matching none of these depends on every domain.
+QUERY_DOMAINS = {
+    "odds": re.compile(r"\b(odds|prices?|priced|favou?rites?|bookmakers?|bookies|sp|drifting|shortening)\b"),
+    "results": re.compile(
+        r"\b(results?|won|wins?|winners?|winning|finish(ed)?|placed|beat(en)?|form|record|strike rate|stats|statistics)\b"
+    ),
+    "racecards": re.compile(
+        r"\b(runners?|racecards?|cards?|declared|declarations|field|rides|riding|mounts|running|entries|form)\b"
+    ),
+}
+STATIC_DOMAINS = frozenset({"courses", "horses", "other"})
+
+# Words that fix the day a question is about; a semantic hit must use the same ones
+DATE_WORDS = re.compile(
+    r"\b(today|tonight|yesterday|tomorrow|monday|tuesday|wednesday|thursday|friday|saturday|sunday|weekend"
+    r"|january|february|march|april|may|june|july|august|september|october|november|december"
+    r"|week|month|year|season|last|next|ago|recent|recently)\b"
+)
+
+
+def normalize_query(query: str) -> str:
+    """Normalise a chat question so trivially different phrasings share a key."""
+    query = re.sub(r"[^a-z0-9:. ]+", " ", query.lower())
+    return " ".join(query.split()).strip(" .")
+
+
+def endpoint_domain(endpoint: str) -> str:
+    """Data domain an api_sync_log endpoint writes, e.g. "odds" for get_odds."""
+    for fragment, domain in ENDPOINT_DOMAINS:
+        if fragment in endpoint:
+            return domain
+    return "other"
+
+
+def query_domains(query: str) -> FrozenSet[str]:
+    """Data domains the answer to a normalised question depends on."""
+    matched = {domain for domain, pattern in QUERY_DOMAINS.items() if pattern.search(query)}
+    if not matched:
+        return frozenset(QUERY_DOMAINS) | STATIC_DOMAINS
+    return frozenset(matched) | STATIC_DOMAINS
+
+
+async def _signature(query: str) -> Tuple:
+    # Race times, distances, dates, the horses and courses named and the day
+    # asked about must match exactly for a semantic hit; "the 2:15 at Ascot"
+    # and "the 2:30 at Ascot", or "at Ascot" and "at Ayr", embed almost identically.
+    # Imported here: src.graph builds the graph on import, and its nodes
+    # import this module.
+    from src.graph.root_agent.fast_path import entity_index, normalize_name
+    await entity_index.ensure_loaded()
+    entities = frozenset(
+        (kind, entity_id) for _, _, kind, entity_id in entity_index.find_all(normalize_name(query).split())
+    )
+    return (
+        tuple(re.findall(r"\d+(?:[:.]\d+)?", query)),
+        entities,
+        tuple(match.group(0) for match in DATE_WORDS.finditer(query)),
+    )
+
+
+@dataclass
+class CachedAnswer:
+    query: str
+    answer: str
+    version: Tuple[int, ...]
+    expires_at: float
+    embedding: Optional[np.ndarray] = None
+    signature: Optional[Tuple] = None
+
+
+class AnswerCache:
+    """
+    Two-tier cache of final chat answers.
+
+    Entries are keyed by the normalised question and a data-freshness
+    version: the latest api_sync_log id of each data domain the question
+    reads (odds, results, racecards, plus the rarely changing ones). An
+    ingestion run only orphans the answers that read what it wrote, so the
+    odds refresh every few minutes leaves results answers cached.
+    """
+
+    def __init__(self, ttl_seconds: int = ANSWER_CACHE_TTL_SECONDS, max_entries: int = ANSWER_CACHE_MAX_ENTRIES,
+                 semantic: bool = ANSWER_CACHE_SEMANTIC, similarity: float = ANSWER_CACHE_SIMILARITY):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.semantic = semantic
+        self.similarity = similarity
+        self.entries: "OrderedDict[Tuple[str, Tuple[int, ...]], CachedAnswer]" = OrderedDict()
+        self.hits = {"exact": 0, "semantic": 0}
+        self.misses = 0
+        self._embeddings = None
+        self._pending: Dict[str, Tuple[Tuple[int, ...], Optional[np.ndarray]]] = {}
+        self._versions: Dict[str, int] = {}
+        self._version_checked_at = 0.0
+
+    def _version(self, key: str) -> Tuple[int, ...]:
+        return tuple(self._versions.get(domain, 0) for domain in sorted(query_domains(key)))
+
+    async def current_version(self, key: str) -> Tuple[int, ...]:
+        """Get the data version of a normalised question, re-reading api_sync_log at most every few seconds."""
+        if time.monotonic() - self._version_checked_at >= VERSION_CHECK_SECONDS:
+            async with db_manager.AsyncSessionLocal() as db:
+                # Incremental syncs that found nothing new don't touch the data
+                rows = (await db.execute(
+                    select(ApiSyncLog.endpoint, func.max(ApiSyncLog.id))
+                    .where(ApiSyncLog.status != "unchanged")
+                    .group_by(ApiSyncLog.endpoint)
+                )).all()
+            versions: Dict[str, int] = {}
+            for endpoint, latest in rows:
+                domain = endpoint_domain(endpoint)
+                versions[domain] = max(versions.get(domain, 0), latest or 0)
+            if versions != self._versions:
+                # Ingestion touched some domains; drop the answers built on them
+                self._versions = versions
+                for entry_key in [k for k, entry in self.entries.items() if entry.version != self._version(entry.query)]:
+                    del self.entries[entry_key]
+                self._pending.clear()
+            self._version_checked_at = time.monotonic()
+        return self._version(key)
+
+    def invalidate(self) -> None:
+        """Drop all cached answers."""
+        self.entries.clear()
+        self._pending.clear()
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        for key in [key for key, entry in self.entries.items() if entry.expires_at <= now]:
+            del self.entries[key]
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    async def _embed(self, text: str) -> Optional[np.ndarray]:
+        if not self.semantic:
+            return None
+        try:
+            if self._embeddings is None:
+                self._embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+            vector = np.asarray(await self._embeddings.aembed_query(text), dtype=np.float32)
+            return vector / (np.linalg.norm(vector) or 1.0)
+        except Exception as e:
+            print(f"Error embedding query for answer cache: {str(e)}")
+            return None
+
+    async def lookup(self, query: str) -> Optional[str]:
+        """Return the cached answer to exactly this question, if any."""
+        key = normalize_query(query)
+        version = await self.current_version(key)
+        self._evict()
+
+        entry = self.entries.get((key, version))
+        if entry:
+            self.entries.move_to_end((key, version))
+            self.hits["exact"] += 1
+            return entry.answer
+
+        # Remember the version so store() caches under the one this turn read
+        self._remember(key, version, None)
+        self.misses += 1
+        return None
+
+    async def lookup_similar(self, query: str) -> Optional[str]:
+        """
+        Return the cached answer to a question that embeds almost the same
+        and names the same numbers, entities and days. Costs an embeddings
+        call, so it is only worth trying once cheaper routes have missed.
+        """
+        key = normalize_query(query)
+        embedding = await self._embed(key)
+        if embedding is None:
+            return None
+        version = await self.current_version(key)
+        self._remember(key, version, embedding)
+
+        signature = await _signature(key)
+        candidates: List[CachedAnswer] = [
+            entry for entry in self.entries.values()
+            if entry.version == version and entry.embedding is not None and entry.signature == signature
+        ]
+        if candidates:
+            scores = np.stack([entry.embedding for entry in candidates]) @ embedding
+            best = int(np.argmax(scores))
+            if scores[best] >= self.similarity:
+                # lookup() already counted this question as a miss
+                self.hits["semantic"] += 1
+                self.misses -= 1
+                return candidates[best].answer
+        return None
+
+    def _remember(self, key: str, version: Tuple[int, ...], embedding: Optional[np.ndarray]) -> None:
+        # Kept so store() doesn't recompute them
+        self._pending[key] = (version, embedding)
+        if len(self._pending) > self.max_entries:
+            self._pending.pop(next(iter(self._pending)))
+
+    async def store(self, query: str, answer: str) -> None:
+        """Cache the answer to a question under the version it was computed against."""
+        key = normalize_query(query)
+        version, embedding = self._pending.pop(key, (None, None))
+        if version is None:
+            version = await self.current_version(key)
+        if embedding is None:
+            # Reuse the embedding of an earlier answer to the same question
+            embedding = next(
+                (entry.embedding for entry in reversed(self.entries.values())
+                 if entry.query == key and entry.embedding is not None),
+                None,
+            )
+        self.entries[(key, version)] = CachedAnswer(
+            query=key,
+            answer=answer,
+            version=version,
+            expires_at=time.monotonic() + self.ttl_seconds,
+            embedding=embedding,
+            signature=await _signature(key) if embedding is not None else None,
+        )
+        self.entries.move_to_end((key, version))
+        self._evict()
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss counters for monitoring."""
+        hits = self.hits["exact"] + self.hits["semantic"]
+        total = hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "exact_hits": self.hits["exact"],
+            "semantic_hits": self.hits["semantic"],
+            "misses": self.misses,
+            "hit_ratio": round(hits / total, 4) if total else 0.0,
+        }
+
+
+answer_cache = AnswerCache()
@@ -1,8 +1,14 @@
+from requests.adapters import HTTPAdapter
 from requests.auth import HTTPBasicAuth
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+import threading
 import requests
+import time
 import os
 from dotenv import load_dotenv
-from typing import Dict, Optional
+from typing import Any, Callable, Dict, Iterable, List, Optional
 
 load_dotenv()
 
@@ -11,6 +17,60 @@ RACING_PASSWORD = os.getenv("RACING_API_PASSWORD")
 
 BASE_API_URL = os.getenv("RACING_API_BASE_URL")
 
+# Provider quota (requests per second) and the burst the bucket allows
+RACING_API_RATE_LIMIT = float(os.getenv("RACING_API_RATE_LIMIT", "5"))
+RACING_API_BURST = int(os.getenv("RACING_API_BURST", "5"))
+
+# Most requests in flight at once, which is also the connection pool size
+RACING_API_MAX_CONCURRENCY = int(os.getenv("RACING_API_MAX_CONCURRENCY", "8"))
+
+# Rate limiting and transient server errors are retried, up to this many
+# attempts in all, backing off exponentially unless Retry-After says otherwise
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+MAX_ATTEMPTS = 4
+RETRY_BACKOFF = 0.5
+
+
+class TokenBucket:
+    """Thread-safe token bucket: `rate` tokens per second, holding at most `capacity`."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Block until a token is available and take it."""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def retry_after(response: requests.Response) -> Optional[float]:
+    """Seconds a response's Retry-After header asks to wait, given as seconds or an HTTP date."""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
 
 class RaceAPIBaseClient:
     def login(self, email, password):
@@ -42,30 +102,81 @@ class RaceAPIBaseClient:
 
 
 class RaceAPIClient(RaceAPIBaseClient):
-    def __init__(self):
+    def __init__(self, max_concurrency: int = RACING_API_MAX_CONCURRENCY,
+                 rate_limit: float = RACING_API_RATE_LIMIT, burst: int = RACING_API_BURST):
         self.username = RACING_USERNAME
         self.password = RACING_PASSWORD
         self.base_url = BASE_API_URL
+        self.max_concurrency = max(1, max_concurrency)
+        self.rate_limiter = TokenBucket(rate_limit, burst)
+
+        # One pooled keep-alive session shared by every request (and thread).
+        # Retries are made by _make_request, not the adapter, so each one
+        # waits for the rate limiter like any other request.
+        self.session = requests.Session()
+        self.session.auth = HTTPBasicAuth(self.username, self.password)
+        adapter = HTTPAdapter(
+            pool_connections=self.max_concurrency,
+            pool_maxsize=self.max_concurrency,
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def close(self) -> None:
+        """Close the pooled connections."""
+        self.session.close()
+
+    def map_concurrent(self, func: Callable[..., Any], items: Iterable[Any]) -> List[Any]:
+        """
+        Call func(item) for every item on a pool of max_concurrency threads.
+
+        Results come back in the order of items. A call that raises yields
+        its exception in place of a result, so one failed race or horse
+        doesn't abort the rest. Requests made by func still go through the
+        shared rate limiter.
+        """
+        def call(item):
+            try:
+                return func(item)
+            except Exception as e:
+                return e
+
+        items = list(items)
+        if not items:
+            return []
+        with ThreadPoolExecutor(max_workers=min(self.max_concurrency, len(items))) as executor:
+            return list(executor.map(call, items))
 
     def _make_request(self, endpoint: str, params: Optional[Dict] = None) -> Dict:
-        """Make an API request with authentication."""
+        """Make an API request with authentication, retrying 429s, 5xx errors and dropped connections."""
         url = f"{self.base_url}/{endpoint}"
-        try:
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            self.rate_limiter.acquire()
             print(f"Making request to {url} with params: {params}")
-            response = requests.get(
-                url,
-                auth=HTTPBasicAuth(self.username, self.password),
-                params=params,
-                timeout=30  # 30 second timeout
-            )
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.Timeout:
-            print(f"Request to {url} timed out after 30 seconds")
-            raise
-        except requests.exceptions.RequestException as e:
-            print(f"Error making request to {url}: {str(e)}")
-            raise
+            try:
+                response = self.session.get(
+                    url,
+                    params=params,
+                    timeout=30  # 30 second timeout
+                )
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt == MAX_ATTEMPTS:
+                    print(f"Error making request to {url}: {str(e)}")
+                    raise
+                delay = RETRY_BACKOFF * 2 ** (attempt - 1)
+            else:
+                if response.status_code not in RETRY_STATUSES or attempt == MAX_ATTEMPTS:
+                    try:
+                        response.raise_for_status()
+                    except requests.exceptions.RequestException as e:
+                        print(f"Error making request to {url}: {str(e)}")
+                        raise
+                    return response.json()
+                delay = retry_after(response)
+                if delay is None:
+                    delay = RETRY_BACKOFF * 2 ** (attempt - 1)
+            print(f"Retrying {url} in {delay:.1f}s (attempt {attempt} of {MAX_ATTEMPTS})")
+            time.sleep(delay)
 
     def get_courses(self) -> Dict:
         """Get all courses from the API."""
@@ -335,6 +446,18 @@ class RaceAPIClient(RaceAPIBaseClient):
         """Get today's results."""
         return self._make_request("results/today")
 
+    def get_results_by_date(self, start_date: str, end_date: Optional[str] = None, limit: int = 50, skip: int = 0) -> Dict:
+        """Get one page of results for races run between two dates (YYYY-MM-DD, inclusive).
+        
+        The response carries "total", "limit" and "skip" for paging.
+        """
+        return self._make_request("results", params={
+            "start_date": start_date,
+            "end_date": end_date or start_date,
+            "limit": limit,
+            "skip": skip
+        })
+
     def get_race_result(self, race_id: str) -> Dict:
         """Get result for a specific race."""
         return self._make_request(f"results/{race_id}")
@@ -0,0 +1,66 @@
+import os
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+
+from src.db.database import db_manager
+
+API_CACHE_SWEEP_SECONDS = int(os.getenv("API_CACHE_SWEEP_SECONDS", "900"))
+
+
+class CacheSweeper:
+    """
+    Background thread deleting expired api_cache rows.
+
+    Lookups never return an expired row, so sweeping only keeps the table
+    and its indexes small; running it every few minutes is plenty.
+    """
+
+    def __init__(self, interval_seconds: int = API_CACHE_SWEEP_SECONDS):
+        self.interval_seconds = interval_seconds
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.runs = 0
+        self.removed = 0
+        self.last_run: Optional[datetime] = None
+
+    def sweep_once(self) -> int:
+        """Delete every expired row now, returning how many were removed."""
+        removed = db_manager.purge_expired_cache()
+        self.runs += 1
+        self.removed += removed
+        self.last_run = datetime.utcnow()
+        if removed:
+            print(f"Removed {removed} expired api_cache rows")
+        return removed
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_seconds):
+            try:
+                self.sweep_once()
+            except Exception as e:
+                print(f"Error sweeping api_cache: {str(e)}")
+
+    def start(self) -> None:
+        """Start the sweeper thread, if it isn't already running."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="cache-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Ask the sweeper thread to finish."""
+        self._stop.set()
+
+    def stats(self) -> Dict:
+        """Sweep counters for monitoring."""
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "runs": self.runs,
+            "removed": self.removed,
+            "last_run": self.last_run.isoformat() if self.last_run else None,
+        }
+
+
+cache_sweeper = CacheSweeper()
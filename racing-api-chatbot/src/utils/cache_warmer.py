@@ -0,0 +1,225 @@
+import os
+import threading
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+
+from sqlalchemy import text
+
+from src.db.database import db_manager
+from src.db.models import Race
+from src.utils.api_client import RaceAPIClient
+from src.utils.cached_api_client import CachedRaceAPIClient
+
+# Off by default: the warmer runs as its own process in the pipeline
+# container (python -m src.utils.cache_warmer), not in every API worker
+CACHE_WARMER_ENABLED = os.getenv("CACHE_WARMER_ENABLED", "false").lower() in ("true", "1", "t")
+# Postgres advisory lock held by the one process allowed to warm
+CACHE_WARMER_LOCK_KEY = 727001
+# Whether this connection still holds it; a bigint key is stored as objid
+# (low 32 bits) with objsubid 1
+LOCK_HELD_SQL = """
+SELECT EXISTS (
+    SELECT 1 FROM pg_locks
+    WHERE locktype = 'advisory' AND objid = :key AND objsubid = 1
+      AND pid = pg_backend_pid() AND granted
+)
+"""
+
+# Odds are fetched for races going off within this window, and for a
+# short while after the off so the returned prices land too
+ODDS_WARM_BEFORE_OFF = timedelta(minutes=int(os.getenv("CACHE_WARMER_ODDS_WINDOW_MINUTES", "60")))
+ODDS_WARM_AFTER_OFF = timedelta(minutes=10)
+
+
+def refresh_interval(now: datetime, off_times: List[datetime]) -> int:
+    """
+    Seconds until the next warm-up, given today's off times (naive UTC).
+
+    Quiet days and evenings are refreshed hourly; the closer the next race
+    is to the off, the more often racecards, results and odds are refetched.
+    """
+    if not off_times:
+        return 3600
+    upcoming = [off for off in off_times if off + ODDS_WARM_AFTER_OFF > now]
+    if not upcoming:
+        return 1800
+    until_off = min(upcoming) - now
+    if until_off > timedelta(hours=2):
+        return 900
+    if until_off > timedelta(minutes=30):
+        return 300
+    return 60
+
+
+class CacheWarmer:
+    """
+    Background refresher for the race-day hot endpoints.
+
+    Fetches today's pro racecards and results, and odds for races close to
+    the off, from the Racing API and queues them for the normalised tables;
+    the matching CachedRaceAPIClient responses are rebuilt once stored, so
+    chat requests are served warm entries. The schedule follows today's
+    Race.off_dt values.
+
+    Only the process holding a Postgres advisory lock warms, so starting the
+    warmer in several processes doesn't multiply Racing API calls; the
+    others check again every few minutes in case the holder goes away.
+    """
+
+    def __init__(self):
+        self._api_client: Optional[RaceAPIClient] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._lock_connection = None
+        self.runs = 0
+        self.skipped = 0
+        self.errors = 0
+        self.last_run: Optional[datetime] = None
+        self.next_interval: Optional[int] = None
+
+    @property
+    def api_client(self) -> RaceAPIClient:
+        # Created on first use, so importing this module needs no API credentials
+        if self._api_client is None:
+            self._api_client = RaceAPIClient()
+        return self._api_client
+
+    def _hold_lock(self) -> bool:
+        # The lock lives as long as its connection, so one is kept open
+        # while this process is the warmer. A dropped connection (database
+        # restart, idle timeout) loses the lock without telling us, so it
+        # is checked every cycle and reacquired on a fresh one if gone.
+        if self._lock_connection is not None:
+            try:
+                still_held = self._lock_connection.execute(text(LOCK_HELD_SQL), {"key": CACHE_WARMER_LOCK_KEY}).scalar()
+                self._lock_connection.commit()
+            except Exception as e:
+                print(f"Cache warmer lock connection lost: {str(e)}")
+                still_held = False
+            if not still_held:
+                self._release_lock()
+        if self._lock_connection is None:
+            connection = db_manager.engine.connect()
+            acquired = connection.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": CACHE_WARMER_LOCK_KEY}).scalar()
+            # The lock is session-level and outlives the transaction; ending
+            # it keeps the connection from sitting idle in transaction
+            connection.commit()
+            if acquired:
+                self._lock_connection = connection
+            else:
+                connection.close()
+        return self._lock_connection is not None
+
+    def _release_lock(self) -> None:
+        if self._lock_connection is not None:
+            try:
+                self._lock_connection.close()
+            except Exception as e:
+                # Already broken; the server dropped the lock with it
+                print(f"Error closing cache warmer lock connection: {str(e)}")
+            finally:
+                self._lock_connection = None
+
+    def _todays_off_times(self) -> Dict[str, datetime]:
+        db = db_manager.SessionLocal()
+        try:
+            rows = db.query(Race.race_id, Race.off_dt).filter(
+                Race.date == date.today(),
+                Race.off_dt.isnot(None)
+            ).all()
+            return {race_id: off_dt for race_id, off_dt in rows}
+        finally:
+            db.close()
+
+    def warm_once(self) -> int:
+        """
+        Fetch the hot endpoints once and return the seconds until the next run.
+
+        Responses go to the normalised tables through the write-behind queue;
+        each cached response is rebuilt once its data has been stored.
+        """
+        today = date.today().isoformat()
+        cached = CachedRaceAPIClient(refresh=True)
+        queue = db_manager.write_behind
+
+        queue.submit("get_racecards_pro", self.api_client.get_racecards_pro(),
+                     on_stored=lambda: cached.get_racecards(date=today))
+        queue.submit("get_today_results", self.api_client.get_today_results(),
+                     on_stored=lambda: cached.get_results(date=today))
+
+        off_times = self._todays_off_times()
+        now = datetime.utcnow()
+        due = [
+            race_id for race_id, off_dt in off_times.items()
+            if off_dt - ODDS_WARM_BEFORE_OFF <= now <= off_dt + ODDS_WARM_AFTER_OFF
+        ]
+        for race_id in due:
+            try:
+                odds = self.api_client.get_odds(race_id)
+                queue.submit("get_odds", {"race_id": race_id, **odds},
+                             on_stored=lambda race_id=race_id: cached.get_odds(race_id))
+            except Exception as e:
+                print(f"Error warming odds for race {race_id}: {str(e)}")
+
+        print(f"Cache warming queued: racecards, results and odds for {len(due)} races")
+        return refresh_interval(now, list(off_times.values()))
+
+    def _run(self) -> None:
+        try:
+            while not self._stop.is_set():
+                try:
+                    if self._hold_lock():
+                        self.next_interval = self.warm_once()
+                        self.runs += 1
+                        self.last_run = datetime.utcnow()
+                    else:
+                        # Another process is warming
+                        self.skipped += 1
+                        self.next_interval = 300
+                except Exception as e:
+                    # Try again soon rather than leave the cache cold for an hour
+                    self.errors += 1
+                    self.next_interval = 300
+                    self._release_lock()
+                    print(f"Error warming cache: {str(e)}")
+                self._stop.wait(self.next_interval)
+        finally:
+            self._release_lock()
+
+    def start(self) -> None:
+        """Start the refresher thread, if it isn't already running."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="cache-warmer", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Ask the refresher thread to finish after its current run."""
+        self._stop.set()
+
+    def stats(self) -> Dict:
+        """Run counters and schedule for monitoring."""
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "holds_lock": self._lock_connection is not None,
+            "runs": self.runs,
+            "skipped": self.skipped,
+            "errors": self.errors,
+            "last_run": self.last_run.isoformat() if self.last_run else None,
+            "next_interval_seconds": self.next_interval,
+        }
+
+
+cache_warmer = CacheWarmer()
+
+
+if __name__ == "__main__":
+    # Dedicated warmer process; stored responses reach the API processes
+    # through the shared api_cache table
+    try:
+        cache_warmer._run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        db_manager.write_behind.drain(timeout=30)
@@ -1,17 +1,229 @@
-from datetime import datetime, timedelta
-from typing import Dict, Optional
-from db.models import (
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import date, datetime, time as dt_time, timedelta
+from decimal import Decimal
+from typing import Any, Callable, Dict, Optional, Tuple
+from src.db.models import (
     Course, Race, Horse, Trainer, Jockey, Owner,
     Runner, Result, Odds, RunnerMedical, RunnerQuote
 )
-from src.db.database import DatabaseManager
+from src.db.database import db_manager
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "512"))
+
+# How long each response may be served from cache, in seconds. Courses and
+# horses barely change; racecards, results and odds move on race days.
+ENDPOINT_TTL_SECONDS = {
+    "get_courses": 7 * 24 * 3600,
+    "get_horse": 24 * 3600,
+    "get_racecards": 15 * 60,
+    "get_results": 5 * 60,
+    "get_odds": 60,
+}
+DEFAULT_TTL_SECONDS = 3600
+
+# How long past its TTL an entry is still served while a background refresh runs
+RESPONSE_CACHE_STALE_SECONDS = int(os.getenv("RESPONSE_CACHE_STALE_SECONDS", "300"))
+
+
+class ResponseCache:
+    """
+    Two-tier cache of CachedRaceAPIClient responses.
+
+    The first tier is an in-process LRU with per-endpoint TTLs; the second
+    is the api_cache table, shared by every process. Concurrent misses for
+    the same key are coalesced: one caller loads the response and the
+    others wait for its result instead of querying Postgres themselves.
+
+    An entry past its TTL but within the stale window is served at once
+    while a single background refresh replaces it (stale-while-revalidate).
+    This only covers the in-process tier: an expired api_cache row is never
+    served, and a process that doesn't hold the key in memory loads it.
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+                 stale_seconds: float = RESPONSE_CACHE_STALE_SECONDS):
+        self.max_entries = max_entries
+        self.stale_seconds = stale_seconds
+        self.entries: "OrderedDict[Tuple[str, str], Tuple[float, Dict]]" = OrderedDict()
+        self.hits = {"memory": 0, "database": 0, "stale": 0}
+        self.misses = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._inflight: Dict[Tuple[str, str], Future] = {}
+        self._refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="response-cache")
+
+    def get_or_load(self, endpoint: str, params: Dict[str, Any], loader: Callable[[], Dict],
+                    ttl_seconds: float) -> Dict:
+        """Return the cached response for endpoint and params, loading it on a miss."""
+        key = (endpoint, json.dumps(params, sort_keys=True, default=str))
+        with self._lock:
+            entry = self.entries.get(key)
+            now = time.monotonic()
+            if entry and entry[0] > now:
+                self.entries.move_to_end(key)
+                self.hits["memory"] += 1
+                return entry[1]
+            if entry and entry[0] + self.stale_seconds > now:
+                self.entries.move_to_end(key)
+                self.hits["stale"] += 1
+                if key not in self._inflight:
+                    self._inflight[key] = Future()
+                    self._refresher.submit(self._fill, key, endpoint, params, loader, ttl_seconds)
+                return entry[1]
+            inflight = self._inflight.get(key)
+            if inflight is None:
+                inflight = self._inflight[key] = Future()
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            return inflight.result()
+        return self._fill(key, endpoint, params, loader, ttl_seconds)
+
+    def _fill(self, key: Tuple[str, str], endpoint: str, params: Dict[str, Any], loader: Callable[[], Dict],
+              ttl_seconds: float) -> Dict:
+        """Load a response into the first tier and hand it to any callers waiting on the key."""
+        inflight = self._inflight[key]
+        try:
+            response = self._load(endpoint, params, loader, ttl_seconds)
+            with self._lock:
+                self.entries[key] = (time.monotonic() + ttl_seconds, response)
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+            inflight.set_result(response)
+            return response
+        except Exception as e:
+            print(f"Error loading {endpoint} into the response cache: {str(e)}")
+            inflight.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def refresh(self, endpoint: str, params: Dict[str, Any], loader: Callable[[], Dict], ttl_seconds: float) -> Dict:
+        """Rebuild the response for endpoint and params in both tiers, whatever they hold."""
+        key = (endpoint, json.dumps(params, sort_keys=True, default=str))
+        response = self._load(endpoint, params, loader, ttl_seconds, read_through=False)
+        with self._lock:
+            self.entries[key] = (time.monotonic() + ttl_seconds, response)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return response
+
+    def _load(self, endpoint: str, params: Dict[str, Any], loader: Callable[[], Dict], ttl_seconds: float,
+              read_through: bool = True) -> Dict:
+        db = db_manager.SessionLocal()
+        try:
+            if read_through:
+                try:
+                    cached = db_manager.get_cache_entry(db, endpoint, params)
+                except Exception as e:
+                    logger.warning(f"Error reading api_cache for {endpoint}: {str(e)}")
+                    cached = None
+                if cached is not None:
+                    with self._lock:
+                        self.hits["database"] += 1
+                    return cached
+
+                with self._lock:
+                    self.misses += 1
+            response = loader()
+            try:
+                db_manager.store_cache_entry(
+                    db, endpoint, params, response, ttl_hours=ttl_seconds / 3600, normalize=False
+                )
+            except Exception as e:
+                # The response is still served from the first tier, but other
+                # processes won't see it
+                logger.warning(f"Error writing api_cache for {endpoint}: {str(e)}")
+            return response
+        finally:
+            db.close()
+
+    def invalidate(self, endpoint: Optional[str] = None) -> None:
+        """Drop in-process entries, for one endpoint or all of them."""
+        with self._lock:
+            for key in [key for key in self.entries if endpoint is None or key[0] == endpoint]:
+                del self.entries[key]
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss counters for monitoring."""
+        with self._lock:
+            # A coalesced call is served without a load of its own
+            hits = self.hits["memory"] + self.hits["database"] + self.hits["stale"] + self.coalesced
+            total = hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "memory_hits": self.hits["memory"],
+                "database_hits": self.hits["database"],
+                "stale_hits": self.hits["stale"],
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "hit_ratio": round(hits / total, 4) if total else 0.0,
+            }
+
+
+response_cache = ResponseCache()
+
 
 class CachedRaceAPIClient:
-    def __init__(self):
-        self.db_manager = DatabaseManager()
+    def __init__(self, cache_ttl_hours: Optional[float] = None, refresh: bool = False):
+        """
+        Args:
+            cache_ttl_hours (Optional[float]): Upper bound on how long any
+                response is served from cache; endpoints with a shorter TTL
+                keep it.
+            refresh (bool): Rebuild every response from the tables and
+                replace what the cache holds, as the cache warmer does.
+        """
+        self.db_manager = db_manager
+        self.cache_ttl_hours = cache_ttl_hours
+        self.refresh = refresh
+
+    def _ttl(self, endpoint: str) -> float:
+        ttl = ENDPOINT_TTL_SECONDS.get(endpoint, DEFAULT_TTL_SECONDS)
+        if self.cache_ttl_hours is not None:
+            ttl = min(ttl, self.cache_ttl_hours * 3600)
+        return ttl
+
+    def _cached(self, endpoint: str, params: Dict[str, Any], loader: Callable[[], Dict]) -> Dict:
+        if self.refresh:
+            return response_cache.refresh(endpoint, params, loader, self._ttl(endpoint))
+        return response_cache.get_or_load(endpoint, params, loader, self._ttl(endpoint))
 
     def get_courses(self) -> Dict:
         """Get all courses from the database."""
+        return self._cached("get_courses", {}, self._load_courses)
+
+    def get_racecards(self, date: Optional[str] = None) -> Dict:
+        """Get racecards from the database, optionally filtered by date."""
+        return self._cached("get_racecards", {"date": date}, lambda: self._load_racecards(date))
+
+    def get_results(self, date: Optional[str] = None) -> Dict:
+        """Get results from the database, optionally filtered by date."""
+        return self._cached("get_results", {"date": date}, lambda: self._load_results(date))
+
+    def get_horse(self, horse_id: str) -> Dict:
+        """Get horse details from the database."""
+        return self._cached("get_horse", {"horse_id": horse_id}, lambda: self._load_horse(horse_id))
+
+    def get_odds(self, race_id: str) -> Dict:
+        """Get odds for a specific race from the database."""
+        return self._cached("get_odds", {"race_id": race_id}, lambda: self._load_odds(race_id))
+
+    def _load_courses(self) -> Dict:
         db = self.db_manager.SessionLocal()
         try:
             courses = db.query(Course).all()
@@ -19,8 +231,7 @@ class CachedRaceAPIClient:
         finally:
             db.close()
 
-    def get_racecards(self, date: Optional[str] = None) -> Dict:
-        """Get racecards from the database, optionally filtered by date."""
+    def _load_racecards(self, date: Optional[str] = None) -> Dict:
         db = self.db_manager.SessionLocal()
         try:
             query = db.query(Race).join(Course)
@@ -31,8 +242,7 @@ class CachedRaceAPIClient:
         finally:
             db.close()
 
-    def get_results(self, date: Optional[str] = None) -> Dict:
-        """Get results from the database, optionally filtered by date."""
+    def _load_results(self, date: Optional[str] = None) -> Dict:
         db = self.db_manager.SessionLocal()
         try:
             query = db.query(Result).join(Race)
@@ -43,8 +253,7 @@ class CachedRaceAPIClient:
         finally:
             db.close()
 
-    def get_horse(self, horse_id: str) -> Dict:
-        """Get horse details from the database."""
+    def _load_horse(self, horse_id: str) -> Dict:
         db = self.db_manager.SessionLocal()
         try:
             horse = db.query(Horse).filter(Horse.horse_id == horse_id).first()
@@ -54,8 +263,7 @@ class CachedRaceAPIClient:
         finally:
             db.close()
 
-    def get_odds(self, race_id: str) -> Dict:
-        """Get odds for a specific race from the database."""
+    def _load_odds(self, race_id: str) -> Dict:
         db = self.db_manager.SessionLocal()
         try:
             odds = db.query(Odds).filter(Odds.race_id == race_id).all()
@@ -68,8 +276,14 @@ class CachedRaceAPIClient:
         result = {}
         for column in model.__table__.columns:
             value = getattr(model, column.name)
-            if isinstance(value, (datetime, timedelta)):
+            # Responses are stored as JSONB, so dates, times and Decimals
+            # must already be JSON types
+            if isinstance(value, (datetime, date, dt_time)):
+                value = value.isoformat()
+            elif isinstance(value, timedelta):
                 value = str(value)
+            elif isinstance(value, Decimal):
+                value = float(value)
             result[column.name] = value
 
         if include_relationships:
@@ -81,6 +81,50 @@ DATABASE_SCHEMA = {
                 "time": "Race completion time"
             },
             "required_fields": ["result_id", "race_id", "horse_id", "position"]
+        },
+        "TrainerStatistics": {
+            "description": "Precomputed trainer record per period. Use it for trainer leaderboards and strike rates instead of aggregating Result rows",
+            "fields": {
+                "trainer_id": "Foreign key - Reference to the trainer",
+                "period_type": "One of career, 14_days, season, course, course_season",
+                "period_value": "all (career), current (14_days), the year e.g. 2026 (season), course_id (course), course_id:year (course_season)",
+                "runs": "Number of runners",
+                "wins": "Number of winners",
+                "places": "Number of placed runners (each-way terms)",
+                "win_percentage": "Strike rate, wins as a percentage of runs",
+                "ae": "Actual over expected wins at starting price; above 1 beats the market",
+                "pl": "Profit or loss to a one-unit win bet on every runner at starting price"
+            },
+            "required_fields": ["trainer_id", "period_type", "period_value", "runs", "wins", "win_percentage"]
+        },
+        "JockeyStatistics": {
+            "description": "Precomputed jockey record per period. Use it for jockey leaderboards and strike rates instead of aggregating Result rows",
+            "fields": {
+                "jockey_id": "Foreign key - Reference to the jockey",
+                "period_type": "One of career, 14_days, season, course, course_season",
+                "period_value": "all (career), current (14_days), the year e.g. 2026 (season), course_id (course), course_id:year (course_season)",
+                "rides": "Number of rides",
+                "wins": "Number of winners",
+                "places": "Number of placed rides (each-way terms)",
+                "win_percentage": "Strike rate, wins as a percentage of rides",
+                "ae": "Actual over expected wins at starting price; above 1 beats the market",
+                "pl": "Profit or loss to a one-unit win bet on every ride at starting price"
+            },
+            "required_fields": ["jockey_id", "period_type", "period_value", "rides", "wins", "win_percentage"]
+        },
+        "HorseStatistics": {
+            "description": "Precomputed horse record overall and split by course, going, distance and class",
+            "fields": {
+                "horse_id": "Foreign key - Reference to the horse",
+                "stat_type": "One of career, course, going, distance, class",
+                "stat_value": "all (career), course_id, going, distance in furlongs or race class",
+                "runs": "Number of runs",
+                "wins": "Number of wins",
+                "places": "Number of placed runs (each-way terms)",
+                "win_percentage": "Strike rate, wins as a percentage of runs",
+                "best_position": "Best finishing position"
+            },
+            "required_fields": ["horse_id", "stat_type", "stat_value", "runs", "wins", "win_percentage"]
         }
     },
     "relationships": {
@@ -127,6 +171,26 @@ DATABASE_SCHEMA = {
                 },
                 "content": ["Course"]
             }
+        },
+        "jockey_leaderboard": {
+            "description": "Rank jockeys (or trainers, with TrainerStatistics) over a period",
+            "required_tables": ["JockeyStatistics", "Jockey"],
+            "join_path": "JockeyStatistics -> Jockey",
+            "example": {
+                "query": "Top jockeys at Cheltenham this year",
+                "filters": {
+                    "JockeyStatistics": {
+                        "period_type": "course_season",
+                        "period_value": "<Cheltenham course_id>:2026",
+                        "fields": ["jockey_id", "rides", "wins", "places", "win_percentage", "ae", "pl"],
+                        "sort": ["wins", "desc"],
+                        "limit": 10
+                    },
+                    "Jockey": {
+                        "fields": ["jockey_id", "jockey"]
+                    }
+                }
+            }
         }
     }
 }
@@ -0,0 +1,339 @@
+import os
+from datetime import date, timedelta
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+
+from src.db.models import Runner
+from src.db.statistics import FIELD_SIZE_SQL, RUN_FACTS_SQL
+
+# Results loaded for one analysis, most recent first
+FORM_ANALYSIS_MAX_ROWS = int(os.getenv("FORM_ANALYSIS_MAX_ROWS", "50000"))
+# Entities of each kind analysed for one question, in order of mention
+FORM_ANALYSIS_MAX_ENTITIES = int(os.getenv("FORM_ANALYSIS_MAX_ENTITIES", "40"))
+# Runs used for a horse's recent form and rating trend
+RECENT_RUNS = 6
+ROLLING_DAYS = 14
+
+# Horse splits, as split name -> results column
+SPLITS = {
+    "course": "course",
+    "going": "going",
+    "distance": "distance_band",
+    "class": "race_class",
+}
+
+# Distance bands in furlongs, for the distance split
+DISTANCE_BANDS = [0, 6, 8, 10, 13, 17, 21, np.inf]
+DISTANCE_LABELS = ["up to 6f", "6.5-8f", "8.5-10f", "10.5-13f", "13.5-17f", "17.5-21f", "21f+"]
+
+ID_KEYS = ("horse_id", "trainer_id", "jockey_id", "race_id")
+
+# Keys whose values are figures even when the API or the text columns carry
+# them as strings ("5/2", "1", "112"); names ending in _num are figures too
+FIGURE_KEYS = frozenset({
+    "sp", "sp_dec", "odds", "fractional", "decimal", "position", "btn", "ovr_btn",
+    "or", "or_rating", "ofr", "rpr", "ts", "tsr", "prize",
+    "runs", "rides", "wins", "places", "win_percentage", "strike_rate", "place_rate", "ae", "pl", "roi",
+})
+
+FORM_COLUMNS = [
+    "race_id", "date", "course_id", "course", "going", "distance_f", "race_class",
+    "horse_id", "horse", "trainer_id", "trainer", "jockey_id", "jockey",
+    "position", "sp", "or_rating", "rpr", "tsr",
+    "won", "placed", "priced", "expected", "profit",
+]
+
+# Runs with their race and names. Wins, places and the A/E and P/L terms
+# come from the same SQL the statistics tables are built with, so the
+# figures quoted here and there agree.
+FORM_SQL = """
+SELECT
+    ra.race_id,
+    ra.date,
+    ra.course_id,
+    c.course,
+    ra.going,
+    ra.distance_f,
+    ra.race_class,
+    r.horse_id,
+    h.horse,
+    r.trainer_id,
+    t.trainer,
+    r.jockey_id,
+    j.jockey,
+    r.position_num AS position,
+    r.sp_dec_num AS sp,
+    r.or_rating_num AS or_rating,
+    r.rpr_num AS rpr,
+    r.tsr_num AS tsr,""" + RUN_FACTS_SQL + """
+FROM results r
+JOIN races ra ON ra.race_id = r.race_id
+JOIN courses c ON c.course_id = ra.course_id
+JOIN horses h ON h.horse_id = r.horse_id
+LEFT JOIN trainers t ON t.trainer_id = r.trainer_id
+LEFT JOIN jockeys j ON j.jockey_id = r.jockey_id""" + FIELD_SIZE_SQL + """
+WHERE ({conditions}) {since_filter}
+ORDER BY ra.date DESC
+LIMIT :max_rows
+"""
+
+
+def load_form(db: Session, horse_ids: Iterable[str] = (), trainer_ids: Iterable[str] = (),
+              jockey_ids: Iterable[str] = (), since: Optional[date] = None,
+              max_rows: int = FORM_ANALYSIS_MAX_ROWS) -> pd.DataFrame:
+    """
+    Results of the given horses, trainers and jockeys as one DataFrame, with
+    the race and names of each run. An entity list left empty adds nothing.
+    """
+    params: Dict[str, Any] = {"max_rows": max_rows}
+    conditions = []
+    for column, ids in (("horse_id", horse_ids), ("trainer_id", trainer_ids), ("jockey_id", jockey_ids)):
+        if ids:
+            conditions.append(f"r.{column} = ANY(:{column}s)")
+            params[f"{column}s"] = list(ids)
+    if not conditions:
+        return prepare(pd.DataFrame(columns=FORM_COLUMNS))
+
+    since_filter = ""
+    if since is not None:
+        since_filter = "AND ra.date >= :since"
+        params["since"] = since
+    statement = FORM_SQL.format(conditions=" OR ".join(conditions), since_filter=since_filter)
+    rows = db.execute(text(statement), params).all()
+    return prepare(pd.DataFrame(rows, columns=FORM_COLUMNS))
+
+
+def prepare(form: pd.DataFrame) -> pd.DataFrame:
+    """Type the loaded runs and add the grouping columns the statistics need."""
+    form = form.copy()
+    for column in ("position", "sp", "or_rating", "rpr", "tsr", "expected", "profit"):
+        form[column] = pd.to_numeric(form[column], errors="coerce")
+    for column in ("won", "placed", "priced"):
+        form[column] = form[column].eq(True)
+    form["date"] = pd.to_datetime(form["date"])
+    form["priced_win"] = form["priced"] & form["won"]
+
+    furlongs = pd.to_numeric(form["distance_f"].astype(str).str.rstrip("f"), errors="coerce")
+    form["distance_band"] = pd.cut(furlongs, DISTANCE_BANDS, labels=DISTANCE_LABELS).astype(str)
+    return form
+
+
+def summarise(form: pd.DataFrame, by: List[str]) -> pd.DataFrame:
+    """Runs, wins, places, strike rates, A/E and one-unit SP returns per group."""
+    grouped = form.groupby(by, observed=True, dropna=False)
+    summary = grouped.agg(
+        runs=("race_id", "size"),
+        wins=("won", "sum"),
+        places=("placed", "sum"),
+        priced_runs=("priced", "sum"),
+        priced_wins=("priced_win", "sum"),
+        expected=("expected", "sum"),
+        pl=("profit", "sum"),
+    )
+    summary["strike_rate"] = 100 * summary["wins"] / summary["runs"]
+    summary["place_rate"] = 100 * summary["places"] / summary["runs"]
+    summary["ae"] = summary["priced_wins"] / summary["expected"].where(summary["expected"] > 0)
+    summary["roi"] = 100 * summary["pl"] / summary["priced_runs"].where(summary["priced_runs"] > 0)
+    return summary.drop(columns=["priced_wins", "expected"]).round(2)
+
+
+def rating_trends(form: pd.DataFrame, ratings=("rpr", "or_rating", "tsr"),
+                  last_runs: int = RECENT_RUNS) -> pd.DataFrame:
+    """
+    Per horse and rating: last, best and recent average, and the least
+    squares slope over the horse's last runs (points per run, positive
+    when improving).
+    """
+    recent = form.sort_values("date").groupby("horse_id").tail(last_runs).copy()
+    recent["run"] = recent.groupby("horse_id").cumcount().astype(float)
+    frames = []
+    for rating in ratings:
+        rated = recent.dropna(subset=[rating])
+        if rated.empty:
+            continue
+        x = rated["run"]
+        y = rated[rating].astype(float)
+        moments = pd.DataFrame({
+            "horse_id": rated["horse_id"], "x": x, "y": y, "xy": x * y, "xx": x * x,
+        }).groupby("horse_id").mean()
+        variance = moments["xx"] - moments["x"] ** 2
+        trend = pd.DataFrame({
+            "rating": rating,
+            "last": rated.groupby("horse_id")[rating].last(),
+            "best": form.groupby("horse_id")[rating].max(),
+            "recent_average": moments["y"],
+            "trend_per_run": (moments["xy"] - moments["x"] * moments["y"]) / variance.where(variance > 0),
+        })
+        frames.append(trend.dropna(subset=["last"]))
+    if not frames:
+        return pd.DataFrame(columns=["rating", "last", "best", "recent_average", "trend_per_run"])
+    return pd.concat(frames).round(2)
+
+
+def _records(frame: pd.DataFrame) -> List[Dict[str, Any]]:
+    # NaN and numpy scalars become JSON-friendly None and Python numbers
+    frame = frame.astype(object).where(frame.notna(), None)
+    return [
+        {key: value.item() if isinstance(value, np.generic) else value for key, value in row.items()}
+        for row in frame.to_dict("records")
+    ]
+
+
+def _summary(summary: pd.DataFrame, key) -> Optional[Dict[str, Any]]:
+    if key not in summary.index:
+        return None
+    return _records(summary.loc[[key]])[0]
+
+
+def _distinct(ids: Iterable[str]) -> List[str]:
+    # Distinct ids in the order given
+    return list(dict.fromkeys(entity_id for entity_id in ids if entity_id))
+
+
+def analyse_form(db: Session, horse_ids: Iterable[str] = (), trainer_ids: Iterable[str] = (),
+                 jockey_ids: Iterable[str] = (), today: Optional[date] = None) -> Dict[str, Any]:
+    """
+    Precomputed form figures for horses, trainers and jockeys.
+
+    Horses get a career summary, course/going/distance/class splits,
+    rating trends and their last runs; trainers and jockeys get career and
+    last-14-day summaries and their record at each course. Every number is
+    computed here, so a model only has to narrate them.
+
+    Ids are taken in the order given, most relevant first, and only the
+    first FORM_ANALYSIS_MAX_ENTITIES of each kind are analysed; any kind
+    cut short is listed under "truncated" with how many were left out.
+    """
+    today = today or date.today()
+    requested = {"horses": _distinct(horse_ids), "trainers": _distinct(trainer_ids), "jockeys": _distinct(jockey_ids)}
+    horse_ids = requested["horses"][:FORM_ANALYSIS_MAX_ENTITIES]
+    trainer_ids = requested["trainers"][:FORM_ANALYSIS_MAX_ENTITIES]
+    jockey_ids = requested["jockeys"][:FORM_ANALYSIS_MAX_ENTITIES]
+    form = load_form(db, horse_ids, trainer_ids, jockey_ids)
+
+    analysis: Dict[str, Any] = {"horses": {}, "trainers": {}, "jockeys": {}}
+    truncated = {
+        kind: {"analysed": FORM_ANALYSIS_MAX_ENTITIES, "left_out": len(ids) - FORM_ANALYSIS_MAX_ENTITIES}
+        for kind, ids in requested.items() if len(ids) > FORM_ANALYSIS_MAX_ENTITIES
+    }
+    if truncated:
+        analysis["truncated"] = truncated
+    if form.empty:
+        return analysis
+
+    horses = form[form["horse_id"].isin(horse_ids)]
+    if not horses.empty:
+        career = summarise(horses, ["horse_id"])
+        splits = {name: summarise(horses, ["horse_id", column]) for name, column in SPLITS.items()}
+        trends = rating_trends(horses)
+        names = horses.groupby("horse_id")["horse"].first()
+        last_runs = horses.sort_values("date", ascending=False).groupby("horse_id").head(RECENT_RUNS)
+        for horse_id in [horse_id for horse_id in horse_ids if horse_id in career.index]:
+            analysis["horses"][horse_id] = {
+                "horse": names[horse_id],
+                "career": _summary(career, horse_id),
+                "splits": {
+                    name: _records(split.loc[horse_id].reset_index())
+                    for name, split in splits.items() if horse_id in split.index
+                },
+                "ratings": _records(trends.loc[trends.index == horse_id]),
+                "last_runs": _records(
+                    last_runs.loc[last_runs["horse_id"] == horse_id,
+                                  ["date", "course", "going", "distance_f", "race_class", "position", "sp", "rpr"]]
+                    .assign(date=lambda runs: runs["date"].dt.strftime("%Y-%m-%d"))
+                ),
+            }
+
+    recent_start = pd.Timestamp(today - timedelta(days=ROLLING_DAYS))
+    for kind, column, ids in (("trainers", "trainer_id", trainer_ids), ("jockeys", "jockey_id", jockey_ids)):
+        runs = form[form[column].isin(ids)]
+        if runs.empty:
+            continue
+        name_column = kind[:-1]
+        career = summarise(runs, [column])
+        recent = summarise(runs[runs["date"] > recent_start], [column])
+        courses = summarise(runs, [column, "course"])
+        names = runs.groupby(column)[name_column].first()
+        for entity_id in [entity_id for entity_id in ids if entity_id in career.index]:
+            analysis[kind][entity_id] = {
+                name_column: names[entity_id],
+                "career": _summary(career, entity_id),
+                "last_14_days": _summary(recent, entity_id),
+                "courses": _records(
+                    courses.loc[entity_id].sort_values("runs", ascending=False).reset_index()
+                ),
+            }
+    return analysis
+
+
+def entities_in(data: Any, found: Optional[Dict[str, Dict[str, None]]] = None) -> Dict[str, Dict[str, None]]:
+    """
+    Horse, trainer, jockey and race ids mentioned anywhere in nested API or
+    query data, each kind as an ordered dict of ids in order of first mention.
+    """
+    found = found if found is not None else {key: {} for key in ID_KEYS}
+    if isinstance(data, dict):
+        for key, value in data.items():
+            if key in found and isinstance(value, str) and value:
+                found[key].setdefault(value)
+            else:
+                entities_in(value, found)
+    elif isinstance(data, list):
+        for item in data:
+            entities_in(item, found)
+    return found
+
+
+def analyse_entities(db: Session, data: Any) -> Dict[str, Any]:
+    """
+    Precomputed form for everyone in data: the horses, trainers and jockeys
+    it names, then the declared runners of any races it names, race by race
+    in order of mention.
+    """
+    found = entities_in(data)
+    if found["race_id"]:
+        race_order = {race_id: position for position, race_id in enumerate(found["race_id"])}
+        rows = db.execute(
+            select(Runner.race_id, Runner.horse_id, Runner.trainer_id, Runner.jockey_id)
+            .where(Runner.race_id.in_(list(race_order)))
+            .order_by(Runner.runner_id)
+        ).all()
+        for _, horse_id, trainer_id, jockey_id in sorted(rows, key=lambda row: race_order[row[0]]):
+            found["horse_id"].setdefault(horse_id)
+            if trainer_id:
+                found["trainer_id"].setdefault(trainer_id)
+            if jockey_id:
+                found["jockey_id"].setdefault(jockey_id)
+    return analyse_form(db, found["horse_id"], found["trainer_id"], found["jockey_id"])
+
+
+def _is_figure_key(key: Any) -> bool:
+    return isinstance(key, str) and (key.lower() in FIGURE_KEYS or key.endswith("_num"))
+
+
+def without_figures(data: Any) -> Any:
+    """
+    Nested data with its numbers taken out, keeping names, dates, courses,
+    going and other text. Under figure keys, strings with digits in them go
+    too, while ones like a "PU" position stay. Sent alongside
+    analyse_entities() so the figures a model quotes all come from the
+    precomputed analysis.
+    """
+    if isinstance(data, dict):
+        kept = {
+            key: None if _is_figure_key(key) and isinstance(value, str) and any(char.isdigit() for char in value)
+            else without_figures(value)
+            for key, value in data.items()
+        }
+        return {key: value for key, value in kept.items() if value is not None}
+    if isinstance(data, list):
+        kept = [without_figures(item) for item in data]
+        return [item for item in kept if item is not None]
+    if isinstance(data, (int, float, Decimal, np.number)) and not isinstance(data, bool):
+        return None
+    return data
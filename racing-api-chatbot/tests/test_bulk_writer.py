@@ -0,0 +1,100 @@
+from datetime import datetime
+
+from sqlalchemy.dialects import postgresql
+
+from src.db.bulk_writer import UNKNOWN_OWNER, BulkWriter, stage_result, stage_result_row
+from src.db.models import Course, OddsHistory, Owner, Result
+
+
+class RecordingSession:
+    """Stands in for a Session, keeping the statements a flush executes."""
+
+    def __init__(self):
+        self.executed = []
+
+    def execute(self, statement, params=None):
+        self.executed.append((statement, params))
+
+    def get_bind(self):
+        raise AssertionError("COPY is not expected below the threshold")
+
+
+def sql(statement) -> str:
+    return str(statement.compile(dialect=postgresql.dialect()))
+
+
+def test_rows_with_the_same_key_are_merged():
+    writer = BulkWriter(RecordingSession())
+    writer.add(Course, {"course_id": "crs_1", "course": "Ascot"})
+    writer.add(Course, {"course_id": "crs_1", "region": "Great Britain"})
+
+    assert writer.pending == 1
+    assert writer.staged[Course][("crs_1",)] == {"course_id": "crs_1", "course": "Ascot", "region": "Great Britain"}
+
+
+def test_flush_writes_parents_before_children():
+    db = RecordingSession()
+    writer = BulkWriter(db)
+    stage_result(writer, {
+        "race_id": "rac_1", "course_id": "crs_1", "course": "Ascot", "region": "GB",
+        "runners": [{"horse_id": "hrs_1", "horse": "Frankel", "trainer_id": "trn_1", "trainer": "H Cecil",
+                     "owner_id": "own_1", "owner": "K Abdullah", "position": "1"}],
+    })
+
+    counts = writer.flush()
+
+    tables = [statement.table.name for statement, _ in db.executed]
+    assert tables.index("courses") < tables.index("races") < tables.index("results")
+    assert tables.index("horses") < tables.index("results")
+    assert tables.index("owners") < tables.index("results")
+    assert counts["results"] == 1
+    assert writer.pending == 0
+
+
+def test_flush_orders_rows_by_key():
+    db = RecordingSession()
+    writer = BulkWriter(db)
+    for course_id in ("crs_3", "crs_1", "crs_2"):
+        writer.add(Course, {"course_id": course_id, "course": course_id})
+
+    writer.flush()
+
+    (_, params), = db.executed
+    assert [row["course_id"] for row in params] == ["crs_1", "crs_2", "crs_3"]
+
+
+def test_upserts_update_provided_columns():
+    db = RecordingSession()
+    writer = BulkWriter(db)
+    writer.add(Course, {"course_id": "crs_1", "course": "Ascot"})
+
+    writer.flush()
+
+    statement = sql(db.executed[0][0])
+    assert "ON CONFLICT (course_id) DO UPDATE SET course = excluded.course" in statement
+    assert "updated_at" in statement
+
+
+def test_append_only_tables_never_update():
+    db = RecordingSession()
+    writer = BulkWriter(db)
+    writer.add(OddsHistory, {
+        "race_id": "rac_1", "horse_id": "hrs_1", "bookmaker": "Bet365",
+        "observed_at": datetime(2024, 5, 1, 12, 0), "decimal": 3.5,
+    })
+
+    writer.flush()
+
+    statement = sql(db.executed[0][0])
+    assert "DO NOTHING" in statement
+    assert "DO UPDATE" not in statement
+
+
+def test_results_without_an_owner_stage_the_placeholder():
+    writer = BulkWriter(RecordingSession())
+    stage_result_row(writer, "rac_1", {"horse_id": "hrs_1", "trainer_id": "trn_1"})
+    stage_result_row(writer, "rac_1", {"horse_id": "hrs_2", "trainer_id": "trn_1", "owner_id": "own_1"})
+
+    assert writer.staged[Owner] == {(UNKNOWN_OWNER["owner_id"],): UNKNOWN_OWNER}
+    owners = {row["horse_id"]: row["owner_id"] for row in writer.staged[Result].values()}
+    assert owners == {"hrs_1": UNKNOWN_OWNER["owner_id"], "hrs_2": "own_1"}
@@ -0,0 +1,58 @@
+from datetime import date, timedelta
+
+import pytest
+
+from src.graph.root_agent.fast_path import EntityIndex, match_fast_path
+
+
+@pytest.fixture
+def index():
+    index = EntityIndex()
+    index.names = {
+        "course": {"ascot": ["crs_1"], "newcastle": ["crs_2", "crs_3"]},
+        "horse": {"frankel": ["hrs_1"]},
+        "jockey": {"ryan moore": ["jky_1"]},
+        "trainer": {},
+    }
+    return index
+
+
+def test_results_at_a_course_today(index):
+    payload = match_fast_path("Results at Ascot today", index)
+
+    today = date.today().isoformat()
+    assert payload["filters"]["Result"]["course_id"] == "crs_1"
+    assert payload["filters"]["Result"]["date"] == {"range": [today, today]}
+
+
+def test_yesterday_and_tomorrow_resolve_to_a_date(index):
+    yesterday = (date.today() - timedelta(days=1)).isoformat()
+    tomorrow = (date.today() + timedelta(days=1)).isoformat()
+
+    assert match_fast_path("who won at Ascot yesterday", index)["filters"]["Result"]["date"]["range"][0] == yesterday
+    assert match_fast_path("Ryan Moore rides tomorrow", index)["filters"]["Runner"]["date"]["range"][0] == tomorrow
+
+
+@pytest.mark.parametrize("query", [
+    "Results at Ascot last week",
+    "Results at Ascot on Saturday",
+    "Results at Ascot in June",
+    "Results at Ascot in 2023",
+    "Results at Ascot on 3rd May",
+    "Results at Ascot on 12/05",
+    "Results at Ascot on 2024-05-12",
+    "Results at Ascot 3 days ago",
+])
+def test_other_dates_go_to_the_llm(index, query):
+    assert match_fast_path(query, index) is None
+
+
+def test_off_times_use_the_twelve_hour_clock(index):
+    payload = match_fast_path("Runners in the 15:30 at Ascot", index)
+
+    assert payload["filters"]["Runner"]["off_time"] == {"contains": "3:30"}
+
+
+def test_ambiguous_or_unknown_names_go_to_the_llm(index):
+    assert match_fast_path("Results at Newcastle today", index) is None
+    assert match_fast_path("Results at Kempton today", index) is None
@@ -0,0 +1,101 @@
+from decimal import Decimal
+
+import pandas as pd
+import pytest
+
+from src.utils.form_analysis import FORM_COLUMNS, entities_in, prepare, summarise, without_figures
+
+
+def run(race_id, date, horse_id, position, sp, won, placed, trainer_id="trn_1", course="Ascot",
+        going="Good", distance_f="8f", rpr=None):
+    # One loaded run, with the facts RUN_FACTS_SQL computes in the database
+    priced = sp is not None
+    return {
+        "race_id": race_id, "date": date, "course_id": "crs_1", "course": course, "going": going,
+        "distance_f": distance_f, "race_class": "Class 2",
+        "horse_id": horse_id, "horse": horse_id.title(), "trainer_id": trainer_id, "trainer": "A Trainer",
+        "jockey_id": "jky_1", "jockey": "A Jockey",
+        "position": position, "sp": sp, "or_rating": None, "rpr": rpr, "tsr": None,
+        "won": won, "placed": placed, "priced": priced,
+        "expected": Decimal(str(1 / sp)) if priced else Decimal(0),
+        "profit": Decimal(str(sp - 1 if won else -1)) if priced else Decimal(0),
+    }
+
+
+@pytest.fixture
+def form():
+    return prepare(pd.DataFrame([
+        run("rac_1", "2024-05-01", "hrs_1", 1, 4.0, True, True, rpr=100),
+        run("rac_2", "2024-05-08", "hrs_1", 3, 5.0, False, True, going="Soft", rpr=104),
+        run("rac_3", "2024-05-15", "hrs_1", None, None, None, None, distance_f="12f", rpr=None),
+        run("rac_3", "2024-05-15", "hrs_2", 2, 2.0, False, False, trainer_id="trn_2", rpr=90),
+    ], columns=FORM_COLUMNS))
+
+
+def test_prepare_types_the_loaded_runs(form):
+    assert form["won"].tolist() == [True, False, False, False]
+    assert form["placed"].tolist() == [True, True, False, False]
+    assert form["priced_win"].tolist() == [True, False, False, False]
+    assert form["expected"].dtype == float
+    assert form["distance_band"].tolist() == ["6.5-8f", "6.5-8f", "10.5-13f", "6.5-8f"]
+
+
+def test_prepare_keeps_the_columns_of_an_empty_frame():
+    form = prepare(pd.DataFrame(columns=FORM_COLUMNS))
+
+    assert form.empty
+    assert {"won", "placed", "priced_win", "distance_band"} <= set(form.columns)
+
+
+def test_summarise_per_horse(form):
+    summary = summarise(form, ["horse_id"]).loc["hrs_1"]
+
+    assert summary["runs"] == 3
+    assert summary["wins"] == 1
+    assert summary["places"] == 2
+    assert summary["priced_runs"] == 2
+    assert summary["strike_rate"] == pytest.approx(33.33)
+    assert summary["place_rate"] == pytest.approx(66.67)
+    # One priced win against 1/4 + 1/5 expected
+    assert summary["ae"] == pytest.approx(2.22)
+    # +3 on the winner, -1 on the loser, over two priced runs
+    assert summary["pl"] == pytest.approx(2.0)
+    assert summary["roi"] == pytest.approx(100.0)
+
+
+def test_summarise_without_priced_runs_leaves_ae_and_roi_empty(form):
+    unpriced = form[form["race_id"] == "rac_3"].assign(priced=False, priced_win=False, expected=0.0, profit=0.0)
+
+    summary = summarise(unpriced, ["horse_id"])
+
+    assert summary["ae"].isna().all()
+    assert summary["roi"].isna().all()
+
+
+def test_entities_in_keeps_mention_order():
+    found = entities_in({
+        "step_1": {"Runner": [{"horse_id": "hrs_2", "trainer_id": "trn_1"}, {"horse_id": "hrs_1"}]},
+        "step_2": {"Result": [{"horse_id": "hrs_2", "race_id": "rac_1"}]},
+    })
+
+    assert list(found["horse_id"]) == ["hrs_2", "hrs_1"]
+    assert list(found["trainer_id"]) == ["trn_1"]
+    assert list(found["race_id"]) == ["rac_1"]
+
+
+def test_without_figures_keeps_descriptive_values():
+    data = {
+        "Result": [{
+            "horse": "Frankel", "date": "2024-05-01", "off_time": "3:30", "going": "Good",
+            "position": "1", "sp": "5/2F", "or": "140", "rpr": 142, "sp_dec_num": 3.5,
+        }, {
+            "horse": "Enable", "position": "PU", "btn": "",
+        }],
+    }
+
+    assert without_figures(data) == {
+        "Result": [
+            {"horse": "Frankel", "date": "2024-05-01", "off_time": "3:30", "going": "Good"},
+            {"horse": "Enable", "position": "PU", "btn": ""},
+        ],
+    }
@@ -0,0 +1,98 @@
+import asyncio
+import time
+from datetime import date, timedelta
+
+import pytest
+
+from src.graph.root_agent.fast_path import entity_index
+from src.graph.simple_query_agent.plan_cache import PlanCache, template_query
+
+
+@pytest.fixture(autouse=True)
+def names(monkeypatch):
+    # A loaded index, so ensure_loaded() doesn't go to the database
+    monkeypatch.setattr(entity_index, "names", {
+        "course": {"ascot": ["crs_1"], "york": ["crs_2"]},
+        "horse": {"frankel": ["hrs_1"], "enable": ["hrs_2"]},
+        "jockey": {},
+        "trainer": {},
+    })
+    monkeypatch.setattr(entity_index, "display_names", {
+        "course": {"crs_1": "Ascot", "crs_2": "York"},
+        "horse": {"hrs_1": "Frankel", "hrs_2": "Enable"},
+    })
+    monkeypatch.setattr(entity_index, "loaded_at", time.monotonic())
+
+
+def results_payload(horse_id: str, day: str) -> dict:
+    return {
+        "filters": {"Result": {"horse_id": horse_id, "date": {"range": [day, day]}, "limit": 10}},
+        "content": [],
+    }
+
+
+def test_template_query_slots_entities_and_dates():
+    template, slots = template_query("Results for Frankel at Ascot on 01/05/2024")
+
+    assert template == "results for {horse_0} at {course_0} on {date_0}"
+    assert slots == {
+        "date_0": {"value": "2024-05-01"},
+        "horse_0": {"id": "hrs_1", "name": "Frankel"},
+        "course_0": {"id": "crs_1", "name": "Ascot"},
+    }
+
+
+def test_plan_is_replayed_for_another_entity():
+    cache = PlanCache()
+    yesterday = (date.today() - timedelta(days=1)).isoformat()
+
+    assert asyncio.run(cache.store("Results for Frankel yesterday", results_payload("hrs_1", yesterday)))
+    payload = asyncio.run(cache.lookup("Results for Enable yesterday"))
+
+    assert payload == results_payload("hrs_2", yesterday)
+    assert cache.stats()["hits"] == 1
+
+
+def test_relative_dates_are_stored_as_offsets_from_today():
+    cache = PlanCache()
+    yesterday = (date.today() - timedelta(days=1)).isoformat()
+    asyncio.run(cache.store("Results for Frankel yesterday", results_payload("hrs_1", yesterday)))
+
+    (plan,) = cache.plans.values()
+    assert plan["filters"]["Result"]["date"] == {"range": ["{{today-1}}", "{{today-1}}"]}
+
+    _, slots = template_query("Results for Frankel yesterday")
+    replayed = cache._fill(plan, slots, date(2024, 3, 1))
+    assert replayed["filters"]["Result"]["date"] == {"range": ["2024-02-29", "2024-02-29"]}
+
+
+def test_dates_written_in_the_question_fill_their_slot():
+    cache = PlanCache()
+    assert asyncio.run(cache.store("Results for Frankel on 2024-05-01", results_payload("hrs_1", "2024-05-01")))
+
+    payload = asyncio.run(cache.lookup("Results for Enable on 02/06/2023"))
+
+    assert payload == results_payload("hrs_2", "2023-06-02")
+
+
+def test_absolute_dates_are_not_cached():
+    cache = PlanCache()
+
+    stored = asyncio.run(cache.store("Winners at Ascot in June", {
+        "filters": {"Result": {"course_id": "crs_1", "date": {"range": ["2025-06-01", "2025-06-30"]}}},
+    }))
+
+    assert not stored
+    assert cache.stats()["rejected"] == 1
+    assert not cache.plans
+
+
+def test_plans_that_dont_use_every_slot_are_not_cached():
+    cache = PlanCache()
+
+    stored = asyncio.run(cache.store("Results for Frankel at Ascot", {
+        "filters": {"Result": {"horse_id": "hrs_1"}},
+    }))
+
+    assert not stored
+    assert not cache.plans
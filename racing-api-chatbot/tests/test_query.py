@@ -1,3 +1,5 @@
+import asyncio
+
 from src.graph.simple_query_agent.nodes import simple_query_handler_node
 from src.graph.simple_query_agent.models import AgentState
 
@@ -18,7 +20,7 @@ def test_query(query: str):
     
     try:
         # Process the query through the query handler
-        result = simple_query_handler_node(state, None, {})
+        result = asyncio.run(simple_query_handler_node(state, None, {}))
         print("\nQuery Result:")
         print(result)
     except Exception as e:
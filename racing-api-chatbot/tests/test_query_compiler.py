@@ -0,0 +1,113 @@
+from sqlalchemy import create_engine
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import Session
+
+from src.db.models import Course
+from src.graph.simple_query_agent import query_compiler
+from src.graph.simple_query_agent.query_compiler import compile_payload, read_context_table
+
+CONTEXT = {"tables": {}, "relationships": {}}
+
+
+def sql(compiled_query) -> str:
+    return str(compiled_query.statement.compile(
+        dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}
+    ))
+
+
+def test_related_tables_share_one_statement_rooted_at_the_most_granular():
+    compiled = compile_payload({
+        "filters": {
+            "Race": {"course_id": "crs_1"},
+            "Result": {"horse_id": "hrs_1", "fields": ["horse_id", "position"]},
+        }
+    }, CONTEXT)
+
+    assert len(compiled) == 1
+    assert set(compiled[0].outputs) == {"Result", "Race"}
+    statement = sql(compiled[0])
+    assert "FROM results JOIN races ON results.race_id = races.race_id" in statement
+    assert "races.course_id = 'crs_1'" in statement
+    assert "results.horse_id = 'hrs_1'" in statement
+
+
+def test_tables_without_a_join_path_get_a_statement_each():
+    compiled = compile_payload({
+        "filters": {"Horse": {"horse": "Frankel"}, "Course": {"course": "Ascot"}, "Unknown": {}}
+    }, CONTEXT)
+
+    assert [set(query.outputs) for query in compiled] == [{"Course"}, {"Horse"}]
+
+
+def test_root_limit_and_sort_apply_to_the_statement():
+    compiled = compile_payload({
+        "filters": {"Result": {"sort": ["position", "asc"], "limit": 5}}
+    }, CONTEXT)
+
+    statement = sql(compiled[0])
+    assert "ORDER BY results.position_num ASC NULLS LAST" in statement
+    assert "LIMIT 5" in statement
+
+
+def test_numeric_filters_use_the_numeric_twin():
+    compiled = compile_payload({
+        "filters": {"Result": {"position": "1", "sp_dec": {"range": [2, 5.5]}}}
+    }, CONTEXT)
+
+    statement = sql(compiled[0])
+    assert "results.position_num = 1" in statement
+    assert "results.sp_dec_num >= 2.0" in statement
+    assert "results.sp_dec_num <= 5.5" in statement
+    assert "results.position =" not in statement
+
+
+def test_integer_twin_ranges_round_inwards():
+    compiled = compile_payload({"filters": {"Result": {"position": {"range": [1.5, 3.5]}}}}, CONTEXT)
+
+    statement = sql(compiled[0])
+    assert "results.position_num >= 2" in statement
+    assert "results.position_num <= 3" in statement
+
+
+def test_non_numeric_values_compare_the_string_column():
+    compiled = compile_payload({"filters": {"Result": {"position": "PU"}}}, CONTEXT)
+
+    statement = sql(compiled[0])
+    assert "results.position = 'PU'" in statement
+    assert "position_num" not in statement.split("WHERE")[1]
+
+
+def _courses_session(count: int) -> Session:
+    engine = create_engine("sqlite://")
+    Course.__table__.create(engine)
+    db = Session(engine)
+    db.add_all([
+        Course(course_id=f"crs_{i}", course=f"Course {i}", region_code="gb", region="Great Britain")
+        for i in range(1, count + 1)
+    ])
+    db.commit()
+    return db
+
+
+def test_read_context_table_pages_by_primary_key():
+    db = _courses_session(5)
+
+    pages = []
+    after = None
+    while True:
+        records, after = read_context_table(db, "Course", ["course_id", "course"], limit=2, after=after)
+        pages.append([record["course_id"] for record in records])
+        if after is None:
+            break
+
+    assert pages == [["crs_1", "crs_2"], ["crs_3", "crs_4"], ["crs_5"]]
+
+
+def test_read_context_table_projects_and_caps_the_page(monkeypatch):
+    monkeypatch.setattr(query_compiler, "CONTEXT_TABLE_ROW_LIMIT", 3)
+    db = _courses_session(5)
+
+    records, next_key = read_context_table(db, "Course", ["course", "not_a_column"], limit=100)
+
+    assert records == [{"course": "Course 1"}, {"course": "Course 2"}, {"course": "Course 3"}]
+    assert next_key == "crs_3"
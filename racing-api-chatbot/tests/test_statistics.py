@@ -0,0 +1,105 @@
+import os
+
+import pytest
+from sqlalchemy import create_engine, text
+
+from src.db.statistics import FIELD_SIZE_SQL, RUN_FACTS_SQL, touched_entities
+
+# The place rule is Postgres SQL, so it is checked against a real server
+TEST_DATABASE_URL = os.getenv("TEST_DATABASE_URL")
+needs_postgres = pytest.mark.skipif(not TEST_DATABASE_URL, reason="set TEST_DATABASE_URL to a Postgres database")
+
+SINGLE_RUN_SQL = """
+SELECT""" + RUN_FACTS_SQL + """
+FROM (VALUES (CAST(:position AS integer), CAST(:sp AS double precision))) AS r(position_num, sp_dec_num),
+     (VALUES (CAST(:race_name AS text))) AS ra(race_name),
+     (VALUES (CAST(:runners AS integer))) AS fs(runners)
+"""
+
+
+@pytest.fixture
+def db():
+    engine = create_engine(TEST_DATABASE_URL)
+    with engine.connect() as connection:
+        transaction = connection.begin()
+        yield connection
+        transaction.rollback()
+    engine.dispose()
+
+
+def facts(db, position, runners, race_name="Maiden Stakes", sp=None):
+    return db.execute(text(SINGLE_RUN_SQL), {
+        "position": position, "sp": sp, "race_name": race_name, "runners": runners,
+    }).mappings().one()
+
+
+@needs_postgres
+@pytest.mark.parametrize("runners, race_name, position, placed", [
+    (4, "Maiden Stakes", 1, True),
+    (4, "Maiden Stakes", 2, False),
+    (7, "Maiden Stakes", 2, True),
+    (7, "Maiden Stakes", 3, False),
+    (8, "Maiden Stakes", 3, True),
+    (8, "Maiden Stakes", 4, False),
+    (16, "Maiden Stakes", 4, False),
+    (15, "Class 4 Handicap", 4, False),
+    (16, "Class 4 Handicap", 4, True),
+    (16, "Class 4 Handicap", 5, False),
+])
+def test_place_terms(db, runners, race_name, position, placed):
+    assert facts(db, position, runners, race_name)["placed"] is placed
+
+
+@needs_postgres
+def test_unplaced_finishes_are_false_not_null(db):
+    row = facts(db, None, 10)
+
+    assert row["won"] is False
+    assert row["placed"] is False
+    assert row["priced"] is False
+
+
+@needs_postgres
+def test_sp_terms(db):
+    winner = facts(db, 1, 10, sp=4.0)
+    loser = facts(db, 2, 10, sp=4.0)
+    unpriced = facts(db, 1, 10)
+
+    assert winner["won"] and winner["priced"]
+    assert float(winner["expected"]) == pytest.approx(0.25)
+    assert float(winner["profit"]) == pytest.approx(3.0)
+    assert float(loser["profit"]) == pytest.approx(-1.0)
+    assert float(unpriced["expected"]) == 0
+    assert float(unpriced["profit"]) == 0
+
+
+@needs_postgres
+def test_field_size_falls_back_to_every_result_of_the_race(db):
+    db.execute(text("CREATE TEMP TABLE races (race_id text, field_size text, race_name text) ON COMMIT DROP"))
+    db.execute(text("CREATE TEMP TABLE results (race_id text, horse_id text, position_num integer) ON COMMIT DROP"))
+    db.execute(text("INSERT INTO races VALUES ('rac_1', NULL, 'Stakes'), ('rac_2', '12', 'Stakes')"))
+    db.execute(text(
+        "INSERT INTO results VALUES "
+        "('rac_1', 'hrs_1', 1), ('rac_1', 'hrs_2', 2), ('rac_1', 'hrs_3', 3), ('rac_1', 'hrs_4', 4), "
+        "('rac_1', 'hrs_5', 5), ('rac_2', 'hrs_1', 3)"
+    ))
+
+    rows = db.execute(text("""
+        SELECT r.race_id, fs.runners
+        FROM results r
+        JOIN races ra ON ra.race_id = r.race_id""" + FIELD_SIZE_SQL + """
+        WHERE r.horse_id = 'hrs_1'
+        ORDER BY r.race_id
+    """)).all()
+
+    # Only hrs_1's runs are selected, but rac_1 is counted from all five results
+    assert [tuple(row) for row in rows] == [("rac_1", 5), ("rac_2", 12)]
+
+
+def test_touched_entities():
+    touched = touched_entities([
+        {"trainer_id": "trn_1", "jockey_id": "jky_1", "horse_id": "hrs_1"},
+        {"trainer_id": "trn_1", "jockey_id": None, "horse_id": "hrs_2"},
+    ])
+
+    assert touched == {"trainer": {"trn_1"}, "jockey": {"jky_1"}, "horse": {"hrs_1", "hrs_2"}}
@@ -0,0 +1,39 @@
+from src.db.write_behind import merge_jobs
+
+
+def done():
+    pass
+
+
+def test_list_endpoints_are_merged_into_one_write():
+    first = ("get_courses", {"courses": [{"id": "crs_1"}]}, None)
+    second = ("get_courses", {"courses": [{"id": "crs_2"}]}, done)
+
+    (write,) = merge_jobs([first, second])
+
+    endpoint, response, jobs = write
+    assert endpoint == "get_courses"
+    assert response == {"courses": [{"id": "crs_1"}, {"id": "crs_2"}]}
+    assert jobs == [first, second]
+
+
+def test_other_endpoints_keep_their_order():
+    odds = ("get_odds", {"race_id": "rac_1"}, None)
+    courses = ("get_courses", {"courses": [{"id": "crs_1"}]}, None)
+    horse = ("get_horse", {"id": "hrs_1"}, None)
+    more_courses = ("get_courses", {"courses": [{"id": "crs_2"}]}, None)
+
+    writes = merge_jobs([odds, courses, horse, more_courses])
+
+    assert [endpoint for endpoint, _, _ in writes] == ["get_odds", "get_courses", "get_horse"]
+    assert writes[0][2] == [odds]
+    assert writes[1][2] == [courses, more_courses]
+
+
+def test_queued_responses_are_not_modified():
+    first = ("get_today_results", {"results": [{"race_id": "rac_1"}]}, None)
+    second = ("get_today_results", {"results": [{"race_id": "rac_2"}]}, None)
+
+    merge_jobs([first, second])
+
+    assert first[1] == {"results": [{"race_id": "rac_1"}]}